@@ -0,0 +1,251 @@
+"""
+Recommend partial and clustered spatial indexes for an osm2pgsql database from
+its style file and a log of generated queries. Queries clipped to a region
+filter on ST_Transform(way, SRID), so spatial indexes are recommended on that
+expression unless the queries use the native geometry column.
+
+Queries are collected from any text file containing the SQL statements, e.g.
+the debug output of PostGISHelpers (set_debug_level('d')). Usage:
+
+    python IndexAdvisor.py OSM_PostGIS_import_RLI.style queries.log \
+        --source_db user@host:port/db
+"""
+import argparse
+import collections
+import re
+from simple_log import *
+
+logger = SimpleLogger(module_name="IndexAdvisor")
+
+# Flags of style file entries not resulting in a column
+NO_COLUMN_FLAGS = ('delete', 'phstore', 'nocolumn')
+
+_COL = r'(\w+|"[^"]+")'
+CONDITION_PATTERNS = (
+    ('notnull', re.compile(_COL + r'\s+is\s+not\s+null', re.IGNORECASE)),
+    ('eq', re.compile(_COL + r"\s*=\s*'([^']*)'", re.IGNORECASE)),
+    ('in', re.compile(_COL + r"\s+in\s*\(([^)]*)\)", re.IGNORECASE)))
+
+
+def parse_style(filepath):
+    """
+    Parse osm2pgsql style file
+    :rtype : dict
+    :param filepath: path to style file
+    :return: dictionary of column name -> (osm types, data type, flags)
+    """
+    columns = {}
+    with open(filepath) as f:
+        for line in f:
+            fields = line.split('#')[0].split()
+            if len(fields) < 3:
+                continue
+            osm_types, tag, data_type = fields[:3]
+            flags = fields[3].split(',') if len(fields) > 3 else []
+            if any(flag in NO_COLUMN_FLAGS for flag in flags):
+                continue
+            columns[tag] = (osm_types.split(','), data_type, flags)
+    return columns
+
+
+def parse_queries(filepath):
+    """
+    Extract SQL SELECT statements from log file (one statement per line)
+    :rtype : list
+    """
+    queries = []
+    with open(filepath) as f:
+        for line in f:
+            start = line.upper().find("SELECT ")
+            if start >= 0:
+                queries.append(line[start:].strip())
+    return queries
+
+
+def conditions_of_query(query, columns):
+    """
+    Extract relation and conditions on style file columns of a query
+    :rtype : tuple
+    :return: (relation, list of (kind, column, SQL condition))
+    """
+    match = re.search(r'\bFROM\s+([\w."]+)', query, re.IGNORECASE)
+    if not match:
+        return None, []
+    relation = match.group(1)
+
+    where = re.split(r'\bWHERE\b', query, maxsplit=1, flags=re.IGNORECASE)
+    if len(where) < 2:
+        return relation, []
+    where = re.split(r'\b(ORDER\s+BY|LIMIT)\b', where[1],
+                     flags=re.IGNORECASE)[0]
+
+    conditions = []
+    for kind, pattern in CONDITION_PATTERNS:
+        for m in pattern.finditer(where):
+            column = m.group(1).strip('"')
+            if column in columns:
+                conditions.append((kind, column, m.group(0)))
+    return relation, conditions
+
+
+def spatial_expression(query, geom_col='way'):
+    """
+    Geometry expression spatial conditions of a query filter on. Region
+    clipped queries compare ST_Transform(way, SRID) with the boundary, which
+    only an index on the same expression can serve (unless SRID is the
+    native one of the geometry column)
+    :rtype : tuple
+    :return: (index expression, index name part), e.g.
+    ('ST_Transform(way, 4326)', 'way_4326') or ('way', 'way')
+    """
+    where = re.split(r'\bWHERE\b', query, maxsplit=1, flags=re.IGNORECASE)
+    match = re.search(r'ST_Transform\(\s*(?:\w+\.)*{geom}\s*,\s*(\d+)\s*\)'.format(
+        geom=geom_col), where[-1] if len(where) > 1 else "", re.IGNORECASE)
+    if match:
+        return ("ST_Transform({geom}, {SRID})".format(geom=geom_col,
+                                                     SRID=match.group(1)),
+                "{geom}_{SRID}".format(geom=geom_col, SRID=match.group(1)))
+    return geom_col, geom_col
+
+
+def estimate_selectivity(conn, relation, kind, column, condition):
+    """
+    Estimate fraction of rows matching condition from planner statistics
+    (pg_stats), requires ANALYZEd tables
+    :rtype : float
+    :param conn: open instance of SQLOperations.DBOperations
+    :return: selectivity between 0 and 1, None if unknown
+    """
+    schema, _, table = relation.rpartition('.')
+    stats = conn.execute_query(
+        "SELECT null_frac, n_distinct, most_common_vals::text::text[], "
+        "most_common_freqs FROM pg_stats WHERE schemaname = '{schema}' "
+        "AND tablename = '{table}' AND attname = '{column}'".format(
+            schema=schema or 'public', table=table, column=column))
+    if not stats:
+        return None
+    null_frac, n_distinct, mcv, mcf = stats[0]
+    mcv, mcf = mcv or [], mcf or []
+
+    if kind == 'notnull':
+        return 1 - null_frac
+
+    values = re.findall(r"'([^']*)'", condition)
+    if n_distinct < 0:
+        # negative n_distinct is a fraction of the row count
+        count = conn.execute_query(
+            "SELECT reltuples FROM pg_class WHERE oid = '{relation}'::regclass".format(
+                relation=relation))
+        n_distinct = -n_distinct * (count[0][0] if count else 0)
+    rest_distinct = max(n_distinct - len(mcv), 1)
+    rest_frac = max(1 - null_frac - sum(mcf), 0)
+
+    selectivity = 0
+    for value in values:
+        if value in mcv:
+            selectivity += mcf[mcv.index(value)]
+        else:
+            selectivity += rest_frac / rest_distinct
+    return min(selectivity, 1)
+
+
+def advise(style_path, log_path, conn=None, geom_col='way',
+           max_selectivity=0.2):
+    """
+    Recommend indexes for conditions found in logged queries
+    :rtype : list
+    :param style_path: path to osm2pgsql style file
+    :param log_path: path to log file containing generated queries
+    :param conn: open instance of SQLOperations.DBOperations for selectivity
+    estimates, None skips estimates
+    :param geom_col: Column containing geometries
+    :param max_selectivity: Skip partial indexes for conditions matching more
+    than this fraction of rows (only with conn)
+    :return: list of recommendation dictionaries
+    """
+    columns = parse_style(style_path)
+    usage = collections.Counter()
+    relations = collections.Counter()
+    for query in parse_queries(log_path):
+        relation, conditions = conditions_of_query(query, columns)
+        spatial = spatial_expression(query, geom_col)
+        if relation:
+            relations[(relation, spatial)] += 1
+        for kind, column, condition in conditions:
+            usage[(relation, spatial, kind, column, condition)] += 1
+
+    recommendations = []
+    for (relation, spatial, kind, column, condition), n in \
+            usage.most_common():
+        selectivity = None
+        if conn:
+            selectivity = estimate_selectivity(conn, relation, kind, column,
+                                               condition)
+            if selectivity is not None and selectivity > max_selectivity:
+                continue
+        table = relation.split('.')[-1]
+        name = re.sub(r'\W+', '_', condition).strip('_').lower()
+        if spatial[1] != geom_col:
+            name = spatial[1] + "_" + name
+        recommendations.append({
+            'relation': relation,
+            'queries': n,
+            'condition': condition,
+            'selectivity': selectivity,
+            'sql': "CREATE INDEX {table}_{name}_idx ON {relation} "
+                   "USING gist ({geom}) WHERE {condition};".format(
+                       table=table,
+                       # index names are limited to 63 characters
+                       name=name[:40],
+                       relation=relation,
+                       geom=spatial[0],
+                       condition=condition)})
+
+    # Physically ordering heavily queried tables along the spatial index
+    # reduces pages read by region clipped queries. Partial indexes can't be
+    # clustered on, so a full index of the most used spatial expression is
+    # recommended ('{table}_way_idx' is the one created by osm2pgsql)
+    clustered = set()
+    for (relation, spatial), n in relations.most_common():
+        if relation in clustered:
+            continue
+        clustered.add(relation)
+        index = "{table}_{name}_idx".format(table=relation.split('.')[-1],
+                                            name=spatial[1])
+        recommendations.append({
+            'relation': relation,
+            'queries': n,
+            'condition': None,
+            'selectivity': None,
+            'sql': "CREATE INDEX IF NOT EXISTS {index} ON {relation} USING "
+                   "gist ({geom});\nCLUSTER {relation} USING {index};".format(
+                       index=index, relation=relation, geom=spatial[0])})
+
+    return recommendations
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('style', help="osm2pgsql style file")
+    parser.add_argument('log', help="file containing generated SQL queries")
+    parser.add_argument('--source_db', help="'user@host:port/db' for "
+                                            "selectivity estimates")
+    parser.add_argument('--max_selectivity', type=float, default=0.2)
+    args = parser.parse_args()
+
+    def report(conn=None):
+        for r in advise(args.style, args.log, conn=conn,
+                        max_selectivity=args.max_selectivity):
+            selectivity = ("{s:.2%}".format(s=r['selectivity'])
+                           if r['selectivity'] is not None else "n/a")
+            print("-- {n} queries, selectivity: {s}".format(n=r['queries'],
+                                                            s=selectivity))
+            print(r['sql'])
+
+    if args.source_db:
+        from SQLOperations import DBOperations
+        user, host, port, db = re.split(r":|@|/", args.source_db)
+        with DBOperations(db=db, host=host, user=user, port=port) as conn:
+            report(conn)
+    else:
+        report()
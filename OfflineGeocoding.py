@@ -0,0 +1,107 @@
+"""
+Offline reverse geocoding against administrative boundaries stored in the
+polygon table of an osm2pgsql database. Answers the same address part
+dictionaries as WebOSMHelpers.fetch_admin_from_latlon() without web requests.
+
+Requires shapely>=2.0
+"""
+import numpy as np
+import shapely
+from shapely import STRtree
+from PostGISHelpers import OSMPolygons, logger
+from SpatialJoin import geoms_from_results
+from region import Region
+
+# Nominatim address part names of OSM admin_level values (as used in Germany)
+ADMIN_LEVEL_PARTS = {'2': 'country',
+                     '4': 'state',
+                     '5': 'state_district',
+                     '6': 'county',
+                     '7': 'municipality',
+                     '8': 'city',
+                     '9': 'city_district',
+                     '10': 'suburb'}
+
+
+class OfflineReverseGeocoder:
+    """
+    Load admin boundaries intersecting a Region once, index them in an STRtree
+    and answer point-in-polygon lookups in bulk
+    """
+
+    def __init__(self,
+                 source_db,
+                 region=None,
+                 relation='germany_polygon',
+                 schema="public",
+                 admin_levels=ADMIN_LEVEL_PARTS,
+                 native_SRID=3857):
+        """
+        :param source_db: String containing information on where to fetch data
+        from or open instance of SQLOperations.DBOperations
+        :param region: Region instance limiting loaded boundaries (to the ones
+        intersecting its bbox), None loads all
+        :param relation: osm2pgsql polygon table
+        :param schema: DB schema to query
+        :param admin_levels: dict mapping admin_level to address part name
+        :param native_SRID: SRID of the table's geometry column
+        """
+        self.admin_levels = admin_levels
+
+        where_cond = "boundary = 'administrative' AND admin_level IN ({levels})".format(
+            levels=', '.join("'{l}'".format(l=l) for l in admin_levels))
+        # Admin areas usually exceed the region, so select by intersecting bbox
+        # instead of clipping with Region (which requires containment)
+        if region is not None and type(region.bounds) == tuple:
+            where_cond += " AND way && ST_Transform(ST_MakeEnvelope({xmin}, {ymin}, {xmax}, {ymax}, 4326), {SRID})".format(
+                xmin=region.bounds[0],
+                ymin=region.bounds[1],
+                xmax=region.bounds[2],
+                ymax=region.bounds[3],
+                SRID=native_SRID)
+
+        boundaries = OSMPolygons(name="Admin boundaries", region=Region())
+        boundaries.create_where_query(relation=relation,
+                                      schema=schema,
+                                      select_cols=['osm_id', 'name',
+                                                   'admin_level'],
+                                      where_cond=where_cond,
+                                      SRID=4326)
+        boundaries.fetch_geoms(source_db)
+
+        self.names = np.array([row['properties']['name']
+                               for row in boundaries.results], dtype=object)
+        self.parts = np.array([admin_levels[row['properties']['admin_level']]
+                               for row in boundaries.results], dtype=object)
+        geoms = geoms_from_results(boundaries.results)
+        self.tree = STRtree(geoms)
+
+        logger.printmessage.info(
+            "Indexed {n} admin boundaries".format(n=len(geoms)))
+
+    def lookup(self, lat, lon):
+        """
+        Reverse geocode single point
+        :rtype : dict
+        :param lat: latitude
+        :param lon: longitude
+        :return: dictionary of address parts
+        """
+        return self.lookup_batch([(lat, lon)])[0]
+
+    def lookup_batch(self, coords):
+        """
+        Reverse geocode list of points in bulk
+        :rtype : list
+        :param coords: iterable of (lat, lon) tuples
+        :return: list of address part dictionaries in order of coords
+        """
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        points = shapely.points(coords[:, 1], coords[:, 0])
+        point_idx, boundary_idx = self.tree.query(points,
+                                                  predicate='intersects')
+
+        address_parts = [{} for _ in range(len(points))]
+        for i, j in zip(point_idx, boundary_idx):
+            address_parts[i][self.parts[j]] = self.names[j]
+        return address_parts
@@ -0,0 +1,555 @@
+"""
+Set of tools for handling OSM data fetched via the Overpass API (overpy
+results), successor of Old_shizzle/overpy_helpers.py
+"""
+
+# numpy and shapely are imported on first use (see benchmark_import.py)
+from xml.sax.saxutils import escape
+import urllib.request
+import urllib.parse
+import hashlib
+import json
+import os
+import tempfile
+from PostGISHelpers import *
+
+logger = SimpleLogger(module_name="OverpassHelpers")
+
+OVERPASS_ENDPOINT = "http://overpass-api.de/api/interpreter"
+
+# Closed ways tagged with these keys are lines unless tagged area=yes
+LINEAR_KEYS = ('highway', 'barrier', 'railway', 'power')
+
+
+def generate_query(clip_to=None, recurse=True, verbosity="body",
+                   **osm_elements):
+    """
+    Function to generate OVERPASS API queries
+    :param clip_to: Bounding box in Overpass API format ("s,w,n,e") or
+    'poly:"lat lon ..."' filter
+    :param recurse: Add recursion (>;), so that all nodes of fetched ways and
+    relations are part of the same response
+    :param verbosity: Output format ("body", "skel", "ids", "meta")
+    :param osm_elements: dictionary of elements and associated tags
+    :return: query string
+    """
+    if not osm_elements:
+        logger.printmessage.error(
+            "Invalid Input, please provide one or more osm element types "
+            "to fetch (node, way, relation or map)")
+        return None
+
+    query = "("
+    for element, tags in osm_elements.items():
+        query += element
+        if tags and not tags == "[]":
+            query += '[' + ']['.join(tags) + ']'
+        if clip_to:
+            query += '(' + clip_to + ')'
+        query += ";"
+    query += ");"
+    if recurse:
+        query += "(._;>;);"
+    query += "out {verb};".format(verb=verbosity)
+
+    return query
+
+
+def fetch_osm(query, api=None):
+    """
+    :param query: Supply Overpass API query string
+    (see https://wiki.openstreetmap.org/wiki/Overpass_API/Language_Guide)
+    :param api: overpy.Overpass instance, default API if None
+    :return: overpy.Result
+    """
+    import overpy
+
+    api = api or overpy.Overpass()
+    result = api.query(query)
+
+    logger.printmessage.info(
+        "Fetched {nodes} nodes, {ways} ways and {rels} relations".format(
+            nodes=len(result.nodes),
+            ways=len(result.ways),
+            rels=len(result.relations)))
+    return result
+
+
+def resolve_missing_nodes(result, api=None, chunk_size=2000):
+    """
+    Resolve nodes referenced by ways but missing in result with batched
+    requests ('node(id:...)') instead of one request per way. Fetched nodes
+    are added to result, so node locations live (and are freed) with it.
+    :param result: overpy.Result
+    :param api: overpy.Overpass instance, default API if None
+    :param chunk_size: Maximum number of node ids per request
+    :return: Number of nodes fetched from API
+    """
+    known = {node.id for node in result.nodes}
+    referenced = set()
+    for way in result.ways:
+        referenced.update(_way_node_ids(way))
+    missing = sorted(referenced.difference(known))
+
+    for i in range(0, len(missing), chunk_size):
+        chunk = fetch_osm("node(id:{ids});out skel;".format(
+            ids=','.join(str(node_id) for node_id in missing[i:i + chunk_size])),
+            api=api)
+        result.expand(chunk)
+
+    return len(missing)
+
+
+def ways2shapely(result):
+    """
+    Convert ways of result to shapely LineStrings in bulk, using the node
+    locations of result (call resolve_missing_nodes() first if needed)
+    :rtype : list
+    :param result: overpy.Result
+    :return: list of LineStrings in order of result.ways, None for ways with
+    less than two known nodes
+    """
+    import numpy as np
+    import shapely
+
+    # Node locations of this call only, key: node id, value: (lon, lat)
+    locations = {node.id: (float(node.lon), float(node.lat))
+                 for node in result.nodes}
+
+    coords, indices, valid = [], [], []
+    for i, way in enumerate(result.ways):
+        way_coords = [locations[node_id] for node_id in _way_node_ids(way)
+                      if node_id in locations]
+        if len(way_coords) < 2:
+            continue
+        coords.extend(way_coords)
+        indices.extend([len(valid)] * len(way_coords))
+        valid.append(i)
+
+    lines = [None] * len(result.ways)
+    if valid:
+        for i, line in zip(valid, shapely.linestrings(np.asarray(coords),
+                                                      indices=indices)):
+            lines[i] = line
+    return lines
+
+
+# Width reserved for <bounds .../> element, filled in after one pass over nodes
+BOUNDS_WIDTH = 100
+
+_ATTR_ENTITIES = {'"': "&quot;", "\n": "&#10;", "\t": "&#9;"}
+
+
+def _attr(value):
+    return escape(str(value), _ATTR_ENTITIES)
+
+
+def _tags(tags, buf):
+    for k, v in tags.items():
+        buf.append('<tag k="{k}" v="{v}"/>\n'.format(k=_attr(k), v=_attr(v)))
+
+
+def _way_node_ids(way):
+    # overpy keeps referenced ids even if nodes are not part of the result
+    node_ids = getattr(way, '_node_ids', None)
+    if node_ids is None:
+        node_ids = [node.id for node in way.nodes]
+    return node_ids
+
+
+def dump(result, fp, generator="rli_python_as_gis", flush_every=5000):
+    """
+    Stream Overpass result as OSM XML in one pass over all elements. Output is
+    collected in chunks of flush_every elements before writing. If fp is
+    seekable, the bounds of all nodes are computed incrementally and written
+    into a reserved slot of the header afterwards, otherwise they are omitted.
+    :param result: overpy.Result (or object with nodes/ways/relations)
+    :param fp: file object opened for writing text
+    :param generator: Value of generator attribute
+    :param flush_every: Number of elements per write
+    """
+    fp.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    fp.write('<osm version="0.6" generator="{g}">\n'.format(g=_attr(generator)))
+
+    bounds_pos = fp.tell() if fp.seekable() else None
+    if bounds_pos is not None:
+        fp.write(" " * BOUNDS_WIDTH + "\n")
+
+    lat_min = lon_min = float('inf')
+    lat_max = lon_max = float('-inf')
+
+    buf = []
+    n = 0
+
+    # Write node data
+    for node in result.nodes:
+        lat, lon = float(node.lat), float(node.lon)
+        if lat < lat_min:
+            lat_min = lat
+        if lat > lat_max:
+            lat_max = lat
+        if lon < lon_min:
+            lon_min = lon
+        if lon > lon_max:
+            lon_max = lon
+
+        buf.append('<node id="{0:d}" lat="{1:.7f}" lon="{2:.7f}"'.format(
+            node.id, lat, lon))
+        if node.tags:
+            buf.append('>\n')
+            _tags(node.tags, buf)
+            buf.append('</node>\n')
+        else:
+            buf.append('/>\n')
+
+        n += 1
+        if n % flush_every == 0:
+            fp.write(''.join(buf))
+            buf = []
+
+    # Write way data
+    for way in result.ways:
+        node_ids = _way_node_ids(way)
+        buf.append('<way id="{0:d}"'.format(way.id))
+        if not node_ids and not way.tags:
+            buf.append('/>\n')
+        else:
+            buf.append('>\n')
+            for node_id in node_ids:
+                buf.append('<nd ref="{0:d}"/>\n'.format(node_id))
+            _tags(way.tags, buf)
+            buf.append('</way>\n')
+
+        n += 1
+        if n % flush_every == 0:
+            fp.write(''.join(buf))
+            buf = []
+
+    # Write relation data
+    for relation in result.relations:
+        buf.append('<relation id="{0:d}"'.format(relation.id))
+        if not relation.members and not relation.tags:
+            buf.append('/>\n')
+        else:
+            buf.append('>\n')
+            for member in relation.members:
+                buf.append(
+                    '<member type="{0}" ref="{1:d}" role="{2}"/>\n'.format(
+                        member._type_value, member.ref, _attr(member.role or "")))
+            _tags(relation.tags, buf)
+            buf.append('</relation>\n')
+
+        n += 1
+        if n % flush_every == 0:
+            fp.write(''.join(buf))
+            buf = []
+
+    buf.append('</osm>\n')
+    fp.write(''.join(buf))
+
+    # Fill in bounds slot
+    if bounds_pos is not None and lat_min <= lat_max:
+        end_pos = fp.tell()
+        fp.seek(bounds_pos)
+        fp.write(
+            '<bounds minlat="{0:.7f}" minlon="{1:.7f}" maxlat="{2:.7f}" maxlon="{3:.7f}"/>'.format(
+                lat_min, lon_min, lat_max, lon_max).ljust(BOUNDS_WIDTH))
+        fp.seek(end_pos)
+    elif bounds_pos is None:
+        logger.printmessage.info("Output not seekable, bounds omitted")
+
+
+def dump_pbf(result, filepath):
+    """
+    Write Overpass result as OSM PBF file (requires pyosmium)
+    :param result: overpy.Result (or object with nodes/ways/relations)
+    :param filepath: output path (*.osm.pbf)
+    """
+    try:
+        import osmium
+    except ImportError:
+        logger.printmessage.error("Writing PBF files requires pyosmium!")
+        return
+
+    writer = osmium.SimpleWriter(filepath)
+    try:
+        for node in result.nodes:
+            writer.add_node(osmium.osm.mutable.Node(
+                id=node.id,
+                location=(float(node.lon), float(node.lat)),
+                tags=node.tags))
+        for way in result.ways:
+            writer.add_way(osmium.osm.mutable.Way(
+                id=way.id,
+                nodes=_way_node_ids(way),
+                tags=way.tags))
+        for relation in result.relations:
+            writer.add_relation(osmium.osm.mutable.Relation(
+                id=relation.id,
+                members=[(member._type_value[0], member.ref, member.role or "")
+                         for member in relation.members],
+                tags=relation.tags))
+    finally:
+        writer.close()
+
+
+def fetch_overpass(query, endpoint=OVERPASS_ENDPOINT, cache_dir=None,
+                   refresh=False, chunk_size=65536):
+    """
+    Send query to Overpass API endpoint and return elements of JSON response.
+    The response is streamed to disk in chunks; with cache_dir it is kept
+    there (keyed by endpoint and query) and reused by later calls, which
+    allows offline reruns.
+    :rtype : list
+    :param query: Overpass QL query with [out:json]
+    :param endpoint: URL of Overpass API interpreter (e.g. local mock server)
+    :param cache_dir: Directory of response cache, None disables caching
+    :param refresh: Ignore cached response
+    :param chunk_size: Bytes per read from response stream
+    :return: list of element dictionaries
+    """
+    if cache_dir:
+        key = hashlib.sha1((endpoint + "\n" + query).encode()).hexdigest()
+        cache_path = os.path.join(cache_dir, key + ".json")
+        if os.path.exists(cache_path) and not refresh:
+            logger.printmessage.info("Using cached Overpass response")
+            with open(cache_path, 'rb') as f:
+                return json.load(f)['elements']
+        os.makedirs(cache_dir, exist_ok=True)
+    else:
+        cache_path = None
+
+    data = urllib.parse.urlencode({'data': query}).encode()
+    fd, tmp_path = tempfile.mkstemp(suffix=".json", dir=cache_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            with urllib.request.urlopen(endpoint, data=data) as response:
+                while True:
+                    chunk = response.read(chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+        with open(tmp_path, 'rb') as f:
+            elements = json.load(f)['elements']
+        if cache_path:
+            os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return elements
+
+
+def element_geom_type(element):
+    """
+    Determine geometry type of Overpass JSON element ('out geom')
+    :rtype : str
+    :return: 'Point', 'LineString', 'Polygon' or None
+    """
+    if element['type'] == 'node':
+        return 'Point'
+    if element['type'] == 'way' and len(element.get('geometry', [])) >= 2:
+        geometry = element['geometry']
+        tags = element.get('tags', {})
+        closed = len(geometry) >= 4 and geometry[0] == geometry[-1]
+        if closed and tags.get('area') != 'no' and (
+                tags.get('area') == 'yes' or
+                not any(key in tags for key in LINEAR_KEYS)):
+            return 'Polygon'
+        return 'LineString'
+    # Relations are not supported yet
+    return None
+
+
+def element2wkt(element, geom_type):
+    """
+    Convert Overpass JSON element to WKT
+    :rtype : str
+    """
+    if geom_type == 'Point':
+        return "POINT ({lon} {lat})".format(lon=element['lon'],
+                                            lat=element['lat'])
+    coords = ', '.join("{lon} {lat}".format(**p) for p in element['geometry'])
+    if geom_type == 'Polygon':
+        return "POLYGON (({coords}))".format(coords=coords)
+    return "LINESTRING ({coords})".format(coords=coords)
+
+
+class OverpassQuery(Query):
+    """
+    Query fetching data from an Overpass API endpoint instead of PostGIS,
+    results have the same format as Query.fetch_geoms()
+    """
+
+    def __init__(self, name=None, region=None, endpoint=OVERPASS_ENDPOINT,
+                 cache_dir=None):
+        super(OverpassQuery, self).__init__(name=name, region=region)
+        self.endpoint = endpoint
+        self.cache_dir = cache_dir
+
+    def region_filter(self):
+        """
+        Translate self.region into Overpass filter
+        :rtype : str
+        :return: 'poly:"lat lon ..."' for single polygons, bbox "s,w,n,e"
+        otherwise, None if region has no local boundary
+        """
+        boundary = self.region.simplified_boundary
+        if boundary is None:
+            if type(self.region.bounds) == str:
+                logger.printmessage.warning(
+                    "DB relations are not supported as Overpass boundary")
+            return None
+        # Simplified boundary deviates by at most the tolerance, grow it
+        # accordingly to keep the filter a superset of the exact boundary
+        boundary = boundary.buffer(self.region.simplify_tolerance, join_style=2)
+        if boundary.geom_type == 'Polygon' and not boundary.interiors:
+            return 'poly:"{coords}"'.format(coords=' '.join(
+                "{lat} {lon}".format(lat=lat, lon=lon)
+                for lon, lat in boundary.exterior.coords[:-1]))
+        xmin, ymin, xmax, ymax = self.region.bounds
+        return "{s},{w},{n},{e}".format(s=ymin, w=xmin, n=ymax, e=xmax)
+
+    def create_overpass_query(self,
+                              tags=None,
+                              select_cols=('osm_id', 'name'),
+                              elements=('node', 'way'),
+                              timeout=180):
+        """
+        Automatically generate and set an Overpass QL query from given query
+        features
+        :param tags: list of Overpass tag filters, e.g. ['"building"']
+        :param select_cols: tags to return as properties ('osm_id' is the
+        element id)
+        :param elements: OSM element types to fetch
+        :param timeout: Server side timeout in seconds
+        """
+        self._overpass_query = "[out:json][timeout:{timeout:d}];".format(
+            timeout=timeout)
+        self._overpass_query += generate_query(
+            clip_to=self.region_filter(),
+            recurse=False,
+            verbosity="geom",
+            **{element: tags for element in elements})
+        self.select_cols = list(select_cols)
+        self.SRID = 4326
+
+    def _elements2results(self, elements):
+        """
+        Convert Overpass JSON elements of self.geom_type to result rows
+        Protected method used by self.fetch_geoms() and
+        OverpassCollection.fetch_OSM_collection()
+        :rtype : list
+        """
+        results = []
+        for element in elements:
+            geom_type = element_geom_type(element)
+            if geom_type is None or (self.geom_type and
+                                     geom_type != self.geom_type):
+                continue
+            tags = element.get('tags', {})
+            properties = {}
+            for col in self.select_cols:
+                properties[col] = element['id'] if col == 'osm_id' else tags.get(col)
+            results.append(ResultRow(properties,
+                                     element2wkt(element, geom_type)))
+        return results
+
+    def _clip_results(self):
+        # Overpass selects elements intersecting the filter, PostGIS queries
+        # select contained ones -> clip to exact boundary for same results
+        if self.region.boundary_geom is not None:
+            self.clip_view2poly()
+
+    def fetch_geoms(self, source_db=None, refresh=False):
+        """
+        Fetch items from Overpass API endpoint and clip results to boundary of
+        supplied Region object instance
+        :param source_db: Overpass API endpoint overriding self.endpoint
+        :param refresh: Ignore cached response
+        """
+        logger.printmessage.info(
+            "Querying OVERPASS API for {geoms}s...".format(geoms=self.geom_type))
+        elements = fetch_overpass(self._overpass_query,
+                                  endpoint=source_db or self.endpoint,
+                                  cache_dir=self.cache_dir,
+                                  refresh=refresh)
+        self.results.extend(self._elements2results(elements))
+        self._clip_results()
+        logger.printmessage.info("Fetched {n} {geoms}(s)".format(
+            n=len(self.results), geoms=self.geom_type))
+
+
+class OverpassPoints(OverpassQuery, Points):
+    def __init__(self, name, region=None, **source):
+        super(OverpassPoints, self).__init__(name=name, region=region, **source)
+        self.geom_type = 'Point'
+
+
+class OverpassLines(OverpassQuery, Lines):
+    def __init__(self, name, region=None, **source):
+        super(OverpassLines, self).__init__(name=name, region=region, **source)
+        self.geom_type = 'LineString'
+
+
+class OverpassPolygons(OverpassQuery, Polygons):
+    def __init__(self, name, region=None, **source):
+        super(OverpassPolygons, self).__init__(name=name, region=region,
+                                               **source)
+        self.geom_type = 'Polygon'
+
+
+class OverpassCollection(OverpassQuery, OSMCollection):
+    """
+    OSMCollection fetching Points, Lines and Polygons with a single Overpass
+    request
+    """
+
+    def __init__(self, name=None,
+                 region=None,
+                 points=True,
+                 lines=True,
+                 polygons=True,
+                 endpoint=OVERPASS_ENDPOINT,
+                 cache_dir=None):
+        Query.__init__(self, name=name, region=region)
+        self.endpoint = endpoint
+        self.cache_dir = cache_dir
+
+        source = {'endpoint': endpoint, 'cache_dir': cache_dir}
+        if points:
+            self.Points = OverpassPoints(name=name, region=self.region, **source)
+        if lines:
+            self.Lines = OverpassLines(name=name, region=self.region, **source)
+        if polygons:
+            self.Polygons = OverpassPolygons(name=name, region=self.region,
+                                             **source)
+
+    def create_collection_query(self, tags=None, select_cols=('osm_id', 'name'),
+                                elements=('node', 'way'), timeout=180):
+        """
+        METHOD OVERRIDING: Generate a collective Overpass query for Points
+        and/or Lines and/or Polygons (see create_overpass_query())
+        """
+        self.create_overpass_query(tags=tags, select_cols=select_cols,
+                                   elements=elements, timeout=timeout)
+        for layer in ('Points', 'Lines', 'Polygons'):
+            if hasattr(self, layer):
+                getattr(self, layer)._overpass_query = self._overpass_query
+                getattr(self, layer).select_cols = self.select_cols
+
+    def fetch_OSM_collection(self, source_db=None, refresh=False):
+        """
+        METHOD OVERRIDING: Fetch all layers with a single Overpass request
+        :param source_db: Overpass API endpoint overriding self.endpoint
+        :param refresh: Ignore cached response
+        """
+        elements = fetch_overpass(self._overpass_query,
+                                  endpoint=source_db or self.endpoint,
+                                  cache_dir=self.cache_dir,
+                                  refresh=refresh)
+        for layer in ('Points', 'Lines', 'Polygons'):
+            if hasattr(self, layer):
+                query = getattr(self, layer)
+                query.results.extend(query._elements2results(elements))
+                query._clip_results()
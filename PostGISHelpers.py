@@ -12,93 +12,526 @@ Study usage_examples.py for some working examples (apply to your local database
 infrastructure!)
 """
 
-from mpl_toolkits.basemap import Basemap
-from prettytable import PrettyTable
-import matplotlib.pyplot as plt
-from matplotlib.collections import LineCollection
-import numpy as np
-import fiona  # handling ESRI shape format
-from shapely.wkt import loads
-from shapely.geometry import mapping
+# Plotting (Basemap, matplotlib), export (fiona), table printing (prettytable)
+# and geometry handling (shapely, numpy) import their dependencies on first
+# use, keeping start-up of short jobs and worker processes cheap (see
+# benchmark_import.py)
+import collections
+import collections.abc
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
 from simple_log import *
 from SQLOperations import *
 from region import *
 
 logger = SimpleLogger(module_name="PostGISHelpers")
 
+# LRU caches of Basemap instances, key: (bbox, resolution), and backdrop
+# images, key: file path. Long-running batch jobs render many extents, so
+# only the most recently used entries are kept
+_basemap_cache = collections.OrderedDict()
+_backdrop_cache = collections.OrderedDict()
+BASEMAP_CACHE_SIZE = 16
+BACKDROP_CACHE_SIZE = 16
+
+
+def _cache_lookup(cache, key, maxsize, create):
+    """
+    Return cache[key], created by create() if missing; least recently used
+    entries are dropped beyond maxsize
+    """
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    value = cache[key] = create()
+    while len(cache) > maxsize:
+        cache.popitem(last=False)
+    return value
+
+
+def get_basemap(bounds, resolution="i"):
+    """
+    Return (cached) Basemap for bbox. Setting up Basemap instances reads
+    coastline and country data, which takes seconds at resolution 'i' or
+    higher, so instances are reused for the same bbox and resolution.
+    :rtype: Basemap
+    :param bounds: (xmin, ymin, xmax, ymax)
+    :param resolution: Basemap resolution
+    :return: Basemap
+    """
+    def create():
+        from mpl_toolkits.basemap import Basemap
+
+        xmin, ymin, xmax, ymax = bounds
+        return Basemap(resolution=resolution,
+                       projection='merc',
+                       llcrnrlat=ymin - 0.02,
+                       urcrnrlat=ymax + 0.02,
+                       llcrnrlon=xmin - 0.02,
+                       urcrnrlon=xmax + 0.02,
+                       lat_ts=(xmin + xmax) / 2)
+
+    key = (tuple(round(v, 6) for v in bounds), resolution)
+    return _cache_lookup(_basemap_cache, key, BASEMAP_CACHE_SIZE, create)
+
+
+def lsmask_grid(m):
+    """
+    Coarsest land/sea mask grid resolving the map extent in at least two
+    cells, Basemap.drawlsmask() fails on maps smaller than one cell of its
+    default grid (5 arc-minutes)
+    :rtype : float
+    :param m: Basemap
+    :return: grid spacing in arc-minutes, None if the map is smaller than
+    the finest grid
+    """
+    for grid in (5, 2.5, 1.25):
+        cell = grid / 60.
+        if m.projection != 'cyl':
+            cell = math.radians(cell) * m.rmajor
+        if min(m.xmax - m.xmin, m.ymax - m.ymin) >= cell:
+            return grid
+    return None
+
+
+def draw_backdrop(m, ax=None):
+    """
+    Draw coastlines, land/sea mask and countries of Basemap
+    :param m: Basemap
+    :param ax: Axes to draw on, current axes if None
+    """
+    m.drawcoastlines(ax=ax)
+    grid = lsmask_grid(m)
+    if grid:
+        m.drawlsmask(land_color='white', ocean_color='aqua', lakes=True,
+                     grid=grid, ax=ax)
+    m.drawcountries(ax=ax)
+
+
+def get_backdrop(bounds, resolution="i", backdrop_dir=None, width=2000):
+    """
+    Return backdrop image of bbox, pre-rendered once into backdrop_dir and
+    reused by later (and parallel) map generation
+    :rtype: numpy.ndarray
+    :param bounds: (xmin, ymin, xmax, ymax)
+    :param resolution: Basemap resolution
+    :param backdrop_dir: Directory of pre-rendered backdrops (created if
+    missing), temporary directory if None
+    :param width: Image width in pixels
+    :return: RGBA image covering the extent of get_basemap(bounds, resolution)
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    key = "{b}_{r}_{w}".format(b='_'.join("{v:.6f}".format(v=v) for v in bounds),
+                               r=resolution, w=width)
+    backdrop_dir = backdrop_dir or tempfile.gettempdir()
+    os.makedirs(backdrop_dir, exist_ok=True)
+    filepath = os.path.join(backdrop_dir, "backdrop_{h}.png".format(
+        h=hashlib.sha1(key.encode()).hexdigest()))
+
+    def create():
+        if not os.path.exists(filepath):
+            m = get_basemap(bounds, resolution)
+            ratio = (m.urcrnry - m.llcrnry) / (m.urcrnrx - m.llcrnrx)
+            fig = Figure(figsize=(width / 100., width * ratio / 100.), dpi=100)
+            FigureCanvasAgg(fig)
+            ax = fig.add_axes([0, 0, 1, 1])
+            draw_backdrop(m, ax=ax)
+            ax.set_xlim(m.llcrnrx, m.urcrnrx)
+            ax.set_ylim(m.llcrnry, m.urcrnry)
+            ax.set_axis_off()
+            # Write to temporary file first, parallel renderers may read it
+            tmp_path = filepath + ".{pid}.png".format(pid=os.getpid())
+            fig.savefig(tmp_path, dpi=100)
+            os.replace(tmp_path, filepath)
+        return plt.imread(filepath)
+
+    return _cache_lookup(_backdrop_cache, filepath, BACKDROP_CACHE_SIZE,
+                         create)
+
+
+def quote_literal(value):
+    """
+    Quote value as SQL string literal
+    :rtype : str
+    """
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def uses_tag_operators(sql):
+    """
+    Check SQL statement for hstore/jsonb operators (as generated by
+    tag_conditions() and tag_projections()), string literals are ignored
+    :rtype : bool
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", "''", sql)
+    return bool(re.search(r"->|\?|@>|<@", sql))
+
+
+def tag_conditions(tag_filters, tags_col='tags', tags_type='hstore'):
+    """
+    Compile tag filters to conditions on an osm2pgsql hstore/jsonb tags
+    column using operators supported by GIN/GiST indexes (?, ?&, @>)
+    :rtype : list
+    :param tag_filters: dictionary of {key: True/False/value/[values]}
+    :param tags_col: Column containing tags
+    :param tags_type: Type of tags column, 'hstore' or 'jsonb'
+    :return: list of SQL conditions
+    """
+    def contains(pairs):
+        # Tag values are strings in osm2pgsql tags columns
+        if tags_type == 'jsonb':
+            return "{col} @> {doc}::jsonb".format(
+                col=tags_col, doc=quote_literal(json.dumps(
+                    {k: str(v) for k, v in pairs})))
+        return "{col} @> hstore(ARRAY[{keys}], ARRAY[{values}])".format(
+            col=tags_col,
+            keys=', '.join(quote_literal(k) for k, v in pairs),
+            values=', '.join(quote_literal(v) for k, v in pairs))
+
+    exists, equals, conditions = [], [], []
+    for key, value in tag_filters.items():
+        if value is True:
+            exists.append(key)
+        elif value is False:
+            conditions.append("NOT {col} ? {key}".format(
+                col=tags_col, key=quote_literal(key)))
+        elif isinstance(value, (list, tuple, set)):
+            conditions.append("(" + " OR ".join(
+                contains([(key, v)]) for v in value) + ")")
+        else:
+            equals.append((key, value))
+
+    if len(exists) == 1:
+        conditions.append("{col} ? {key}".format(
+            col=tags_col, key=quote_literal(exists[0])))
+    elif exists:
+        conditions.append("{col} ?& ARRAY[{keys}]".format(
+            col=tags_col, keys=', '.join(quote_literal(k) for k in exists)))
+    if equals:
+        conditions.append(contains(equals))
+    return conditions
+
+
+def tag_projections(tag_cols, tags_col='tags', tags_type='hstore'):
+    """
+    Select single keys of an osm2pgsql hstore/jsonb tags column as text
+    :rtype : list
+    :param tag_cols: list of tag keys
+    :param tags_col: Column containing tags
+    :param tags_type: Type of tags column, 'hstore' or 'jsonb'
+    :return: list of SELECT expressions
+    """
+    operator = '->>' if tags_type == 'jsonb' else '->'
+    return ['{col} {op} {key} AS "{alias}"'.format(
+        col=tags_col, op=operator, key=quote_literal(key),
+        alias=key.replace('"', '""')) for key in tag_cols]
+
+
+class PageFetchError(Exception):
+    """
+    Raised by Query.fetch_geoms_paged() if a page can't be fetched, pass
+    checkpoint as resume_from to continue
+    """
+
+    def __init__(self, checkpoint):
+        super().__init__("Fetching page failed, resume from checkpoint "
+                         "{checkpoint}".format(checkpoint=checkpoint))
+        self.checkpoint = checkpoint
+
+
+class ResultRow(collections.abc.Mapping):
+    """
+    Result row, a read-only mapping with the fixed keys 'properties'
+    (dictionary of column values) and 'geom' (WKT geometry), values are also
+    available as attributes (row.properties, row.geom). __slots__ avoids a
+    per-row __dict__, so rows take less memory than plain dictionaries.
+    Values of the fixed keys can be replaced (row['geom'] = wkt).
+    Serialize with json.dumps(dict(row)).
+    """
+    __slots__ = ('properties', 'geom')
+    _keys = ('properties', 'geom')
+
+    def __init__(self, properties, geom):
+        self.properties = properties
+        self.geom = geom
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self._keys:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __reduce__(self):
+        # Rows are passed to worker processes (see render_batch())
+        return self.__class__, (self.properties, self.geom)
+
+    def __repr__(self):
+        return "ResultRow(properties={p!r}, geom={g!r})".format(
+            p=self.properties, g=self.geom)
+
+
+def connect(source_db):
+    """
+    Return context manager providing a DB connection, without routing to
+    local extracts of regions (see Query._connect())
+    :param source_db: String containing DB access information
+    ('user@host:port/db' for PostgreSQL, 'spatialite://path' or path to
+    *.sqlite file for SpatiaLite, see SQLOperations.BACKENDS) or open
+    DBBackend instance, the latter is not closed on exit
+    :return: context manager returning DBBackend instance
+    """
+    if isinstance(source_db, DBBackend):
+        return contextlib.nullcontext(source_db)
+    if "://" in source_db:
+        scheme, location = source_db.split("://", 1)
+        return BACKENDS[scheme](location)
+    if source_db.endswith((".sqlite", ".db")):
+        return SpatiaLiteOperations(source_db)
+    return DBOperations(**Query.string2psycopg_features(source_db))
+
+
 class Query:
-    instances = {}  # Instance collector
+    # Instance collector, entries disappear when instances are garbage
+    # collected
+    instances = weakref.WeakValueDictionary()
 
-    def __init__(self, name=None, region=Region(), debug_level='i'):
+    def __init__(self, name=None, region=None, debug_level='i'):
 
         self.query_name = name
-        self.__class__.instances[self.query_name] = weakref.proxy(self)
+        self.__class__.instances[self.query_name] = self
         self.results = []
-        self.region = region
+        # New Region per instance, a shared default would collect state
+        self.region = region if region is not None else Region()
         self.geom_type = None
+        self._sql_where = None
+        self.checkpoint = None
 
         logger.set_debug_level(debug_level)
-        
+
+    def release(self):
+        """
+        Free fetched results and derived data and remove instance from
+        Query.instances, the query itself can be reused afterwards
+        """
+        self.results = []
+        self.checkpoint = None
+        for attr in ('join_results', 'density', 'quarantine',
+                     'validation_report'):
+            if hasattr(self, attr):
+                delattr(self, attr)
+        for layer in ('Points', 'Lines', 'Polygons'):
+            if hasattr(self, layer):
+                getattr(self, layer).release()
+        if Query.instances.get(self.query_name) is self:
+            del Query.instances[self.query_name]
+
+    @classmethod
+    def clear_instances(cls):
+        """
+        Release all registered instances and cached basemaps/backdrops
+        """
+        for query in list(Query.instances.values()):
+            query.release()
+        Query.instances.clear()
+        _basemap_cache.clear()
+        _backdrop_cache.clear()
+
     def create_where_query(self,
                            relation,
                            schema="public",
                            select_cols="*",
                            geom_col='way',
                            where_cond=None,
-                           SRID=4326):
+                           SRID=4326,
+                           tag_filters=None,
+                           tag_cols=None,
+                           tags_col='tags',
+                           tags_type='hstore',
+                           make_valid=False):
         """
         Automatically generate and set a select/from/where SQL statement
         from given query features
         :param schema: DB schema to query
         :param relation: table name
-        :param select_cols: table columns to select from
+        :param select_cols: table columns to select from (list, single column
+        name or "*" for all columns of relation except geom_col and tags_col,
+        resolved when fetching)
         :param where_cond: where condition for query
         :param SRID: Spatial Reference ID
+        :param tag_filters: dictionary of filters on the osm2pgsql tags column,
+        {key: True} (key exists), {key: False} (key does not exist),
+        {key: value} or {key: [value, ...]} (any of values)
+        :param tag_cols: list of tag keys to return as properties (instead of
+        whole tags columns)
+        :param tags_col: Column containing tags
+        :param tags_type: Type of tags column, 'hstore' or 'jsonb'
+        :param make_valid: Repair geometries in the DB (ST_MakeValid) instead
+        of on the client (see self.validate_geoms())
         """
+        if type(select_cols) == str:
+            select_cols = [select_cols]
+        relation_name = "{schema}.{relation}".format(schema=schema,
+                                                     relation=relation)
+        columns = ["{relation}.*".format(relation=relation_name)
+                   if col == "*" else col for col in select_cols]
+        columns.extend(tag_projections(tag_cols or [], tags_col, tags_type))
+        # SELECT expressions of properties, reused by VectorTiles
+        self._sql_columns = columns
 
         # SELECT...
-        self._sql_query = "SELECT {sel_cols}, ST_AsText(ST_Transform({geom},{SRID}))".format(
-            sel_cols=', '.join(select_cols),
-            geom=geom_col,
+        self._sql_geom = "ST_AsText(ST_Transform({geom},{SRID}))".format(
+            geom="ST_MakeValid({geom})".format(geom=geom_col) if make_valid
+            else geom_col,
             SRID=SRID)
+        self._sql_select = "SELECT {sel_cols}{geom}".format(
+            sel_cols=''.join(col + ", " for col in columns),
+            geom=self._sql_geom)
+
+        # FROM...
+        self._sql_relation = "{schema}.{relation}".format(
+            schema=schema,
+            relation=relation)
+        self._sql_from = " FROM {relation}".format(relation=self._sql_relation)
+
+        # WHERE...
+        self._sql_where = []
+        if where_cond:
+            self._sql_where.append(where_cond)
+        if tag_filters:
+            self._sql_where.extend(
+                tag_conditions(tag_filters, tags_col, tags_type))
+        clip_from, clip_where = self._region_clause(geom_col, SRID)
+        self._sql_from += clip_from
+        self._sql_where.extend(clip_where)
+
+        self._sql_query = self._compose_query()
+        logger.printmessage.debug(self._sql_query)
+
+        self.SRID = SRID
+        self._geom_col = geom_col
+        self._tags_col = tags_col
+        self.select_cols = list(select_cols) + list(tag_cols or [])
 
-        # FROM/WHERE...
+    def _expand_columns(self, conn):
+        """
+        Replace "*" of select_cols by the columns of the relation, except the
+        geometry (fetched as WKT anyway) and the whole tags column (select it
+        explicitly or single keys via tag_cols)
+        Protected method used by self.fetch_geoms(), self.fetch_geoms_paged()
+        and self.stream_geoms()
+        :param conn: open DBBackend instance
+        """
+        star = "{relation}.*".format(relation=self._sql_relation)
+        if self._sql_where is None or star not in self._sql_columns:
+            return
+        names = [col for col in conn.table_columns(self._sql_relation)
+                 if col not in (self._geom_col, self._tags_col)]
+        if not names:
+            # Unknown relation, let the query fail as is
+            return
+
+        i = self._sql_columns.index(star)
+        self._sql_columns[i:i + 1] = [
+            '{relation}."{col}"'.format(relation=self._sql_relation,
+                                        col=col.replace('"', '""'))
+            for col in names]
+        i = self.select_cols.index("*")
+        self.select_cols[i:i + 1] = names
+        self._sql_select = "SELECT {sel_cols}{geom}".format(
+            sel_cols=''.join(col + ", " for col in self._sql_columns),
+            geom=self._sql_geom)
+        self._sql_query = self._compose_query()
+
+    def _region_clause(self, geom_col, SRID):
+        """
+        Generate FROM/WHERE parts clipping a relation to self.region
+        Protected method used by self.create_where_query() and
+        OSMCollection.create_join_query()
+        :rtype : tuple
+        :param geom_col: Column containing geometries
+        :param SRID: Spatial Reference ID
+        :return: tuple of (FROM addition, list of WHERE conditions)
+        """
+        clip_from = ""
+        clip_where = []
+        # Uploaded boundary table with spatial index in native SRID
+        # (see Region.upload_boundary()): indexed prefilter against the
+        # subdivided parts, containment test against the whole boundary
+        if self.region.boundary_table:
+            clip_where.append(
+                "EXISTS (SELECT 1 FROM {clip_table} AS clip_relation WHERE NOT clip_relation.whole AND ST_Intersects(clip_relation.geom, {geom}))".format(
+                    clip_table=self.region.boundary_table,
+                    geom=geom_col))
+            clip_where.append(
+                "ST_Contains((SELECT clip_boundary.geom FROM {clip_table} AS clip_boundary WHERE clip_boundary.whole), {geom})".format(
+                    clip_table=self.region.boundary_table,
+                    geom=geom_col))
         # bbox of format (xmin, ymin, xmax, ymax)
         # if type(self.region.bounds) == tuple:
-        if self.region.boundary_polygon:
-            # FROM...
-            self._sql_query += " FROM {schema}.{relation}".format(
-                schema=schema,
-                relation=relation)
-            if where_cond:
-                self._sql_query += " WHERE {where_cond} AND".format(
-                    where_cond=where_cond)
-            self._sql_query += " ST_Contains(ST_GeomFromText('{clip_pattern}',{SRID}), ST_Transform(way,{SRID}))".format(
-                clip_pattern=self.region.boundary_polygon,
-                SRID=SRID)
+        elif self.region.boundary_polygon:
+            clip_where.append(
+                "ST_Contains(ST_GeomFromText('{clip_pattern}',{SRID}), ST_Transform({geom},{SRID}))".format(
+                    clip_pattern=self.region.boundary_polygon,
+                    geom=geom_col,
+                    SRID=SRID))
         # Link to DB relation
         elif type(self.region.bounds) == str:
-            # FROM...
-            self._sql_query += " FROM {schema}.{relation}, {clip_relation} as clip_relation".format(
-                schema=schema,
-                relation=relation,
+            clip_from = ", {clip_relation} as clip_relation".format(
                 clip_relation=self.region.bounds)
-            if where_cond:
-                self._sql_query += " WHERE {where_cond} AND".format(
-                    where_cond=where_cond)
-            self._sql_query += " ST_Contains(ST_Transform(clip_relation.geom,{SRID}), ST_Transform(way,{SRID}))".format(
-                SRID=SRID)
-        # No clipping boundary
-        else:
-            self._sql_query += " FROM {schema}.{relation}".format(
-                schema=schema,
-                relation=relation)
-            if where_cond:
-                self._sql_query += " WHERE {where_cond}".format(
-                    where_cond=where_cond)
+            clip_where.append(
+                "ST_Contains(ST_Transform(clip_relation.geom,{SRID}), ST_Transform({geom},{SRID}))".format(
+                    geom=geom_col,
+                    SRID=SRID))
+        # No clipping boundary -> no further conditions
 
-        self.SRID = SRID
-        self.select_cols = select_cols
+        return clip_from, clip_where
+
+    def _compose_query(self, extra_cols=None, extra_where=None, order_by=None,
+                       limit=None):
+        """
+        Assemble SQL statement from the parts set by create_where_query()
+        Protected method used by self.create_where_query() and
+        self.fetch_geoms_paged()
+        :rtype : str
+        :param extra_cols: list of additional columns appended to SELECT
+        :param extra_where: list of additional conditions (joined by AND)
+        :param order_by: ORDER BY expression
+        :param limit: LIMIT of result rows
+        :return: SQL statement
+        """
+        query = self._sql_select
+        if extra_cols:
+            query += ", " + ', '.join(extra_cols)
+        query += self._sql_from
+
+        conditions = self._sql_where + (extra_where or [])
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        if order_by:
+            query += " ORDER BY {order_by}".format(order_by=order_by)
+        if limit:
+            query += " LIMIT {limit:d}".format(limit=limit)
+
+        return query
 
     def insert_custom_query(self, query_text):
         """
@@ -106,22 +539,65 @@ class Query:
         :param query_text:
         """
         self._sql_query = query_text
+        # Query parts of create_where_query() do not apply anymore
+        self._sql_where = None
 
-    def clip_view2poly(self):
+    def validate_geoms(self, repair=True, quarantine=False):
+        """
+        Validate fetched geometries in bulk and repair invalid ones
+        (see Validation.validate_results()). Rows which can't be repaired, or
+        all invalid rows if quarantine is set, are moved to self.quarantine
+        :rtype : collections.Counter
+        :param repair: Repair invalid geometries (shapely.make_valid)
+        :param quarantine: Move invalid rows to self.quarantine instead of
+        repairing them
+        :return: Counter of error types, e.g. {'Self-intersection': 3}
+        """
+        from Validation import validate_results
+
+        self.results, quarantined, report = validate_results(
+            self.results, repair=repair, quarantine=quarantine)
+        self.quarantine = getattr(self, 'quarantine', []) + quarantined
+        self.validation_report = report
+        if report:
+            logger.printmessage.warning(
+                "Invalid geometries: {errors}, {n} row(s) quarantined".format(
+                    errors=", ".join("{e}: {n}".format(e=e, n=n)
+                                     for e, n in report.most_common()),
+                    n=len(quarantined)))
+        return report
+
+    def clip_view2poly(self, validate=False):
         """
         Clips list of n-tuples as result of SELECT-query to boundary of a given
         instance of Region()
+        :param validate: Repair invalid geometries first (see
+        self.validate_geoms()), which otherwise may make predicates fail
         """
         # Todo
         # No real clipping -> [].intersection(...) does not work, 'Assertion failed'-error
+        if validate:
+            self.validate_geoms()
+        # Prepared boundaries are built once by Region and make repeated
+        # predicates cheap. Bbox test rejects far-off geometries early, the
+        # shrunk/grown simplified boundaries decide most candidates without
+        # testing the exact (complex) boundary
+        region = self.region
+        xmin, ymin, xmax, ymax = region.boundary_geom.bounds
         coll = []
         for row in self.results:
             geom = loads(row['geom'])
-            if geom.within(loads(self.region.boundary_polygon)):
+            gxmin, gymin, gxmax, gymax = geom.bounds
+            if gxmin < xmin or gymin < ymin or gxmax > xmax or gymax > ymax:
+                continue
+            if region.inner_boundary.contains(geom) or (
+                    region.outer_boundary.intersects(geom) and
+                    region.prepared_boundary.contains(geom)):
                 coll.append(row)
         self.results = coll
 
-    def string2psycopg_features(self, db_string):
+    @staticmethod
+    def string2psycopg_features(db_string):
         """
         Convert input string containing DB access information in SQLAlchemy
         style format ('user@host:port/database-name')
@@ -139,12 +615,63 @@ class Query:
             logger.printmessage.error(
                 "Please provide DB access information as string 'user@host:port/db'")
 
-    def fetch_geoms(self, source_db):
+    def _connect(self, source_db):
+        """
+        Return context manager providing a DB connection
+        Protected method used by methods fetching data
+        :param source_db: String containing DB access information
+        ('user@host:port/db' for PostgreSQL, 'spatialite://path' or path to
+        *.sqlite file for SpatiaLite, see SQLOperations.BACKENDS) or open
+        DBBackend instance (e.g. holding temporary tables), the latter is not
+        closed on exit. Queries of relations materialized from source_db (or
+        source_db None) are run against the local extract of the region (see
+        self._use_local_extract())
+        :return: context manager returning DBBackend instance
+        """
+        if isinstance(source_db, DBBackend):
+            return contextlib.nullcontext(source_db)
+        if self._use_local_extract(source_db):
+            return SpatiaLiteOperations(self.region.local_extract,
+                                        schemas=(self.region.extract_schema,))
+        return connect(source_db)
+
+    def _use_local_extract(self, source_db):
+        """
+        Check if the query can run against the local extract of the region
+        (see Region.materialize()): it has to be generated by
+        create_where_query() for a materialized relation, clip to the boundary
+        and SRID the extract was clipped to and must not use hstore/jsonb tag
+        operators, which SpatiaLite does not support
+        Protected method used by self._connect()
+        :rtype : bool
+        """
+        region = self.region
+        if not region.local_extract or source_db not in (
+                None, region.extract_source):
+            return False
+        # Custom queries (and collections) may read any relation
+        if self._sql_where is None:
+            return False
+        # Only local boundaries are copied, DB relations (region bounds or
+        # uploaded boundary tables) may not exist in the extract
+        if (region.boundary_table or region.boundary_polygon is None or
+                region.boundary_polygon != region.extract_boundary or
+                self.SRID != region.extract_SRID):
+            return False
+        relation = self._sql_relation.split('.')[-1]
+        # Extracts don't contain whole tags columns either
+        return (relation in region.extract_relations and
+                self._tags_col not in self.select_cols and
+                not uses_tag_operators(self._sql_query))
+
+    def fetch_geoms(self, source_db, page_size=None):
         """
         Fetches items from PostGIS DB and clips results to boundary of supplied
         Region object instance
         :param source_db: String containing information on where to fetch data
-        from
+        from or open DBBackend instance
+        :param page_size: If set, fetch results page-wise using keyset
+        pagination (see self.fetch_geoms_paged())
         :return : List of dictionary with keys 'geom' (containing WKT-formatted
         geometries) and '
         """
@@ -154,8 +681,17 @@ class Query:
         ts = datetime.datetime.now()
 
         # Fetch features from PostGIS DB
-        with DBOperations(**self.string2psycopg_features(source_db)) as conn:
-            view = conn.execute_query(self._sql_query)
+        n = 0
+        if page_size:
+            for page in self.fetch_geoms_paged(source_db, page_size=page_size):
+                self.results.extend(page)
+                n += len(page)
+        else:
+            with self._connect(source_db) as conn:
+                self._expand_columns(conn)
+                view = conn.execute_query(self._sql_query)
+            self.results.extend(self._rows2results(view, conn.columns))
+            n = len(view)
 
         td = datetime.datetime.now() - ts
 
@@ -165,37 +701,252 @@ class Query:
         # Print number of fetched elements
         logger.printmessage.info(
             "Fetched {n} {geoms}(s) in {td_min}m:{td_sec}s\n".format(
-                n=len(view),
+                n=n,
                 geoms=self.geom_type, td_min=min,
                 td_sec=sec))
 
+    def fetch_geoms_paged(self, source_db, page_size=10000, resume_from=None,
+                          key_col='osm_id', unique_key=False):
+        """
+        Generator fetching items from PostGIS DB page by page using keyset
+        pagination ('WHERE (osm_id, ctid) > (last_id, last_ctid) ORDER BY
+        osm_id, ctid LIMIT n'), so that every page is a short, independent
+        transaction (e.g. if server-side cursors are not available behind
+        PgBouncer in transaction mode). osm2pgsql tables repeat osm_ids (split
+        ways, multipolygon parts), so the physical row id of the backend
+        (DBBackend.row_id) makes the key unique. Row ids are not stable: rows
+        updated (or moved by VACUUM FULL/CLUSTER) between pages may be skipped
+        or returned twice, pass unique_key=True to page on key_col alone if
+        it is unique.
+        The key of the last row of each page is checkpointed in
+        self.checkpoint; after a failure pass it as resume_from to continue.
+        :param source_db: String containing information on where to fetch data
+        from
+        :param page_size: Number of rows per page
+        :param resume_from: Checkpoint to resume fetching after (exclusive),
+        (key value, row id) or (key value,) with unique_key
+        :param key_col: Indexed column used as pagination key
+        :param unique_key: key_col is unique, page without row ids
+        :return: Iterator over pages (lists of result dictionaries)
+        :raises PageFetchError: if a page can't be fetched, carrying the
+        checkpoint to resume from
+        """
+        if self._sql_where is None:
+            raise ValueError("Keyset pagination requires a query generated by "
+                             "create_where_query()")
+
+        key = "{relation}.{key_col}".format(relation=self._sql_relation,
+                                            key_col=key_col)
+        self.checkpoint = resume_from
+
+        with self._connect(source_db) as conn:
+            self._expand_columns(conn)
+            keys = [key]
+            if not unique_key:
+                keys.append("{relation}.{row_id}".format(
+                    relation=self._sql_relation, row_id=conn.row_id))
+            while True:
+                extra_where = []
+                if self.checkpoint is not None:
+                    values = [quote_literal(v) if isinstance(v, str) else v
+                              for v in self.checkpoint[:1]]
+                    if not unique_key:
+                        values.append(conn.row_id_literal(self.checkpoint[1]))
+                    extra_where.append("({keys}) > ({values})".format(
+                        keys=', '.join(keys),
+                        values=', '.join(str(v) for v in values)))
+                view = conn.execute_query(
+                    self._compose_query(extra_cols=keys,
+                                        extra_where=extra_where,
+                                        order_by=', '.join(keys),
+                                        limit=page_size))
+                # Close transaction after every page
+                conn.commit()
+
+                if view is None:
+                    raise PageFetchError(self.checkpoint)
+                if not view:
+                    return
+
+                self.checkpoint = tuple(view[-1][-len(keys):])
+                yield self._rows2results(view, conn.columns,
+                                         geom_index=-len(keys) - 1)
+
+                if len(view) < page_size:
+                    return
+
+    def stream_geoms(self, source_db, batch_size=10000, paged=False):
+        """
+        Generator fetching items batch by batch without keeping them in
+        self.results, via a server-side cursor (one long-running statement) or
+        keyset pagination (see self.fetch_geoms_paged())
+        :param source_db: String containing information on where to fetch data
+        from or open DBBackend instance
+        :param batch_size: Number of rows per batch
+        :param paged: Use keyset pagination instead of a server-side cursor
+        :return: Iterator over batches (lists of ResultRow)
+        """
+        if paged:
+            for page in self.fetch_geoms_paged(source_db, page_size=batch_size):
+                yield page
+            return
+
+        with self._connect(source_db) as conn:
+            self._expand_columns(conn)
+            for view in conn.iter_query(self._sql_query, batch_size):
+                yield self._rows2results(view, conn.columns)
 
-        # Transform results ('view') to list of dictionaries
-        for row in view:
-            dictionary = {'properties': {}}
-            for i, tag in enumerate(self.select_cols):
-                dictionary['properties'][tag] = row[i]
-            dictionary['geom'] = row[-1]
-            self.results.append(dictionary)
+    def _rows2results(self, view, columns=None, geom_index=-1):
+        """
+        Transform results ('view') to list of dictionaries
+        Protected method used by self.fetch_geoms() and self.fetch_geoms_paged()
+        :rtype : list
+        :param view: list of row tuples as returned by DBOperations
+        :param columns: column names of rows as returned by DBOperations,
+        self.select_cols if None
+        :param geom_index: index of WKT geometry within row tuples
+        :return: list of ResultRow instances
+        """
+        columns = columns[:geom_index] if columns else self.select_cols
+        return [ResultRow(dict(zip(columns, row)), row[geom_index])
+                for row in view]
+
+    def spatial_join(self, other, predicate='intersects', distance=None,
+                     how='index', processes=None):
+        """
+        Spatially join fetched results with those of another Query() or
+        OSMCollection() instance in memory (see SpatialJoin.spatial_join())
+        :param other: Query or OSMCollection instance
+        :param predicate: 'intersects', 'within', 'contains', 'nearest' or
+        'dwithin'
+        :param distance: Distance in units of the results' SRID
+        :param how: 'index' (array of index pairs) or 'rows' (row tuples)
+        :param processes: Number of worker processes for large inputs
+        :return: Joined index pairs or rows
+        """
+        from SpatialJoin import spatial_join
+
+        return spatial_join(self, other, predicate=predicate,
+                            distance=distance, how=how, processes=processes)
+
+    def to_crs(self, SRID):
+        """
+        Reproject fetched results on the client, e.g. to feed outputs in
+        several coordinate reference systems from one fetch (see
+        Reprojection.to_crs()). Plotting expects results in EPSG:4326
+        :rtype : Query
+        :param SRID: EPSG code to transform to
+        :return: Copy of this instance with reprojected results
+        """
+        from Reprojection import to_crs
+
+        return to_crs(self, SRID)
 
     def print_results(self, n=1000):
         """
         Print fetched results as nicely formatted table
         :param n: Limit of result rows to display
         """
+        from prettytable import PrettyTable
+
         try:
             t = PrettyTable(self.results[0]['properties'].keys())
-            if len(self.results) <= n:
-                [t.add_row(row['properties'].values()) for row in self.results]
-                print(t)
-            else:
-                [t.add_row(row['properties'].values())
-                 for row in self.results[0:n]]
-                print(t)
+            for row in self.results[:n]:
+                t.add_row(row['properties'].values())
+            print(t)
+            if len(self.results) > n:
                 print("(List truncated to {x} elements)".format(x=n))
         except IndexError:
             logger.printmessage.warning("No Results to display!")
 
+    def write_results(self, fp=None, fmt='table', source_db=None,
+                      batch_size=10000, paged=False, geom=False, n=None,
+                      sample=100, max_width=40):
+        """
+        Write results row by row as they arrive, e.g. to pipe large results
+        into other tools ('| head', '| jq') without buffering them
+        :param fp: File-like object to write to, sys.stdout if None
+        :param fmt: 'table' (aligned text), 'csv' or 'ndjson' (one JSON
+        object per line)
+        :param source_db: Stream results from DB (see self.stream_geoms()),
+        write already fetched results if None
+        :param batch_size: Number of rows fetched per batch
+        :param paged: Use keyset pagination instead of a server-side cursor
+        :param geom: Include WKT geometries (column 'geom')
+        :param n: Maximum number of rows to write, all if None
+        :param sample: Number of leading rows column widths of tables are
+        computed from (only they are buffered)
+        :param max_width: Maximum column width of tables, longer values are
+        truncated
+        :return: Number of written rows
+        """
+        import csv
+        import itertools
+        import sys
+
+        fp = fp or sys.stdout
+        if source_db:
+            batches = self.stream_geoms(source_db, batch_size=batch_size,
+                                        paged=paged)
+        else:
+            batches = iter([self.results])
+        rows = itertools.chain.from_iterable(batches)
+        if n is not None:
+            rows = itertools.islice(rows, n)
+
+        def as_records(rows):
+            for row in rows:
+                record = dict(row['properties'])
+                if geom:
+                    record['geom'] = row['geom']
+                yield record
+
+        records = as_records(rows)
+        count = 0
+        try:
+            if fmt == 'ndjson':
+                for record in records:
+                    fp.write(json.dumps(record, default=str) + "\n")
+                    count += 1
+            elif fmt == 'csv':
+                writer = None
+                for record in records:
+                    if writer is None:
+                        writer = csv.DictWriter(fp, fieldnames=list(record))
+                        writer.writeheader()
+                    writer.writerow(record)
+                    count += 1
+            else:
+                head = list(itertools.islice(records, sample))
+                if not head:
+                    logger.printmessage.warning("No Results to display!")
+                    return 0
+                cols = list(head[0])
+                widths = [min(max([len(col)] +
+                                  [len(str(r[col])) for r in head
+                                   if r[col] is not None]), max_width)
+                          for col in cols]
+                line = " | ".join("{{{i}:<{w}.{w}}}".format(i=i, w=w)
+                                  for i, w in enumerate(widths)) + "\n"
+                fp.write(line.format(*cols))
+                fp.write("-+-".join("-" * w for w in widths) + "\n")
+                for record in itertools.chain(head, records):
+                    fp.write(line.format(*["" if v is None else str(v)
+                                           for v in record.values()]))
+                    count += 1
+            fp.flush()
+        except BrokenPipeError:
+            # Reader went away (e.g. '| head'), silence further writes to
+            # stdout during interpreter shutdown
+            if fp is sys.stdout:
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, sys.stdout.fileno())
+        finally:
+            # Close DB connection/cursor of interrupted streams
+            if hasattr(batches, 'close'):
+                batches.close()
+        return count
+
     def _get_vectors_from_postgis_map(self, bm, geom):
         """
         Create vector collection from given shapely geometries
@@ -205,30 +956,23 @@ class Query:
         :param geom: shapely geometry object
         :return:
         """
+        import numpy as np
+
+        # Multi-part geometries and collections are drawn part by part
+        if hasattr(geom, 'geoms'):
+            vectors = []
+            for part in geom.geoms:
+                vectors.extend(self._get_vectors_from_postgis_map(bm, part))
+            return vectors
+
+        if geom.geom_type == 'Polygon':
+            rings = [geom.exterior] + list(geom.interiors)
+        else:
+            rings = [geom]
         vectors = []
-        # Try handling input as Point, Polygon, Linestring, ...
-        try:
-            for el in geom:
-                try:
-                    coords = list(el.coords)
-                except NotImplementedError:
-                    coords = list(list(el.exterior.coords))
-
-                seg = []
-                for coord in coords:
-                    seg.append(bm(coord[0], coord[1]))
-                vectors.append(np.asarray(seg))
-        # If TypeError try accessing structure of Multi*-objects (MultiPolygon, ...)
-        except TypeError:
-            seg = []
-            try:
-                coords = list(geom.coords)
-            except NotImplementedError:
-                coords = list(geom.exterior.coords)
-
-            for coord in coords:
-                seg.append(bm(coord[0], coord[1]))
-            vectors.append(np.asarray(seg))
+        for ring in rings:
+            xs, ys = ring.xy
+            vectors.append(np.column_stack(bm(np.asarray(xs), np.asarray(ys))))
         return vectors
 
     def bbox_of_view(self, results):
@@ -239,79 +983,57 @@ class Query:
         :param results: return dict of fetch_geoms(...)
         :return: bbox dict {'xmin':float, 'xmax':float, ...}
         """
-        try:
-            # Define initial values for view's bbox
-            geom_shapely = loads(results[0]['geom'])
-            geom_bounds = geom_shapely.bounds
-            bbox = {'xmin': geom_bounds[0],
-                    'ymin': geom_bounds[1],
-                    'xmax': geom_bounds[2],
-                    'ymax': geom_bounds[3]}
-        except:
+        if not results:
             logger.printmessage.warning("Error: Empty view, cannot plot any results!")
             return None
 
+        # Bounds of geometries cover all parts of multi-part geometries
+        bbox = None
         for result in results:
-            geom_shapely = loads(result['geom'])
-            try:
-                if min(geom_shapely.xy[0]) < bbox['xmin']:
-                    bbox['xmin'] = min(geom_shapely.xy[0])
-                if min(geom_shapely.xy[1]) < bbox['ymin']:
-                    bbox['ymin'] = min(geom_shapely.xy[1])
-                if max(geom_shapely.xy[0]) > bbox['xmax']:
-                    bbox['xmax'] = max(geom_shapely.xy[0])
-                if max(geom_shapely.xy[1]) > bbox['ymax']:
-                    bbox['ymax'] = max(geom_shapely.xy[1])
-            # Catch exception if type=Polygon
-            except NotImplementedError:
-                if min(geom_shapely.exterior.xy[0]) < bbox['xmin']:
-                    bbox['xmin'] = min(geom_shapely.exterior.xy[0])
-                if min(geom_shapely.exterior.xy[1]) < bbox['ymin']:
-                    bbox['ymin'] = min(geom_shapely.exterior.xy[1])
-                if max(geom_shapely.exterior.xy[0]) > bbox['xmax']:
-                    bbox['xmax'] = max(geom_shapely.exterior.xy[0])
-                if max(geom_shapely.exterior.xy[1]) > bbox['ymax']:
-                    bbox['ymax'] = max(geom_shapely.exterior.xy[1])
+            xmin, ymin, xmax, ymax = loads(result['geom']).bounds
+            if bbox is None:
+                bbox = {'xmin': xmin, 'ymin': ymin, 'xmax': xmax, 'ymax': ymax}
+                continue
+            bbox['xmin'] = min(bbox['xmin'], xmin)
+            bbox['ymin'] = min(bbox['ymin'], ymin)
+            bbox['xmax'] = max(bbox['xmax'], xmax)
+            bbox['ymax'] = max(bbox['ymax'], ymax)
 
         return (bbox['xmin'], bbox['ymin'], bbox['xmax'], bbox['ymax'])
 
-    def _prepare_plot(self, resolution="i"):
+    def _prepare_plot(self, resolution="i", backdrop='vector',
+                      backdrop_dir=None, ax=None):
         """
         Prepare basemap for plotting results of some query
         :rtype: Basemap
         :param resolution: Set basemap resolution / area threshold that shall
         still be displayed (see Basemap documentation for further details)
+        :param backdrop: 'vector' draws coastlines, land/sea mask and countries,
+        'raster' draws a pre-rendered image of those (see get_backdrop())
+        :param backdrop_dir: Directory of pre-rendered backdrops
+        :param ax: Axes to draw on, current axes if None
         :return: Basemap
         """
-        # Determine bounding box if no clipping boundary was supplied
-        if not self.region.bounds or type(self.region.bounds) == str:
+        # Determine bounding box if no clipping boundary was supplied, the
+        # region itself is left untouched (it may be shared by other queries)
+        bounds = self.region.bounds
+        if not bounds or type(bounds) == str:
             if isinstance(self, OSMCollection):
                 if hasattr(self, 'Points'):
-                    self.region.bounds = self.bbox_of_view(self.Points.results)
+                    bounds = self.bbox_of_view(self.Points.results)
                 elif hasattr(self, 'Lines'):
-                    self.region.bounds = self.bbox_of_view(self.Lines.results)
+                    bounds = self.bbox_of_view(self.Lines.results)
                 elif hasattr(self, 'Polygons'):
-                    self.region.bounds = self.bbox_of_view(
-                        self.Polygons.results)
+                    bounds = self.bbox_of_view(self.Polygons.results)
             else:
-                self.region.bounds = self.bbox_of_view(self.results)
-
-        bbox = {'xmin': self.region.bounds[0],
-                'ymin': self.region.bounds[1],
-                'xmax': self.region.bounds[2],
-                'ymax': self.region.bounds[3]}
-
-        m = Basemap(resolution=resolution,
-                    projection='merc',
-                    llcrnrlat=bbox['ymin'] - 0.02,
-                    urcrnrlat=bbox['ymax'] + 0.02,
-                    llcrnrlon=bbox['xmin'] - 0.02,
-                    urcrnrlon=bbox['xmax'] + 0.02,
-                    lat_ts=(bbox['xmin'] +
-                            bbox['xmax']) / 2)
-        m.drawcoastlines()
-        m.drawlsmask(land_color='white', ocean_color='aqua', lakes=True)
-        m.drawcountries()
+                bounds = self.bbox_of_view(self.results)
+
+        m = get_basemap(bounds, resolution)
+        if backdrop == 'raster':
+            m.imshow(get_backdrop(bounds, resolution, backdrop_dir),
+                     origin='upper', ax=ax)
+        else:
+            draw_backdrop(m, ax=ax)
 
         return m
 
@@ -325,25 +1047,27 @@ class Query:
         :param el_limit: Maximum number of elements to display on map
         :return: subplot instance
         """
+        from matplotlib.collections import LineCollection
+
         # Collect fetched geometries
         if not len(query_object.results) > el_limit:
-            try:
-                for el in query_object.results:
-                    vectors = query_object._get_vectors_from_postgis_map(m,
-                                                                         loads(
-                                                                             el[
-                                                                                 'geom']))
-                    lines = LineCollection(vectors, antialiaseds=(1,))
-                    if not query_object.geom_type == 'LineString':
-                        lines.set_facecolors('red')
-                    lines.set_linewidth(0.25)
-                    ax.add_collection(lines)
-            # If AttributeError assume geom_type 'Point', simply collect all
-            # points and perform scatterplot
-            except AttributeError:
-                xy = m(
-                    [loads(point['geom']).x for point in query_object.results],
-                    [loads(point['geom']).y for point in query_object.results])
+            points = []
+            for el in query_object.results:
+                geom = loads(el['geom'])
+                # Simply collect all (multi)points and perform scatterplot
+                if geom.geom_type in ('Point', 'MultiPoint'):
+                    points.extend(geom.geoms if hasattr(geom, 'geoms')
+                                  else [geom])
+                    continue
+                vectors = query_object._get_vectors_from_postgis_map(m, geom)
+                lines = LineCollection(vectors, antialiaseds=(1,))
+                if not query_object.geom_type == 'LineString':
+                    lines.set_facecolors('red')
+                lines.set_linewidth(0.25)
+                ax.add_collection(lines)
+            if points:
+                xy = m([point.x for point in points],
+                       [point.y for point in points])
                 ax.scatter(xy[0], xy[1])
 
                 # # Add clipping border
@@ -361,26 +1085,249 @@ class Query:
 
         return ax
 
-    def plot_view(self, resolution='i', el_limit=5000):
+    def _draw_layers(self, ax, m, el_limit=5000):
+        """
+        Draw fetched geometries onto ax
+        Protected method used by self.render()
+        """
+        self._collect_geoms(self, ax, m, el_limit=el_limit)
+
+    def render(self, filepath=None, resolution='i', el_limit=5000,
+               backdrop='vector', backdrop_dir=None, fig=None, dpi=100):
+        """
+        Render map of fetched geometries without using pyplot's global state
+        (no window is opened, usable in headless batch jobs)
+        :rtype: Figure
+        :param filepath: Save map to file, format by extension (png, svg, pdf)
+        :param resolution: Set basemap resolution / area threshold that shall
+        still be displayed
+        :param el_limit: Maximum number of elements to display on map
+        :param backdrop: 'vector' or 'raster' (pre-rendered, see
+        get_backdrop())
+        :param backdrop_dir: Directory of pre-rendered backdrops
+        :param fig: Figure to draw on, new (non-interactive) figure if None
+        :param dpi: Resolution of saved raster images
+        :return: Figure
+        """
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        if fig is None:
+            fig = Figure()
+            FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        m = self._prepare_plot(resolution=resolution, backdrop=backdrop,
+                               backdrop_dir=backdrop_dir, ax=ax)
+        self._draw_layers(ax, m, el_limit=el_limit)
+
+        ax.set_title("{name} - total: {n} {geoms}(s)".format(
+            name=self.query_name, n=len(self.results), geoms=self.geom_type))
+        if filepath:
+            fig.savefig(filepath, dpi=dpi)
+        return fig
+
+    def plot_view(self, resolution='i', el_limit=5000, backdrop='vector',
+                  backdrop_dir=None):
         """
         Show map of fetched geometries
         :param resolution: Set basemap resolution / area threshold that shall
         still be displayed
         :param el_limit: Maximum number of elements to display on map
+        :param backdrop: 'vector' or 'raster' (pre-rendered, see
+        get_backdrop())
+        :param backdrop_dir: Directory of pre-rendered backdrops
         """
-        ax = plt.subplot(111)
-        m = self._prepare_plot(resolution=resolution)
-        self._collect_geoms(self, ax, m, el_limit=el_limit)
+        import matplotlib.pyplot as plt
+
+        self.render(resolution=resolution, el_limit=el_limit,
+                    backdrop=backdrop, backdrop_dir=backdrop_dir,
+                    fig=plt.figure())
+        plt.show()
 
-        plt.title("{name} - total: {n} {geoms}(s)".format(
+    def density_grid(self, cell_size, value='count', source_db=None,
+                     bounds=None):
+        """
+        Aggregate results into a raster grid of feature counts, line lengths
+        or polygon areas per cell (measured at the feature's centroid). With
+        source_db, aggregation is done by the DB server (ST_SnapToGrid
+        grouping of the generated query), otherwise fetched results are
+        binned vectorized on the client. Grid is stored in self.density.
+        :rtype : numpy.ndarray
+        :param cell_size: Cell size in units of self.SRID
+        :param value: 'count', 'length' or 'area'
+        :param source_db: String containing DB access information, None bins
+        fetched results
+        :param bounds: (xmin, ymin, xmax, ymax) of grid, bounds of region
+        boundary or fetched results if None
+        :return: 2D array, first row is the northern most one
+        :raises ValueError: if bounds are None and neither the region
+        boundary geometry nor results are available (e.g. regions linked to a
+        DB relation aggregated by source_db)
+        """
+        import numpy as np
+
+        if bounds is None:
+            if self.region.boundary_geom is not None:
+                bounds = self.region.boundary_geom.bounds
+            elif self.results:
+                bounds = self.bbox_of_view(self.results)
+            else:
+                raise ValueError("Grid bounds unknown for region {name} "
+                                 "without boundary geometry or results, pass "
+                                 "bounds".format(name=self.region.name))
+        xmin, ymin, xmax, ymax = bounds
+        n_cols = max(int(np.ceil((xmax - xmin) / cell_size)), 1)
+        n_rows = max(int(np.ceil((ymax - ymin) / cell_size)), 1)
+        grid = np.zeros((n_rows, n_cols))
+
+        if source_db:
+            measures = {'count': "count(*)",
+                        'length': "sum(ST_Length(geom))",
+                        'area': "sum(ST_Area(geom))"}
+            # Centroids snap to the nearest cell center
+            sql = ("SELECT ST_X(cell), ST_Y(cell), {measure} FROM ("
+                   "SELECT ST_SnapToGrid(ST_Centroid(geom), {x0}, {y0}, {size}, "
+                   "{size}) AS cell, geom FROM (SELECT ST_Transform({geom_col},"
+                   "{SRID}) AS geom{from_}{where}) AS features) AS cells "
+                   "GROUP BY cell").format(
+                       measure=measures[value],
+                       x0=xmin + cell_size / 2.,
+                       y0=ymin + cell_size / 2.,
+                       size=cell_size,
+                       geom_col=self._geom_col,
+                       SRID=self.SRID,
+                       from_=self._sql_from,
+                       where=" WHERE " + " AND ".join(self._sql_where)
+                       if self._sql_where else "")
+            with self._connect(source_db) as conn:
+                view = conn.execute_query(sql)
+            for x, y, v in view or []:
+                col = int(round((x - xmin - cell_size / 2.) / cell_size))
+                row = int(round((y - ymin - cell_size / 2.) / cell_size))
+                if 0 <= row < n_rows and 0 <= col < n_cols:
+                    grid[n_rows - 1 - row, col] += v
+        elif self.results:
+            import shapely
+            geoms = shapely.from_wkt([row['geom'] for row in self.results])
+            xy = shapely.get_coordinates(shapely.centroid(geoms))
+            weights = {'count': None,
+                       'length': shapely.length(geoms),
+                       'area': shapely.area(geoms)}[value]
+            hist, _, _ = np.histogram2d(
+                xy[:, 1], xy[:, 0], bins=(n_rows, n_cols),
+                range=((ymin, ymin + n_rows * cell_size),
+                       (xmin, xmin + n_cols * cell_size)),
+                weights=weights)
+            grid = hist[::-1]
+
+        self.density = {'grid': grid,
+                        # Cells are counted from (xmin, ymin)
+                        'bounds': (xmin, ymin, xmin + n_cols * cell_size,
+                                   ymin + n_rows * cell_size),
+                        'cell_size': cell_size}
+        return grid
+
+    def render_density(self, filepath=None, resolution='i', cmap='hot_r',
+                       backdrop='vector', backdrop_dir=None, fig=None,
+                       dpi=100):
+        """
+        Render map of density grid computed by density_grid() as image layer,
+        render time is independent of the number of features
+        :rtype: Figure
+        :param filepath: Save map to file, format by extension (png, svg, pdf)
+        :param resolution: Set basemap resolution / area threshold that shall
+        still be displayed
+        :param cmap: Matplotlib colormap
+        :param backdrop: 'vector' or 'raster' (pre-rendered, see
+        get_backdrop())
+        :param backdrop_dir: Directory of pre-rendered backdrops
+        :param fig: Figure to draw on, new (non-interactive) figure if None
+        :param dpi: Resolution of saved raster images
+        :return: Figure
+        """
+        import numpy as np
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        if fig is None:
+            fig = Figure()
+            FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        m = self._prepare_plot(resolution=resolution, backdrop=backdrop,
+                               backdrop_dir=backdrop_dir, ax=ax)
+        grid = self.density['grid']
+        xmin, ymin, xmax, ymax = self.density['bounds']
+        lons, lats = np.meshgrid(np.linspace(xmin, xmax, grid.shape[1] + 1),
+                                 np.linspace(ymax, ymin, grid.shape[0] + 1))
+        mesh = m.pcolormesh(lons, lats, np.ma.masked_equal(grid, 0),
+                            latlon=True, cmap=cmap, ax=ax)
+        m.colorbar(mesh, fig=fig, ax=ax)
+
+        ax.set_title("{name} - density of {n} {geoms}(s)".format(
             name=self.query_name, n=len(self.results), geoms=self.geom_type))
+        if filepath:
+            fig.savefig(filepath, dpi=dpi)
+        return fig
+
+    def plot_density(self, resolution='i', cmap='hot_r', backdrop='vector',
+                     backdrop_dir=None):
+        """
+        Show map of density grid computed by density_grid()
+        :param resolution: Set basemap resolution / area threshold that shall
+        still be displayed
+        :param cmap: Matplotlib colormap
+        :param backdrop: 'vector' or 'raster' (pre-rendered, see
+        get_backdrop())
+        :param backdrop_dir: Directory of pre-rendered backdrops
+        """
+        import matplotlib.pyplot as plt
+
+        self.render_density(resolution=resolution, cmap=cmap,
+                            backdrop=backdrop, backdrop_dir=backdrop_dir,
+                            fig=plt.figure())
         plt.show()
 
-    def export2shp(self, filepath):
+    def export_density2tif(self, filepath):
+        """
+        Save density grid computed by density_grid() as GeoTIFF (requires
+        rasterio)
+        :param filepath: output path
+        """
+        import rasterio
+        from rasterio.transform import from_origin
+
+        grid = self.density['grid']
+        xmin, ymin, xmax, ymax = self.density['bounds']
+        with rasterio.open(filepath, 'w', driver='GTiff',
+                           height=grid.shape[0], width=grid.shape[1], count=1,
+                           dtype='float32', crs="EPSG:{SRID}".format(SRID=self.SRID),
+                           transform=from_origin(xmin, ymax,
+                                                 self.density['cell_size'],
+                                                 self.density['cell_size'])) as dst:
+            dst.write(grid.astype('float32'), 1)
+        logger.printmessage.info("Saved file to {fp}".format(fp=filepath))
+
+    def export2shp(self, filepath, validate=True):
         """
         Save results to hard disk
         :param filepath: output path
+        :param validate: Repair invalid geometries first (see
+        self.validate_geoms())
         """
+        import fiona  # handling ESRI shape format
+        from shapely.geometry import mapping
+
+        # Export repaired copies of invalid rows, self.results is left as is
+        results = self.results
+        if validate and results:
+            from Validation import validate_results
+
+            results, quarantined, report = validate_results(results)
+            if quarantined:
+                logger.printmessage.warning(
+                    "Skipped {n} invalid row(s) without usable geometry: "
+                    "{errors}".format(n=len(quarantined),
+                                      errors=dict(report)))
 
         def ESRI_schema_from_view():
             """
@@ -389,14 +1336,16 @@ class Query:
             """
 
             schema = {}
-            schema['geometry'] = loads(self.results[0]['geom']).type
+            # Shapefile layers of type Polygon also hold MultiPolygons
+            schema['geometry'] = loads(
+                results[0]['geom']).geom_type.replace('Multi', '')
             schema['properties'] = {}
             # Initially set every type to NoneValue
-            for key in self.results[0]['properties']:
+            for key in results[0]['properties']:
                 schema['properties'][key] = None
             # Go through result rows and if type!=None set type(value) as schema
             # type
-            for r in self.results:
+            for r in results:
                 for key in r['properties']:
                     if r['properties'][key]:
                         schema['properties'][key] = type(
@@ -406,12 +1355,12 @@ class Query:
             return schema
 
         # Save result to disk using fiona-package
-        if not self.results == []:
+        if not results == []:
             # Create schema for ESRI-shape export
             schema = ESRI_schema_from_view()
             with fiona.collection(filepath, 'w',
                                   'ESRI Shapefile', schema) as output:
-                for row in self.results:
+                for row in results:
                     output.write({
                         'properties': row['properties'],
                         'geometry': mapping(loads(row['geom']))})
@@ -421,19 +1370,19 @@ class Query:
 
 
 class Points(Query):
-    def __init__(self, name, region=Region()):
+    def __init__(self, name, region=None):
         super(Points, self).__init__(name=name, region=region)
         self.geom_type = 'Point'
 
 
 class Lines(Query):
-    def __init__(self, name, region=Region()):
+    def __init__(self, name, region=None):
         super(Lines, self).__init__(name=name, region=region)
         self.geom_type = 'LineString'
 
 
 class Polygons(Query):
-    def __init__(self, name, region=Region()):
+    def __init__(self, name, region=None):
         super(Polygons, self).__init__(name=name, region=region)
         self.geom_type = 'Polygon'
 
@@ -451,28 +1400,28 @@ class Polygons(Query):
 
 
 class OSMQuery(Query):
-    def __init__(self, name=None, region=Region()):
+    def __init__(self, name=None, region=None):
         super(OSMQuery, self).__init__(name=name, region=region)
 
 
 class OSMPoints(OSMQuery, Points):
-    def __init__(self, name, region=Region()):
+    def __init__(self, name, region=None):
         super(OSMPoints, self).__init__(name=name, region=region)
 
 
 class OSMLines(OSMQuery, Lines):
-    def __init__(self, name, region=Region()):
+    def __init__(self, name, region=None):
         super(OSMQuery, self).__init__(name=name, region=region)
 
 
 class OSMPolygons(OSMQuery, Polygons):
-    def __init__(self, name, region=Region()):
+    def __init__(self, name, region=None):
         super(OSMQuery, self).__init__(name=name, region=region)
 
 
 class OSMCollection(OSMQuery):
     def __init__(self, name=None,
-                 region=Region(),
+                 region=None,
                  points=True,
                  lines=True,
                  polygons=True):
@@ -491,7 +1440,12 @@ class OSMCollection(OSMQuery):
                                 select_cols="*",
                                 geom_col='way',
                                 where_cond=None,
-                                SRID=4326):
+                                SRID=4326,
+                                tag_filters=None,
+                                tag_cols=None,
+                                tags_col='tags',
+                                tags_type='hstore',
+                                make_valid=False):
         """
         Automatically generate and set a collective select/from/where SQL
         statement from given query features for a collection of OSMPoints and/or
@@ -503,6 +1457,11 @@ class OSMCollection(OSMQuery):
         :param where_cond: Where condition for query
         :param geom_col: Column containing geometries
         :param SRID: Spatial Reference ID
+        :param tag_filters: Filters on tags column (see create_where_query())
+        :param tag_cols: Tag keys to return as properties
+        :param tags_col: Column containing tags
+        :param tags_type: Type of tags column, 'hstore' or 'jsonb'
+        :param make_valid: Repair geometries in the DB (ST_MakeValid)
         """
         args = locals()
         args.__delitem__('self')
@@ -535,15 +1494,112 @@ class OSMCollection(OSMQuery):
         if hasattr(self, 'Polygons'):
             self.Polygons.fetch_geoms(source_db)
 
-    def plot_view(self, resolution='i', el_limit=5000):
+    def create_join_query(self,
+                          relation_prefix,
+                          left='Points',
+                          right='Polygons',
+                          predicate='dwithin',
+                          distance=0,
+                          left_cols=('osm_id',),
+                          right_cols=('osm_id',),
+                          left_where=None,
+                          right_where=None,
+                          schema="public",
+                          geom_col='way',
+                          SRID=4326):
         """
-        METHOD OVERRIDING: Plot collected geometries of OSMCollection
-        :param resolution: Set basemap resolution / area threshold that shall
-        still be displayed
-        :param el_limit: Maximum number of elements to display on map
+        Automatically generate and set a single SQL statement spatially joining
+        two OSM layers (e.g. schools near parks) on the DB server. Predicates
+        are evaluated on the indexed geometry columns in their native SRID,
+        only joined pairs are transferred. The left layer is clipped to
+        self.region like in create_where_query()
+        :param relation_prefix: OSM table name prefix (suffix is being added
+        automatically)
+        :param left: Left layer ('Points', 'Lines' or 'Polygons')
+        :param right: Right layer ('Points', 'Lines' or 'Polygons')
+        :param predicate: 'dwithin', 'intersects', 'within' (left within right)
+        or 'contains' (left contains right)
+        :param distance: Distance for predicate 'dwithin' in units of the
+        native SRID
+        :param left_cols: Columns to select from left layer
+        :param right_cols: Columns to select from right layer
+        :param left_where: Where condition for left layer
+        :param right_where: Where condition for right layer
+        :param schema: DB schema to query
+        :param geom_col: Column containing geometries
+        :param SRID: Spatial Reference ID of returned geometries
+        """
+        suffixes = {'Points': "_point", 'Lines': "_line", 'Polygons': "_polygon"}
+        predicates = {
+            'dwithin': "ST_DWithin(l.{geom}, r.{geom}, {distance})",
+            'intersects': "ST_Intersects(l.{geom}, r.{geom})",
+            'within': "ST_Within(l.{geom}, r.{geom})",
+            'contains': "ST_Contains(l.{geom}, r.{geom})"}
+
+        def layer_subquery(layer, where_cond, clip):
+            # Subqueries are flattened by the planner, indexes remain usable
+            relation = "{schema}.{relation}".format(
+                schema=schema,
+                relation=relation_prefix + suffixes[layer])
+            conditions = [where_cond] if where_cond else []
+            clip_from = ""
+            if clip:
+                clip_from, clip_where = self._region_clause(geom_col, SRID)
+                conditions.extend(clip_where)
+            subquery = "(SELECT {relation}.* FROM {relation}{clip_from}".format(
+                relation=relation,
+                clip_from=clip_from)
+            if conditions:
+                subquery += " WHERE " + " AND ".join(conditions)
+            return subquery + ")"
+
+        select = ["l.{col}".format(col=col) for col in left_cols]
+        select.append("ST_AsText(ST_Transform(l.{geom},{SRID}))".format(
+            geom=geom_col, SRID=SRID))
+        select.extend(["r.{col}".format(col=col) for col in right_cols])
+        select.append("ST_AsText(ST_Transform(r.{geom},{SRID}))".format(
+            geom=geom_col, SRID=SRID))
+
+        self._sql_join_query = "SELECT {select} FROM {left} AS l JOIN {right} AS r ON {on}".format(
+            select=', '.join(select),
+            left=layer_subquery(left, left_where, clip=True),
+            right=layer_subquery(right, right_where, clip=False),
+            on=predicates[predicate].format(geom=geom_col, distance=distance))
+
+        self._join_cols = (list(left_cols), list(right_cols))
+        self.SRID = SRID
+
+    def fetch_join(self, source_db):
+        """
+        Fetch joined pairs generated by create_join_query()
+        :param source_db: String containing information on where to fetch data
+        from or open DBBackend instance
+        :return: List of (left row, right row) tuples of result dictionaries,
+        also stored in self.join_results
+        """
+        logger.printmessage.info("Querying DATABASE for joined pairs...")
+        with self._connect(source_db) as conn:
+            view = conn.execute_query(self._sql_join_query)
+
+        left_cols, right_cols = self._join_cols
+        n_left = len(left_cols) + 1
+        self.join_results = []
+        for row in view or []:
+            left_row = ResultRow(dict(zip(left_cols, row[:n_left - 1])),
+                                 row[n_left - 1])
+            right_row = ResultRow(dict(zip(right_cols, row[n_left:-1])),
+                                  row[-1])
+            self.join_results.append((left_row, right_row))
+
+        logger.printmessage.info("Fetched {n} joined pair(s)".format(
+            n=len(self.join_results)))
+        return self.join_results
+
+    def _draw_layers(self, ax, m, el_limit=5000):
+        """
+        METHOD OVERRIDING: Draw collected geometries of OSMCollection
+        Protected method used by self.render()
         """
-        ax = plt.subplot(111)
-        m = self._prepare_plot(resolution=resolution)
         if hasattr(self, 'Points'):
             self._collect_geoms(self.Points, ax, m, el_limit=el_limit)
         if hasattr(self, 'Lines'):
@@ -551,6 +1607,65 @@ class OSMCollection(OSMQuery):
         if hasattr(self, 'Polygons'):
             self._collect_geoms(self.Polygons, ax, m, el_limit=el_limit)
 
-        plt.title("{name} - total: {n} {geoms}(s)".format(
-            name=self.query_name, n=len(self.results), geoms=self.geom_type))
-        plt.show()
+
+def _render_job(job):
+    """
+    Fetch (optional), clip and render one query in a worker process
+    Protected function used by render_batch()
+    """
+    query, region, filepath, source_db, render_args = job
+    layers = [getattr(query, layer) for layer in ('Points', 'Lines', 'Polygons')
+              if hasattr(query, layer)] or [query]
+    if source_db:
+        if isinstance(query, OSMCollection):
+            query.fetch_OSM_collection(source_db)
+        else:
+            query.fetch_geoms(source_db)
+    if region is not None:
+        query.region = region
+        for layer in layers:
+            layer.region = region
+            if region.boundary_geom is not None:
+                layer.clip_view2poly()
+    query.render(filepath, **render_args)
+    return filepath
+
+
+def render_batch(jobs, source_db=None, workers=None, backdrop='raster',
+                 backdrop_dir=None, **render_args):
+    """
+    Render maps of many queries in parallel worker processes, e.g. for
+    nightly reports. Backdrops are pre-rendered once per bbox into
+    backdrop_dir and shared by all workers.
+    :rtype: list
+    :param jobs: iterable of (query, filepath) or (query, region, filepath),
+    results of query are clipped to region if given
+    :param source_db: String containing DB access information, queries are
+    fetched by the workers if given (SQL as generated by create_where_query),
+    otherwise already fetched results are rendered
+    :param workers: Number of worker processes, number of CPUs if None
+    :param backdrop: 'raster' (shared pre-rendered backdrops) or 'vector'
+    :param backdrop_dir: Directory of pre-rendered backdrops, temporary
+    directory if None
+    :param render_args: Further arguments of Query.render(), e.g. resolution
+    :return: list of file paths of rendered maps
+    """
+    render_args.update(backdrop=backdrop, backdrop_dir=backdrop_dir)
+    tasks = []
+    for job in jobs:
+        query, region, filepath = job if len(job) == 3 else (job[0], None,
+                                                             job[1])
+        tasks.append((query, region, filepath, source_db, render_args))
+
+    # Render shared backdrops before forking, instead of once per worker
+    if backdrop == 'raster':
+        resolution = render_args.get('resolution', 'i')
+        for bounds in {(region or query.region).bounds
+                       for query, region, _, _, _ in tasks}:
+            if type(bounds) == tuple:
+                get_backdrop(bounds, resolution, backdrop_dir)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        filepaths = list(executor.map(_render_job, tasks))
+    logger.printmessage.info("Rendered {n} map(s)".format(n=len(filepaths)))
+    return filepaths
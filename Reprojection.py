@@ -0,0 +1,118 @@
+"""
+Client-side reprojection of Query() results, so that one fetch can feed
+outputs in several coordinate reference systems (e.g. EPSG:4326 for the web
+and EPSG:25833 for metric analysis)
+
+Coordinates of all geometries are packed into one array and transformed by a
+single pyproj call. Requires shapely>=2.0 and pyproj
+"""
+import copy
+import functools
+import numpy as np
+import shapely
+from PostGISHelpers import Region, ResultRow
+
+LAYERS = ('Points', 'Lines', 'Polygons')
+
+
+@functools.lru_cache(maxsize=64)
+def get_transformer(from_SRID, to_SRID):
+    """
+    Return (cached) transformer between two EPSG codes, setting up
+    transformers is expensive compared to transforming coordinates
+    :rtype : pyproj.Transformer
+    """
+    from pyproj import Transformer
+
+    return Transformer.from_crs("EPSG:{srid}".format(srid=from_SRID),
+                                "EPSG:{srid}".format(srid=to_SRID),
+                                always_xy=True)
+
+
+def transform_geoms(geoms, from_SRID, to_SRID):
+    """
+    Reproject array of shapely geometries (vectorized)
+    :rtype : numpy.ndarray
+    :param geoms: array of shapely geometries
+    :param from_SRID: EPSG code of geoms
+    :param to_SRID: EPSG code to transform to
+    :return: array of transformed shapely geometries
+    """
+    transformer = get_transformer(from_SRID, to_SRID)
+
+    def transform(coords):
+        return np.column_stack(transformer.transform(coords[:, 0],
+                                                     coords[:, 1]))
+    return shapely.transform(geoms, transform)
+
+
+def reproject_results(results, from_SRID, to_SRID):
+    """
+    Reproject WKT geometries of result rows, properties are shared with the
+    input rows
+    :rtype : list
+    :param results: list of result rows
+    :param from_SRID: EPSG code of results
+    :param to_SRID: EPSG code to transform to
+    :return: list of ResultRow
+    """
+    if from_SRID == to_SRID or not results:
+        return list(results)
+    geoms = transform_geoms(shapely.from_wkt([row['geom'] for row in results]),
+                            from_SRID, to_SRID)
+    return [ResultRow(row['properties'], wkt) for row, wkt in
+            zip(results, shapely.to_wkt(geoms, rounding_precision=-1))]
+
+
+def reproject_region(region, from_SRID, to_SRID):
+    """
+    Region with the boundary geometry reprojected, simplify_tolerance is
+    scaled by the change of the boundary's extent
+    :rtype : Region
+    :param region: Region instance
+    :param from_SRID: EPSG code of the region boundary
+    :param to_SRID: EPSG code to transform to
+    :return: new Region instance, unbounded if the boundary is no local
+    geometry (DB relations can't be reprojected on the client)
+    """
+    if from_SRID == to_SRID:
+        return region
+    if region.boundary_geom is None:
+        return Region()
+    geom = transform_geoms(np.array([region.boundary_geom]), from_SRID,
+                           to_SRID)[0]
+    scale = shapely.length(shapely.envelope(geom).exterior) / \
+        shapely.length(shapely.envelope(region.boundary_geom).exterior)
+    return Region(name="{name} EPSG:{SRID}".format(name=region.name,
+                                                   SRID=to_SRID),
+                  boundary=geom.wkt,
+                  simplify_tolerance=region.simplify_tolerance * scale)
+
+
+def to_crs(query, SRID, region=None):
+    """
+    Copy of Query() or OSMCollection() instance with results and region
+    reprojected to SRID, the fetched instance itself is left untouched. The
+    copy has no SQL statement, the original one fetches in the old SRID.
+    :rtype : Query
+    :param query: Query or OSMCollection instance with fetched results
+    :param SRID: EPSG code to transform to
+    :param region: Reprojected region (see reproject_region()), derived from
+    query.region if None
+    :return: Query instance of the same class
+    """
+    from_SRID = getattr(query, 'SRID', 4326)
+    if region is None:
+        region = reproject_region(query.region, from_SRID, SRID)
+    reprojected = copy.copy(query)
+    reprojected.results = reproject_results(query.results, from_SRID, SRID)
+    reprojected.SRID = SRID
+    reprojected.region = region
+    reprojected._sql_query = None
+    reprojected._sql_where = None
+    # Layers of collections share the reprojected region
+    for layer in LAYERS:
+        if hasattr(query, layer):
+            setattr(reprojected, layer, to_crs(getattr(query, layer), SRID,
+                                               region))
+    return reprojected
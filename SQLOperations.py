@@ -1,12 +1,63 @@
-# Class used to cleanly handle database operations via psycopg2
+# Classes used to cleanly handle database operations via psycopg2 (PostgreSQL/
+# PostGIS) or sqlite3 (SpatiaLite, embedded stand-in for local extracts)
 
-import psycopg2
-import keyring
+# psycopg2 and keyring are imported when the first PostgreSQL connection is
+# set up, SpatiaLite-only jobs never load them
 import datetime
+import re
+import sqlite3
 
 
-class DBOperations():
+class DBBackend():
+    """
+    Base class of DB backends. Backends are context managers providing
+    execute_query(query) -> list of row tuples (None on error, column names in
+    self.columns), execute_command(query) -> bool and commit().
+    """
+    columns = None
+    # Column identifying physical rows, makes keyset pagination keys unique
+    row_id = 'ctid'
+
+    def row_id_literal(self, value):
+        """
+        SQL literal of a row id value as returned in result rows
+        :rtype : str
+        """
+        return "'{value}'::tid".format(value=value)
+
+    def commit(self):
+        """
+        Commit (end) current transaction
+        """
+        self.connection.commit()
+
+    def table_columns(self, relation):
+        """
+        Column names of relation ('schema.table') in table order
+        :rtype : list
+        """
+        schema, _, table = relation.rpartition('.')
+        results = self.execute_query(
+            "SELECT column_name FROM information_schema.columns WHERE "
+            "table_schema = '{schema}' AND table_name = '{table}' ORDER BY "
+            "ordinal_position".format(schema=schema or 'public', table=table))
+        return [row[0] for row in results or []]
+
+    def iter_query(self, query, batch_size=10000):
+        """
+        Generator executing query and yielding result rows in batches (lists
+        of row tuples), backends override this to stream rows instead of
+        fetching them at once
+        """
+        results = self.execute_query(query)
+        if results:
+            yield results
+
+
+class DBOperations(DBBackend):
     def __enter__(self):
+        import psycopg2
+
         try:
             self.connection = psycopg2.connect(
                 database=self.db_setup['db'],
@@ -20,22 +71,226 @@ class DBOperations():
         return self
 
     def __init__(self, db, host, user, port=5432):
+        import keyring
+
         self.db_setup = {
             'db': db,
             'host': host,
             'port': port,
             'password': keyring.get_password(db, user),
             'user': user}
+        self.columns = None
 
     def execute_query(self, query):
+        import psycopg2
+
         try:
             self.cur.execute(query)
             results = self.cur.fetchall()
+            # Column names of result rows
+            self.columns = [col[0] for col in self.cur.description]
             return results
         except psycopg2.Error as e:
             print("ERROR during DB query: {e}".format(e=e.pgerror))
             self.connection.rollback()
 
+    def iter_query(self, query, batch_size=10000):
+        """
+        Stream result rows in batches via a server-side (named) cursor, only
+        batch_size rows are held in memory at once
+        """
+        import psycopg2
+
+        try:
+            with self.connection.cursor(name="iter_query") as cur:
+                cur.itersize = batch_size
+                cur.execute(query)
+                while True:
+                    results = cur.fetchmany(batch_size)
+                    # Named cursors describe columns after the first fetch
+                    self.columns = [col[0] for col in cur.description]
+                    if not results:
+                        break
+                    yield results
+            self.connection.commit()
+        except psycopg2.Error as e:
+            print("ERROR during DB query: {e}".format(e=e.pgerror))
+            self.connection.rollback()
+
+    def execute_command(self, query):
+        """
+        Execute statement without result rows (DDL, INSERT, ...) and commit
+        :return: True if successful
+        """
+        import psycopg2
+
+        try:
+            self.cur.execute(query)
+            self.connection.commit()
+            return True
+        except psycopg2.Error as e:
+            print("ERROR during DB query: {e}".format(e=e.pgerror))
+            self.connection.rollback()
+            return False
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.cur.close()
         self.connection.close()
+
+
+class SpatiaLiteOperations(DBBackend):
+    """
+    Embedded SpatiaLite backend executing the SQL generated by
+    PostGISHelpers.Query.create_where_query() on a local database file.
+    Schema prefixes are stripped (tables live in one file) and region clipping
+    conditions are extended by a lookup in the SpatialIndex virtual table, as
+    SpatiaLite does not use R*Tree indexes implicitly. hstore/jsonb tag
+    operators are not supported.
+    """
+    row_id = 'ROWID'
+
+    def __init__(self, path, schemas=('public',)):
+        """
+        :param path: Path to SpatiaLite database file (created if missing)
+        :param schemas: Schema names to strip from queries
+        """
+        self.path = path
+        self.schemas = schemas
+        self._geometry_columns = {}
+
+    def __enter__(self):
+        try:
+            # Connections may be handed between threads by connection pools
+            # (exclusive use at a time, see batch_runner.ConnectionPool)
+            self.connection = sqlite3.connect(self.path,
+                                              check_same_thread=False)
+            self.connection.enable_load_extension(True)
+            self.connection.load_extension('mod_spatialite')
+            self.cur = self.connection.cursor()
+            # Create spatial metadata tables in new databases
+            self.cur.execute("SELECT CheckSpatialMetaData()")
+            if not self.cur.fetchone()[0]:
+                self.cur.execute("SELECT InitSpatialMetaData(1)")
+                self.connection.commit()
+        except (sqlite3.Error, AttributeError) as e:
+            print("Could not open SpatiaLite database: ", e)
+        return self
+
+    def row_id_literal(self, value):
+        return str(int(value))
+
+    def geometry_column(self, table):
+        """
+        Look up (geometry column, SRID, spatial index enabled) of table
+        :rtype : tuple
+        """
+        if table not in self._geometry_columns:
+            self.cur.execute(
+                "SELECT f_geometry_column, srid, spatial_index_enabled "
+                "FROM geometry_columns WHERE f_table_name = ?",
+                (table.lower(),))
+            self._geometry_columns[table] = self.cur.fetchone()
+        return self._geometry_columns[table]
+
+    def table_columns(self, relation):
+        """
+        Column names of relation in table order, schema prefixes are ignored
+        :rtype : list
+        """
+        self.cur.execute('PRAGMA table_info("{table}")'.format(
+            table=relation.split('.')[-1]))
+        return [row[1] for row in self.cur.fetchall()]
+
+    def translate(self, query):
+        """
+        Translate PostGIS SQL generated by PostGISHelpers to SpatiaLite
+        :rtype : str
+        """
+        if self.schemas:
+            query = re.sub(r'\b(?:{schemas})\.'.format(
+                schemas='|'.join(self.schemas)), '', query)
+
+        match = re.search(r'\bFROM\s+(\w+)', query, re.IGNORECASE)
+        if not match:
+            return query
+        table = match.group(1)
+
+        def add_index_lookup(m):
+            info = self.geometry_column(table)
+            if not info or not info[2]:
+                return m.group(0)
+            geom_col, native_SRID = info[0], info[1]
+            return "{contains} AND {table}.ROWID IN (SELECT ROWID FROM SpatialIndex WHERE f_table_name = '{table}' AND f_geometry_column = '{geom}' AND search_frame = ST_Transform(ST_GeomFromText('{wkt}', {SRID}), {native}))".format(
+                contains=m.group(0),
+                table=table,
+                geom=geom_col,
+                wkt=m.group(1),
+                SRID=m.group(2),
+                native=native_SRID)
+
+        return re.sub(
+            r"ST_Contains\(ST_GeomFromText\('([^']*)',(\d+)\), ST_Transform\((\w+),\d+\)\)",
+            add_index_lookup, query)
+
+    def execute_query(self, query):
+        try:
+            self.cur.execute(self.translate(query))
+            results = self.cur.fetchall()
+            # Column names of result rows
+            self.columns = [col[0] for col in self.cur.description]
+            return results
+        except sqlite3.Error as e:
+            print("ERROR during DB query: {e}".format(e=e))
+            self.connection.rollback()
+
+    def iter_query(self, query, batch_size=10000):
+        """
+        Stream result rows in batches, sqlite3 cursors step through results
+        lazily
+        """
+        try:
+            cur = self.connection.cursor()
+            cur.execute(self.translate(query))
+            self.columns = [col[0] for col in cur.description]
+            while True:
+                results = cur.fetchmany(batch_size)
+                if not results:
+                    break
+                yield results
+            cur.close()
+        except sqlite3.Error as e:
+            print("ERROR during DB query: {e}".format(e=e))
+            self.connection.rollback()
+
+    def execute_command(self, query, params=()):
+        """
+        Execute statement without result rows (DDL, INSERT, ...) and commit
+        :return: True if successful
+        """
+        try:
+            self.cur.execute(self.translate(query), params)
+            self.connection.commit()
+            return True
+        except sqlite3.Error as e:
+            print("ERROR during DB query: {e}".format(e=e))
+            self.connection.rollback()
+            return False
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.cur.close()
+        self.connection.close()
+
+
+# Backends selectable by URL scheme of source_db strings ('scheme://...'),
+# strings without scheme ('user@host:port/db') connect to PostgreSQL
+BACKENDS = {'spatialite': SpatiaLiteOperations}
+
+
+def register_backend(scheme, backend):
+    """
+    Make backend class available for source_db strings 'scheme://...'
+    :param scheme: URL scheme
+    :param backend: DBBackend subclass, constructed with the string after
+    'scheme://'
+    """
+    BACKENDS[scheme] = backend
@@ -0,0 +1,118 @@
+"""
+Set of tools for spatially joining results of Query() instances in memory
+
+Requires shapely>=2.0 (vectorized geometry functions and STRtree bulk queries)
+"""
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import shapely
+from shapely import STRtree
+
+PREDICATES = ('intersects', 'within', 'contains', 'nearest', 'dwithin')
+
+
+def results_of(query):
+    """
+    Collect result rows of a Query() or OSMCollection() instance
+    :rtype : list
+    :param query: Query or OSMCollection instance
+    :return: list of result dictionaries
+    """
+    if any(hasattr(query, layer) for layer in ('Points', 'Lines', 'Polygons')):
+        results = []
+        for layer in ('Points', 'Lines', 'Polygons'):
+            if hasattr(query, layer):
+                results.extend(getattr(query, layer).results)
+        return results
+    return query.results
+
+
+def geoms_from_results(results):
+    """
+    Parse WKT geometries of result rows in bulk
+    :rtype : numpy.ndarray
+    :param results: list of result dictionaries
+    :return: array of shapely geometries
+    """
+    return shapely.from_wkt([row['geom'] for row in results])
+
+
+def _join(left, right, predicate, distance=None):
+    """
+    Join two arrays of shapely geometries using an STRtree built on right
+    :rtype : numpy.ndarray
+    :return: array of shape (2, n) containing pairs of (left, right) indexes
+    """
+    tree = STRtree(right)
+
+    if predicate == 'nearest':
+        return tree.query_nearest(left, max_distance=distance)
+    elif predicate == 'dwithin':
+        # Candidates from bboxes grown by distance, then exact distance test
+        bounds = shapely.bounds(left)
+        boxes = shapely.box(bounds[:, 0] - distance, bounds[:, 1] - distance,
+                            bounds[:, 2] + distance, bounds[:, 3] + distance)
+        idx = tree.query(boxes)
+        mask = shapely.distance(left[idx[0]], right[idx[1]]) <= distance
+        return idx[:, mask]
+    else:
+        return tree.query(left, predicate=predicate)
+
+
+def _join_chunk(left_wkb, right_wkb, predicate, distance, offset):
+    """
+    Join chunk of left geometries, executed in worker processes
+    Geometries are passed as WKB, which is cheap to (un)pickle
+    """
+    idx = _join(shapely.from_wkb(left_wkb), shapely.from_wkb(right_wkb),
+                predicate, distance)
+    idx[0] += offset
+    return idx
+
+
+def spatial_join(left, right, predicate='intersects', distance=None,
+                 how='index', processes=None, chunk_size=50000):
+    """
+    Spatially join results of two Query() or OSMCollection() instances
+    :param left: Query or OSMCollection instance
+    :param right: Query or OSMCollection instance
+    :param predicate: 'intersects', 'within' (left within right), 'contains'
+    (left contains right), 'nearest' (nearest right for every left row,
+    optionally limited by distance) or 'dwithin' (within distance)
+    :param distance: Distance in units of the results' SRID
+    :param how: 'index' returns array of (left, right) index pairs, 'rows'
+    returns list of (left row, right row) tuples
+    :param processes: Number of worker processes partitioning left input, None
+    joins in current process
+    :param chunk_size: Number of left geometries per worker task
+    :return: Joined index pairs or rows
+    """
+    if predicate not in PREDICATES:
+        raise ValueError("Unknown predicate '{p}', use one of {ps}".format(
+            p=predicate, ps=PREDICATES))
+    if predicate == 'dwithin' and distance is None:
+        raise ValueError("Predicate 'dwithin' requires a distance")
+
+    left_results = results_of(left)
+    right_results = results_of(right)
+    if not left_results or not right_results:
+        idx = np.empty((2, 0), dtype=np.intp)
+    else:
+        left_geoms = geoms_from_results(left_results)
+        right_geoms = geoms_from_results(right_results)
+
+        if processes and len(left_geoms) > chunk_size:
+            left_wkb = shapely.to_wkb(left_geoms)
+            right_wkb = shapely.to_wkb(right_geoms)
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                futures = [executor.submit(_join_chunk,
+                                           left_wkb[i:i + chunk_size],
+                                           right_wkb, predicate, distance, i)
+                           for i in range(0, len(left_wkb), chunk_size)]
+                idx = np.concatenate([f.result() for f in futures], axis=1)
+        else:
+            idx = _join(left_geoms, right_geoms, predicate, distance)
+
+    if how == 'rows':
+        return [(left_results[i], right_results[j]) for i, j in idx.T]
+    return idx
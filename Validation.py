@@ -0,0 +1,121 @@
+"""
+Batched validation and repair of Query() result geometries
+
+Invalid OSM geometries (self-intersecting or unclosed rings, ...) make GEOS
+predicates and overlays fail ('Assertion failed' during clipping) and break
+exports of whole result sets. Geometries are parsed, checked and repaired in
+bulk using the vectorized functions of shapely>=2.0; repairs can also be
+pushed down into the DB (see Query.create_where_query(make_valid=True)).
+"""
+import collections
+import re
+import shapely
+from PostGISHelpers import ResultRow
+
+UNPARSABLE = "Unparsable WKT"
+COLLECTIONS = {0: shapely.multipoints,
+               1: shapely.multilinestrings,
+               2: shapely.multipolygons}
+
+
+def error_types(results):
+    """
+    Check geometries of result rows
+    :rtype : tuple
+    :param results: list of result rows
+    :return: (array of shapely geometries (None if unparsable), list of error
+    types (None if valid), e.g. 'Self-intersection' or 'Ring Self-intersection')
+    """
+    geoms = shapely.from_wkt([row['geom'] for row in results],
+                             on_invalid='ignore')
+    reasons = shapely.is_valid_reason(geoms)
+    errors = []
+    for geom, reason in zip(geoms, reasons):
+        if geom is None:
+            errors.append(UNPARSABLE)
+        elif reason == "Valid Geometry":
+            errors.append(None)
+        else:
+            # Strip location of the error, e.g. 'Self-intersection[13.1 52.5]'
+            errors.append(re.sub(r'\[.*\]$', '', reason))
+    return geoms, errors
+
+
+def _explode(geom):
+    """
+    Split (nested) multi-geometries and collections into single parts
+    :rtype : list
+    """
+    parts = []
+    for part in shapely.get_parts(geom):
+        if part.geom_type.startswith('Multi') or \
+                part.geom_type == 'GeometryCollection':
+            parts.extend(_explode(part))
+        else:
+            parts.append(part)
+    return parts
+
+
+def keep_dimension(geom, dimension):
+    """
+    Keep parts of geom of the given dimension, e.g. the polygons of a
+    GeometryCollection returned by make_valid() for a polygon with a spike
+    :rtype : shapely geometry
+    :param geom: shapely geometry
+    :param dimension: 0 (points), 1 (lines) or 2 (polygons)
+    :return: single or multi-part geometry, None if no part is left
+    """
+    parts = [part for part in _explode(geom)
+             if shapely.get_dimensions(part) == dimension and
+             not part.is_empty]
+    if not parts:
+        return None
+    if len(parts) == 1:
+        return parts[0]
+    return COLLECTIONS[dimension](parts)
+
+
+def validate_results(results, repair=True, quarantine=False):
+    """
+    Validate and optionally repair (shapely.make_valid) result rows in bulk.
+    Repaired geometries keep the dimension of the input (only polygonal parts
+    of repaired polygons), rows without any usable part are quarantined
+    :rtype : tuple
+    :param results: list of result rows
+    :param repair: Repair invalid geometries, keep them unchanged otherwise
+    :param quarantine: Move invalid rows out of the results instead of
+    repairing them
+    :return: (list of valid/repaired rows, list of quarantined rows, Counter
+    of error types)
+    """
+    geoms, errors = error_types(results)
+    report = collections.Counter(error for error in errors if error)
+    invalid = [i for i, error in enumerate(errors) if error]
+    if not invalid:
+        return list(results), [], report
+
+    repaired = {}
+    if repair and not quarantine:
+        dimensions = shapely.get_dimensions(geoms[invalid])
+        fixed = shapely.make_valid(geoms[invalid])
+        for i, geom, dimension in zip(invalid, fixed, dimensions):
+            # Unparsable geometries can't be repaired, collapsed parts (e.g.
+            # spikes of polygons turning into lines) are dropped. Rows without
+            # parts left are quarantined, counted by their original error
+            if geom is None:
+                continue
+            geom = keep_dimension(geom, dimension)
+            if geom is not None:
+                repaired[i] = shapely.to_wkt(geom, rounding_precision=-1)
+
+    rows, quarantined = [], []
+    for i, row in enumerate(results):
+        if errors[i] is None:
+            rows.append(row)
+        elif i in repaired:
+            rows.append(ResultRow(row['properties'], repaired[i]))
+        elif quarantine or repair:
+            quarantined.append(row)
+        else:
+            rows.append(row)
+    return rows, quarantined, report
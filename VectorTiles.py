@@ -0,0 +1,297 @@
+"""
+Mapbox Vector Tile (MVT) generation for Query/OSMCollection instances
+
+Tiles are either rendered by PostGIS (ST_AsMVT/ST_AsMVTGeom, PostGIS>=3.0) from
+the query generated by create_where_query(), or encoded locally from fetched
+results (requires mapbox_vector_tile). Rendered tiles are kept in an LRU cache
+and can be pre-seeded in parallel for a region and zoom range, or served via
+HTTP ('/{z}/{x}/{y}.pbf'). Requires shapely>=2.0
+"""
+import collections
+import math
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import shapely
+from shapely import STRtree
+from simple_log import *
+
+logger = SimpleLogger(module_name="VectorTiles")
+
+EARTH_RADIUS = 6378137.0
+ORIGIN_SHIFT = math.pi * EARTH_RADIUS
+
+
+def tile_bounds(z, x, y):
+    """
+    Bounds of tile in Web Mercator (EPSG:3857)
+    :rtype : tuple
+    :return: (xmin, ymin, xmax, ymax)
+    """
+    size = 2 * ORIGIN_SHIFT / 2 ** z
+    xmin = -ORIGIN_SHIFT + x * size
+    ymax = ORIGIN_SHIFT - y * size
+    return xmin, ymax - size, xmin + size, ymax
+
+
+def lonlat2tile(lon, lat, z):
+    """
+    :rtype : tuple
+    :return: (x, y) of tile containing lon/lat at zoom z
+    """
+    n = 2 ** z
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_of_bounds(bounds, zooms):
+    """
+    Enumerate tiles covering lon/lat bounds
+    :param bounds: (xmin, ymin, xmax, ymax) in EPSG:4326
+    :param zooms: iterable of zoom levels
+    :return: generator of (z, x, y)
+    """
+    for z in zooms:
+        xmin, ymin = lonlat2tile(bounds[0], bounds[3], z)
+        xmax, ymax = lonlat2tile(bounds[2], bounds[1], z)
+        for x in range(xmin, xmax + 1):
+            for y in range(ymin, ymax + 1):
+                yield z, x, y
+
+
+def lonlat2mercator(geoms):
+    """
+    Project array of EPSG:4326 shapely geometries to EPSG:3857 (vectorized)
+    :rtype : numpy.ndarray
+    """
+    def project(coords):
+        lon = np.radians(coords[:, 0])
+        lat = np.radians(np.clip(coords[:, 1], -85.0511, 85.0511))
+        return np.column_stack((EARTH_RADIUS * lon,
+                                EARTH_RADIUS * np.log(np.tan(np.pi / 4 + lat / 2))))
+    return shapely.transform(geoms, project)
+
+
+class TileCache:
+    """
+    Thread-safe LRU cache of encoded tiles, key: (z, x, y)
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._tiles = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+            return tile
+
+    def put(self, key, tile):
+        with self._lock:
+            self._tiles[key] = tile
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.maxsize:
+                self._tiles.popitem(last=False)
+
+
+class VectorTileSource:
+    """
+    Provide MVT tiles of a Query (one layer) or OSMCollection (one layer per
+    Points/Lines/Polygons)
+    """
+
+    def __init__(self, query, source_db=None, extent=4096, buffer=64,
+                 cache_size=1024, geom_col='way', native_SRID=3857):
+        """
+        :param query: Query or OSMCollection instance with generated query
+        (server side rendering) or fetched results (local encoding)
+        :param source_db: String containing DB access information, None
+        encodes fetched results locally
+        :param extent: Tile extent in screen space
+        :param buffer: Tile buffer in screen space
+        :param cache_size: Number of tiles kept in LRU cache
+        :param geom_col: Column containing geometries
+        :param native_SRID: SRID of geometry column
+        """
+        self.query = query
+        self.source_db = source_db
+        self.extent = extent
+        self.buffer = buffer
+        self.geom_col = geom_col
+        self.native_SRID = native_SRID
+        self.cache = TileCache(cache_size)
+
+        self.layers = []
+        for layer in ('Points', 'Lines', 'Polygons'):
+            if hasattr(query, layer):
+                self.layers.append((layer.lower(), getattr(query, layer)))
+        if not self.layers:
+            self.layers.append((re.sub(r'\W+', '_', query.query_name or
+                                       'layer').lower(), query))
+
+        self._local = threading.local()
+        self._connections = []
+        self._indexes = {}
+
+    def _layer_sql(self, name, query, z, x, y):
+        """
+        SQL statement rendering one layer of tile z/x/y with ST_AsMVT
+        """
+        # Margin of buffer in map units, features are selected via index
+        margin = 2 * ORIGIN_SHIFT / 2 ** z * self.buffer / self.extent
+        envelope = "ST_TileEnvelope({z}, {x}, {y})".format(z=z, x=x, y=y)
+        conditions = list(query._sql_where or []) + [
+            "{geom} && ST_Transform(ST_Expand({env}, {margin}), {SRID})".format(
+                geom=self.geom_col, env=envelope, margin=margin,
+                SRID=self.native_SRID)]
+        # Same property expressions as fetched rows (tag projections), whole
+        # rows ('relation.*') would add the source geometry column
+        cols = [col for col in query._sql_columns if not col.endswith(".*")]
+        return ("SELECT ST_AsMVT(mvt, '{name}', {extent}, 'geom') FROM ("
+                "SELECT {cols}ST_AsMVTGeom(ST_Transform({geom}, 3857), {env}, "
+                "{extent}, {buffer}, true) AS geom{from_} WHERE {where}) AS mvt"
+                ).format(name=name,
+                         extent=self.extent,
+                         cols=''.join(col + ", " for col in cols),
+                         geom=self.geom_col,
+                         env=envelope,
+                         buffer=self.buffer,
+                         from_=query._sql_from,
+                         where=" AND ".join(conditions))
+
+    def _connection(self):
+        # One connection per worker thread, reused for all of its tiles
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            context = self.query._connect(self.source_db)
+            conn = context.__enter__()
+            self._local.conn = conn
+            self._connections.append(context)
+        return conn
+
+    def _render_server(self, z, x, y):
+        sql = "SELECT " + " || ".join(
+            "({layer})".format(layer=self._layer_sql(name, query, z, x, y))
+            for name, query in self.layers)
+        view = self._connection().execute_query(sql)
+        return bytes(view[0][0]) if view and view[0][0] is not None else b""
+
+    def _layer_index(self, name, query):
+        # Project fetched results to EPSG:3857 once and index them
+        if name not in self._indexes:
+            geoms = lonlat2mercator(shapely.from_wkt(
+                [row['geom'] for row in query.results]))
+            self._indexes[name] = (geoms, STRtree(geoms))
+        return self._indexes[name]
+
+    def _render_local(self, z, x, y):
+        import mapbox_vector_tile
+
+        bounds = tile_bounds(z, x, y)
+        margin = (bounds[2] - bounds[0]) * self.buffer / self.extent
+        clip_box = shapely.box(bounds[0] - margin, bounds[1] - margin,
+                               bounds[2] + margin, bounds[3] + margin)
+        layers = []
+        for name, query in self.layers:
+            geoms, tree = self._layer_index(name, query)
+            idx = tree.query(clip_box, predicate='intersects')
+            clipped = shapely.intersection(geoms[idx], clip_box)
+            layers.append({
+                'name': name,
+                'features': [{'geometry': geom.wkt,
+                              'properties': {k: v for k, v in
+                                             query.results[i]['properties'].items()
+                                             if v is not None}}
+                             for i, geom in zip(idx, clipped)
+                             if not geom.is_empty]})
+        return mapbox_vector_tile.encode(
+            layers, default_options={'quantize_bounds': bounds,
+                                     'extents': self.extent})
+
+    def get_tile(self, z, x, y):
+        """
+        Return encoded tile z/x/y (from cache if available)
+        :rtype : bytes
+        """
+        key = (z, x, y)
+        tile = self.cache.get(key)
+        if tile is None:
+            if self.source_db:
+                tile = self._render_server(z, x, y)
+            else:
+                tile = self._render_local(z, x, y)
+            self.cache.put(key, tile)
+        return tile
+
+    def seed(self, zooms, out_dir=None, bounds=None, workers=4):
+        """
+        Pre-render all tiles covering bounds for the given zoom levels in
+        parallel, optionally writing them to out_dir/{z}/{x}/{y}.pbf
+        :param zooms: iterable of zoom levels, e.g. range(10, 15)
+        :param out_dir: Output directory, None only fills the cache
+        :param bounds: (xmin, ymin, xmax, ymax) in EPSG:4326, bounds of
+        query's region if None
+        :param workers: Number of worker threads
+        :return: Number of rendered tiles
+        """
+        bounds = bounds or self.query.region.bounds
+        if type(bounds) != tuple:
+            logger.printmessage.error("Seeding requires bounds as bbox tuple!")
+            return 0
+
+        def render(tile):
+            z, x, y = tile
+            data = self.get_tile(z, x, y)
+            if out_dir:
+                tile_dir = os.path.join(out_dir, str(z), str(x))
+                os.makedirs(tile_dir, exist_ok=True)
+                with open(os.path.join(tile_dir, "{y}.pbf".format(y=y)),
+                          'wb') as f:
+                    f.write(data)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            n = len(list(executor.map(render, tiles_of_bounds(bounds, zooms))))
+        logger.printmessage.info("Seeded {n} tiles".format(n=n))
+        return n
+
+    def serve(self, host="localhost", port=8080):
+        """
+        Serve tiles via HTTP at http://host:port/{z}/{x}/{y}.pbf (blocking)
+        """
+        source = self
+
+        class TileHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                match = re.match(r'/(\d+)/(\d+)/(\d+)\.pbf$', self.path)
+                if not match:
+                    self.send_error(404)
+                    return
+                data = source.get_tile(*map(int, match.groups()))
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'application/vnd.mapbox-vector-tile')
+                self.send_header('Content-Length', str(len(data)))
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                self.wfile.write(data)
+
+        logger.printmessage.info(
+            "Serving tiles at http://{h}:{p}/{{z}}/{{x}}/{{y}}.pbf".format(
+                h=host, p=port))
+        ThreadingHTTPServer((host, port), TileHandler).serve_forever()
+
+    def close(self):
+        """
+        Close DB connections of worker threads
+        """
+        for context in self._connections:
+            context.__exit__(None, None, None)
+        self._connections = []
@@ -1,29 +1,48 @@
 """
 Set of small tools for querying OSM web services
 """
-import urllib
+import urllib.error
+import urllib.request
+import urllib.parse
+import http.client
+import shelve
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import xml.etree.ElementTree as ET  # XML-parsing
 
-def fetch_admin_from_latlon(lat, lon):
+NOMINATIM_REVERSE = "http://nominatim.openstreetmap.org/reverse"
+
+
+def parse_reverse_result(res):
     """
-    Receive geo information from lat/lon point (reverse geocoding)
+    Extract address parts from Nominatim XML reverse geocoding response
     :rtype : dict
-    :param lat: latitude
-    :param lon: longitude
-    :param zoom: detail level of information
+    :param res: XML response
     :return: dictionary
     """
+    root = ET.fromstring(res)
+    address_parts = {}
 
-    def parse_result(res):
-        root = ET.fromstring(res)
-        address_parts = {}
+    addressparts = root.find('addressparts')
+    if addressparts is None:
+        return address_parts
+    for a in addressparts:
+        address_parts[a.tag] = a.text
 
-        for a in root[1]:
-            address_parts[a.tag] = a.text
+    return address_parts
 
-        return address_parts
 
-    query = "http://nominatim.openstreetmap.org/reverse?"
+def fetch_admin_from_latlon(lat, lon, endpoint=NOMINATIM_REVERSE):
+    """
+    Receive geo information from lat/lon point (reverse geocoding)
+    :rtype : dict
+    :param lat: latitude
+    :param lon: longitude
+    :param endpoint: URL of reverse geocoding service
+    :return: dictionary
+    """
+    query = endpoint + "?"
     query += "format=xml"
     query += "&lat={lat}".format(lat=lat)
     query += "&lon={lon}".format(lon=lon)
@@ -32,6 +51,169 @@ def fetch_admin_from_latlon(lat, lon):
 
     conn = urllib.request.urlopen(query)
     rev_geocode = conn.read()
-    address_parts = parse_result(rev_geocode)
+    address_parts = parse_reverse_result(rev_geocode)
+
+    return address_parts
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter spacing out calls to at most `rate` calls per second
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ReverseGeocoder:
+    """
+    Batch reverse geocoding against a Nominatim compatible endpoint (public
+    service, local instance or test stand-in server). Coordinates are rounded
+    to `precision` decimals, which de-duplicates nearby points and serves as
+    key of a persistent cache (shelve file). Missing keys are requested
+    concurrently by a pool of worker threads kept for the lifetime of the
+    instance, each reusing its keep-alive connection across batches, limited
+    to `rate` requests per second (public Nominatim allows 1/s).
+    """
+
+    def __init__(self,
+                 endpoint=NOMINATIM_REVERSE,
+                 cache_path=None,
+                 precision=4,
+                 max_workers=4,
+                 rate=1.0,
+                 zoom=18,
+                 user_agent="rli_python_as_gis"):
+        """
+        :param endpoint: URL of reverse geocoding service
+        :param cache_path: Path of persistent cache file, None caches in memory
+        :param precision: Decimals of rounded coordinates (4 ~ 10 m)
+        :param max_workers: Number of concurrent requests
+        :param rate: Maximum requests per second, None for no limit
+        :param zoom: Nominatim detail level of information
+        :param user_agent: User-Agent header sent with each request
+        """
+        self.endpoint = urllib.parse.urlsplit(endpoint)
+        self.precision = precision
+        self.max_workers = max_workers
+        self.zoom = zoom
+        self.user_agent = user_agent
+        self.cache = shelve.open(cache_path) if cache_path else {}
+
+        self._limiter = RateLimiter(rate)
+        self._local = threading.local()
+        self._connections = []
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _key(self, lat, lon):
+        return "{lat:.{p}f},{lon:.{p}f}".format(lat=lat, lon=lon,
+                                                 p=self.precision)
+
+    def _connection(self):
+        """
+        Return keep-alive connection of the current worker thread
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.endpoint.scheme == 'https':
+                conn = http.client.HTTPSConnection(self.endpoint.netloc)
+            else:
+                conn = http.client.HTTPConnection(self.endpoint.netloc)
+            self._local.conn = conn
+            self._connections.append(conn)
+        return conn
+
+    def _request(self, key):
+        """
+        Reverse geocode rounded coordinates of cache key
+        :rtype : dict
+        :raises urllib.error.HTTPError: on non-2xx responses
+        """
+        lat, lon = key.split(',')
+        path = self.endpoint.path + "?" + urllib.parse.urlencode(
+            {'format': 'xml', 'lat': lat, 'lon': lon, 'zoom': self.zoom,
+             'addressdetails': 1})
+        headers = {'User-Agent': self.user_agent, 'Connection': 'keep-alive'}
+
+        for attempt in range(2):
+            self._limiter.wait()
+            conn = self._connection()
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                # Read the whole body, the connection is reused afterwards
+                body = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # Server closed keep-alive connection, reconnect once
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+                continue
+            if not 200 <= response.status < 300:
+                raise urllib.error.HTTPError(
+                    "{scheme}://{netloc}{path}".format(
+                        scheme=self.endpoint.scheme,
+                        netloc=self.endpoint.netloc, path=path),
+                    response.status,
+                    response.reason, response.headers, None)
+            return parse_reverse_result(body)
+
+    def reverse(self, lat, lon):
+        """
+        Reverse geocode single point
+        :rtype : dict
+        """
+        return self.reverse_batch([(lat, lon)])[0]
+
+    def reverse_batch(self, coords):
+        """
+        Reverse geocode list of points
+        :rtype : list
+        :param coords: iterable of (lat, lon) tuples
+        :return: list of address part dictionaries in order of coords
+        :raises urllib.error.HTTPError: if a request fails, results of
+        failed requests are not cached
+        """
+        keys = [self._key(lat, lon) for lat, lon in coords]
+        missing = [key for key in set(keys) if key not in self.cache]
+
+        if missing:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers)
+            for key, address_parts in zip(missing,
+                                          self._executor.map(self._request,
+                                                             missing)):
+                self.cache[key] = address_parts
+
+        return [self.cache[key] for key in keys]
 
-    return address_parts
\ No newline at end of file
+    def close(self):
+        """
+        Stop worker threads, close open connections and persistent cache
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for conn in self._connections:
+            conn.close()
+        self._connections = []
+        if isinstance(self.cache, shelve.Shelf):
+            self.cache.close()
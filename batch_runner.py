@@ -0,0 +1,314 @@
+"""
+Command-line batch runner for query definitions
+
+Reads a JSON (or YAML, requires PyYAML) job file defining regions, layers,
+query features and outputs, runs every job for each of its regions in a pool
+of worker threads sharing a pool of DB connections, writes the outputs and
+prints a timing and row-count report. Usage:
+
+    python batch_runner.py Example_data/batch_job_example.json
+    python batch_runner.py jobs.yaml --workers 8 --connections 4 \
+        --report report.json
+
+Job file format:
+
+    {"source_db": "user@host:port/db",
+     "output_dir": "./Output",
+     "regions": {"Wustermark": {"boundary": [12.87, 52.50, 13.02, 52.58]},
+                 "Wittenberg": {"boundary": "./Example_data/Wittenberg.shp"}},
+     "jobs": [{"name": "buildings",
+               "layer": "polygons",
+               "regions": ["Wustermark", "Wittenberg"],
+               "query_features": {"relation": "germany_polygon",
+                                  "select_cols": ["osm_id", "name"],
+                                  "where_cond": "building is not NULL"},
+               "outputs": ["shp", "ndjson", "png"]}]}
+
+Layers are 'points', 'lines', 'polygons' (query_features as in
+Query.create_where_query()) or 'collection' (as in
+OSMCollection.create_collection_query()). Outputs are 'shp', 'csv', 'ndjson'
+and map images 'png', 'svg' or 'pdf'. Regions of a job default to all regions,
+jobs without regions run unclipped.
+"""
+import argparse
+import contextlib
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PostGISHelpers import *
+
+LAYER_CLASSES = {'points': OSMPoints,
+                 'lines': OSMLines,
+                 'polygons': OSMPolygons,
+                 'collection': OSMCollection}
+IMAGE_FORMATS = ('png', 'svg', 'pdf')
+
+# Basemap instances and matplotlib are shared by all worker threads
+_render_lock = threading.Lock()
+
+
+def load_job_file(filepath):
+    """
+    Load and check job definitions from JSON or YAML file
+    :rtype : dict
+    """
+    with open(filepath) as f:
+        if filepath.endswith(('.yml', '.yaml')):
+            import yaml
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+    check_config(config)
+    return config
+
+
+def check_config(config):
+    """
+    Check that all regions named by jobs are defined
+    :raises ValueError: naming the job and the undefined region
+    """
+    regions = config.get('regions') or {}
+    for job in config['jobs']:
+        for name in job.get('regions') or []:
+            if name not in regions:
+                raise ValueError(
+                    "Job '{job}' uses undefined region '{region}' (defined: "
+                    "{defined})".format(job=job['name'], region=name,
+                                        defined=', '.join(regions) or
+                                        "none"))
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of open DB connections shared by worker threads, each
+    connection is used by one thread at a time
+    """
+
+    def __init__(self, source_db, size=4):
+        """
+        :param source_db: String containing DB access information (see
+        PostGISHelpers.connect())
+        :param size: Maximum number of open connections
+        """
+        self.source_db = source_db
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._contexts = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Borrow a connection, opened on demand up to self.size
+        """
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if len(self._contexts) < self.size:
+                    context = connect(self.source_db)
+                    conn = context.__enter__()
+                    self._contexts.append(context)
+            if conn is None:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        for context in self._contexts:
+            context.__exit__(None, None, None)
+        self._contexts = []
+
+
+def build_regions(definitions):
+    """
+    Create Region instances from job file definitions
+    :rtype : dict
+    """
+    regions = {}
+    for name, definition in (definitions or {}).items():
+        boundary = definition.get('boundary')
+        # JSON/YAML have no tuples, Region expects bboxes as tuple
+        if isinstance(boundary, list):
+            boundary = tuple(boundary)
+        regions[name] = Region(name=name, boundary=boundary,
+                               **{k: v for k, v in definition.items()
+                                  if k != 'boundary'})
+    return regions
+
+
+def build_query(job, region_name, region):
+    """
+    Create query of job for one region and generate its SQL statement
+    :rtype : Query
+    """
+    name = "{job}_{region}".format(job=job['name'], region=region_name) \
+        if region_name else job['name']
+    query = LAYER_CLASSES[job['layer']](name=name, region=region)
+    if isinstance(query, OSMCollection):
+        query.create_collection_query(**job['query_features'])
+    else:
+        query.create_where_query(**job['query_features'])
+    return query
+
+
+def layers_of(query):
+    """
+    :rtype : list
+    :return: list of (file name suffix, query) of Points/Lines/Polygons of
+    collections, [('', query)] otherwise
+    """
+    if isinstance(query, OSMCollection):
+        return [("_" + layer.lower(), getattr(query, layer))
+                for layer in ('Points', 'Lines', 'Polygons')
+                if hasattr(query, layer)]
+    return [('', query)]
+
+
+def write_outputs(query, outputs, output_dir):
+    """
+    Write outputs of fetched query, shapefiles and images of empty results
+    are skipped (with a warning)
+    :return: list of written file paths
+    """
+    filepaths = []
+    base = os.path.join(output_dir, re.sub(r'\W+', '_', query.query_name))
+    for output in outputs:
+        if output in IMAGE_FORMATS:
+            filepath = "{base}.{ext}".format(base=base, ext=output)
+            with _render_lock:
+                query.render(filepath)
+            if os.path.exists(filepath):
+                filepaths.append(filepath)
+            continue
+        for suffix, layer in layers_of(query):
+            filepath = "{base}{suffix}.{ext}".format(base=base, suffix=suffix,
+                                                     ext=output)
+            if output == 'shp':
+                layer.export2shp(filepath)
+            elif output in ('csv', 'ndjson'):
+                with open(filepath, 'w', newline='') as f:
+                    layer.write_results(f, fmt=output, geom=True)
+            else:
+                raise ValueError("Unknown output format '{f}'".format(
+                    f=output))
+            if os.path.exists(filepath):
+                filepaths.append(filepath)
+            else:
+                logger.printmessage.warning(
+                    "{path} not written (no results)".format(path=filepath))
+    return filepaths
+
+
+def run_task(job, region_name, region, pool, output_dir):
+    """
+    Fetch one job for one region and write its outputs
+    :rtype : dict
+    :return: report entry
+    """
+    report = {'job': job['name'], 'region': region_name, 'rows': 0,
+              'fetch_s': None, 'output_s': None, 'files': [], 'error': None}
+    try:
+        query = build_query(job, region_name, region)
+        ts = time.perf_counter()
+        with pool.connection() as conn:
+            if isinstance(query, OSMCollection):
+                query.fetch_OSM_collection(conn)
+            else:
+                query.fetch_geoms(conn, page_size=job.get('page_size'))
+        report['fetch_s'] = round(time.perf_counter() - ts, 3)
+        report['rows'] = sum(len(layer.results)
+                             for _, layer in layers_of(query))
+
+        ts = time.perf_counter()
+        report['files'] = write_outputs(query, job.get('outputs', []),
+                                        output_dir)
+        report['output_s'] = round(time.perf_counter() - ts, 3)
+        query.release()
+    except Exception as e:
+        # One failing task must not stop the batch, errors are reported
+        report['error'] = "{t}: {e}".format(t=type(e).__name__, e=e)
+        logger.printmessage.error("{job}/{region} failed: {e}".format(
+            job=job['name'], region=region_name, e=report['error']))
+    return report
+
+
+def run(config, workers=4, connections=4):
+    """
+    Run all jobs of a job file
+    :rtype : list
+    :param config: dictionary of job file contents
+    :param workers: Number of worker threads
+    :param connections: Maximum number of open DB connections
+    :return: list of report entries (one per job and region)
+    """
+    check_config(config)
+    output_dir = config.get('output_dir', '.')
+    os.makedirs(output_dir, exist_ok=True)
+    regions = build_regions(config.get('regions'))
+
+    tasks = []
+    for job in config['jobs']:
+        names = job.get('regions', list(regions))
+        for name in names or [None]:
+            tasks.append((job, name, regions[name] if name else None))
+
+    pool = ConnectionPool(config['source_db'], size=connections)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            reports = list(executor.map(
+                lambda task: run_task(*task, pool=pool, output_dir=output_dir),
+                tasks))
+    finally:
+        pool.close()
+    return reports
+
+
+def print_report(reports, total_s):
+    widths = (max([3] + [len(r['job']) for r in reports]),
+              max([6] + [len(str(r['region'])) for r in reports]))
+    line = "{:<%d} {:<%d} {:>10} {:>9} {:>9}  {}" % widths
+    print(line.format("job", "region", "rows", "fetch_s", "output_s",
+                      "status"))
+    for r in reports:
+        print(line.format(r['job'], str(r['region']), r['rows'],
+                          r['fetch_s'] if r['fetch_s'] is not None else "-",
+                          r['output_s'] if r['output_s'] is not None else "-",
+                          r['error'] or "ok"))
+    print("{n} task(s), {rows} row(s), {f} failed, {t:.1f}s total".format(
+        n=len(reports), rows=sum(r['rows'] for r in reports),
+        f=sum(1 for r in reports if r['error']), t=total_s))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('job_file', help="JSON or YAML job file")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="number of worker threads")
+    parser.add_argument('--connections', type=int, default=4,
+                        help="maximum number of open DB connections")
+    parser.add_argument('--source_db', help="overrides source_db of job file")
+    parser.add_argument('--output_dir', help="overrides output_dir of job file")
+    parser.add_argument('--report', help="save report as JSON file")
+    args = parser.parse_args()
+
+    config = load_job_file(args.job_file)
+    for key in ('source_db', 'output_dir'):
+        if getattr(args, key):
+            config[key] = getattr(args, key)
+
+    ts = time.perf_counter()
+    reports = run(config, workers=args.workers, connections=args.connections)
+    print_report(reports, time.perf_counter() - ts)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(reports, f, indent=2)
+    sys.exit(1 if any(r['error'] for r in reports) else 0)
@@ -0,0 +1,130 @@
+"""
+Import-time benchmark of the PostGISHelpers package modules
+
+Runs 'python -X importtime -c "import <module>"' in fresh interpreters,
+records the cumulative import time of each module (best of several runs) and
+checks that heavy plotting/export/DB dependencies are not loaded on import.
+Every run is appended to the output file and compared to the previous one.
+Usage:
+
+    python benchmark_import.py
+    python benchmark_import.py PostGISHelpers OverpassHelpers --repeat 10
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+
+# Dependencies that must only be loaded on first use
+HEAVY_MODULES = ('mpl_toolkits.basemap', 'matplotlib', 'fiona', 'prettytable',
+                 'shapely', 'numpy', 'psycopg2', 'keyring')
+DEFAULT_MODULES = ['PostGISHelpers', 'SQLOperations', 'region', 'OverpassHelpers']
+
+
+def importtime(module):
+    """
+    Import module in a fresh interpreter
+    :rtype : dict
+    :return: dictionary of imported module name -> (self, cumulative) time in
+    microseconds
+    """
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+        universal_newlines=True)
+    output = process.stderr
+    if process.returncode:
+        sys.exit("Could not import {module}: {error}".format(
+            module=module, error=output.strip().splitlines()[-1]))
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def benchmark_module(module, repeat=5, top=5):
+    """
+    Measure import time of module
+    :rtype : dict
+    :param module: Module name
+    :param repeat: Number of runs, the fastest one is recorded
+    :param top: Number of slowest imported modules to record
+    :return: dictionary of results
+    """
+    runs = [importtime(module) for _ in range(repeat)]
+    best = min(runs, key=lambda times: times[module][1])
+    return {
+        'ms': round(best[module][1] / 1000., 2),
+        'heavy': sorted(name for name in best
+                        if name.split('.')[0] in HEAVY_MODULES or
+                        name in HEAVY_MODULES),
+        'slowest': [(name, round(t[0] / 1000., 2)) for name, t in
+                    sorted(best.items(), key=lambda item: -item[1][0])[:top]]}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    """
+    Print import times of current vs. previous run
+    """
+    for module, values in current['results'].items():
+        before = previous['results'].get(module, {}).get('ms')
+        ratio = ("({r:+.0%})".format(r=values['ms'] / before - 1)
+                 if before else "")
+        print("{module:<20} {t:8.1f}ms {ratio}".format(
+            module=module, t=values['ms'], ratio=ratio))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max_ms', type=float,
+                        help="fail if a module takes longer to import")
+    parser.add_argument('--output', default="benchmark_import.json",
+                        help="JSON file runs are appended to")
+    args = parser.parse_args()
+
+    current = {'timestamp': datetime.datetime.now().isoformat(),
+               'commit': git_commit(),
+               'python': sys.version.split()[0],
+               'results': {module: benchmark_module(module, args.repeat)
+                           for module in args.modules}}
+
+    history = []
+    if os.path.exists(args.output):
+        with open(args.output) as f:
+            history = json.load(f)
+    if history:
+        compare(history[-1], current)
+    history.append(current)
+    with open(args.output, 'w') as f:
+        json.dump(history, f, indent=2)
+
+    failed = False
+    for module, values in current['results'].items():
+        print("{module:<20} {t:8.1f}ms, slowest: {slowest}".format(
+            module=module, t=values['ms'],
+            slowest=", ".join("{n} {t}ms".format(n=n, t=t)
+                              for n, t in values['slowest'])))
+        if values['heavy']:
+            print("  eagerly imported: " + ", ".join(values['heavy']))
+            failed = True
+        if args.max_ms and values['ms'] > args.max_ms:
+            failed = True
+    print("Saved results to {fp}".format(fp=args.output))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,279 @@
+"""
+Benchmark suite for the fetch -> clip -> plot -> export pipeline of
+PostGISHelpers
+
+Generates synthetic OSM-like point, line and polygon tables of configurable
+size in a PostgreSQL/PostGIS database or a local SpatiaLite file, times the
+pipeline steps at each scale and records runtimes and memory peaks as JSON.
+Every run is appended to the output file and compared to the previous one.
+Usage:
+
+    python benchmark_pipeline.py user@host:port/db --scales 1000 10000 100000
+    python benchmark_pipeline.py spatialite:///tmp/bench.sqlite
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import matplotlib
+matplotlib.use('Agg')  # headless, no windows during benchmarks
+import matplotlib.pyplot as plt
+from PostGISHelpers import *
+
+# Synthetic data is spread over this bbox (lon/lat, around Wustermark)
+EXTENT = (12.8, 52.4, 13.2, 52.7)
+# Region covering the south-west quarter of EXTENT
+REGION_BBOX = (12.8, 52.4, 13.0, 52.55)
+
+LAYERS = {
+    'point': "ST_SetSRID(ST_MakePoint({x}, {y}), 4326)",
+    'line': "ST_SetSRID(ST_MakeLine(ST_MakePoint({x}, {y}), "
+            "ST_MakePoint({x} + random() * 0.01, {y} + random() * 0.01)), 4326)",
+    'polygon': "ST_Buffer(ST_SetSRID(ST_MakePoint({x}, {y}), 4326), "
+               "0.0001 + random() * 0.0005, 2)"}
+QUERY_CLASSES = {'point': OSMPoints, 'line': OSMLines, 'polygon': OSMPolygons}
+
+
+def generate_tables(conn, schema, n):
+    """
+    Create synthetic OSM-like tables {schema}.bench_{n}_{point,line,polygon}
+    with osm2pgsql-like columns and spatial index (native SRID 3857)
+    :param conn: open instance of SQLOperations.DBOperations
+    :param schema: DB schema to create tables in
+    :param n: Number of rows per table
+    """
+    conn.execute_command("CREATE SCHEMA IF NOT EXISTS {s}".format(s=schema))
+    x = "{xmin} + random() * {dx}".format(xmin=EXTENT[0],
+                                          dx=EXTENT[2] - EXTENT[0])
+    y = "{ymin} + random() * {dy}".format(ymin=EXTENT[1],
+                                          dy=EXTENT[3] - EXTENT[1])
+    for layer, geom in LAYERS.items():
+        table = "{s}.bench_{n}_{layer}".format(s=schema, n=n, layer=layer)
+        conn.execute_command("DROP TABLE IF EXISTS {t}".format(t=table))
+        conn.execute_command(
+            "CREATE TABLE {t} AS SELECT i::bigint AS osm_id, "
+            "'name ' || i AS name, "
+            "CASE WHEN i % 10 = 0 THEN 'school' END AS amenity, "
+            "CASE WHEN i % 2 = 0 THEN 'yes' END AS building, "
+            "ST_Transform({geom}, 3857) AS way "
+            "FROM generate_series(1, {n}) AS i".format(
+                t=table, n=n, geom=geom.format(x=x, y=y)))
+        conn.execute_command(
+            "CREATE INDEX ON {t} USING gist (way)".format(t=table))
+        conn.execute_command("ANALYZE {t}".format(t=table))
+
+
+def generate_tables_spatialite(conn, n):
+    """
+    Create synthetic OSM-like tables bench_{n}_{point,line,polygon} with
+    spatial index in a SpatiaLite database (native SRID 3857)
+    :param conn: open instance of SQLOperations.SpatiaLiteOperations
+    :param n: Number of rows per table
+    """
+    rnd = random.Random(n)
+
+    def point():
+        return (EXTENT[0] + rnd.random() * (EXTENT[2] - EXTENT[0]),
+                EXTENT[1] + rnd.random() * (EXTENT[3] - EXTENT[1]))
+
+    def wkt(layer):
+        x, y = point()
+        if layer == 'point':
+            return "POINT({x} {y})".format(x=x, y=y)
+        if layer == 'line':
+            return "LINESTRING({x} {y}, {x2} {y2})".format(
+                x=x, y=y, x2=x + rnd.random() * 0.01, y2=y + rnd.random() * 0.01)
+        d = 0.0001 + rnd.random() * 0.0005
+        return "POLYGON(({x0} {y0}, {x1} {y0}, {x1} {y1}, {x0} {y1}, {x0} {y0}))".format(
+            x0=x - d, y0=y - d, x1=x + d, y1=y + d)
+
+    for layer in LAYERS:
+        table = "bench_{n}_{layer}".format(n=n, layer=layer)
+        conn.execute_command("DROP TABLE IF EXISTS {t}".format(t=table))
+        conn.execute_command("CREATE TABLE {t} (osm_id INTEGER PRIMARY KEY, "
+                             "name TEXT, amenity TEXT, building TEXT)".format(
+                                 t=table))
+        conn.execute_command("SELECT AddGeometryColumn('{t}', 'way', 3857, "
+                             "'GEOMETRY', 'XY')".format(t=table))
+        conn.cur.executemany(
+            "INSERT INTO {t} VALUES (?, ?, ?, ?, "
+            "ST_Transform(GeomFromText(?, 4326), 3857))".format(t=table),
+            [(i, "name {i}".format(i=i),
+              'school' if i % 10 == 0 else None,
+              'yes' if i % 2 == 0 else None,
+              wkt(layer)) for i in range(1, n + 1)])
+        conn.commit()
+        conn.execute_command("SELECT CreateSpatialIndex('{t}', 'way')".format(
+            t=table))
+
+
+def drop_tables(conn, schema, n):
+    for layer in LAYERS:
+        conn.execute_command("DROP TABLE IF EXISTS {s}.bench_{n}_{layer}".format(
+            s=schema, n=n, layer=layer))
+
+
+def measure(func, *args, setup=None, **kwargs):
+    """
+    Run func twice, measuring wall time in the first and the peak of Python
+    memory allocations in the second pass (tracing slows down allocations
+    considerably, so it must not run while timing)
+    :rtype : dict
+    :param setup: Called before the second pass to restore the state func
+    changed in the first one
+    """
+    ts = time.perf_counter()
+    func(*args, **kwargs)
+    seconds = time.perf_counter() - ts
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': round(seconds, 4), 'peak_kb': peak // 1024}
+
+
+def benchmark_layer(source_db, schema, n, layer, tmp_dir):
+    """
+    Time pipeline steps for one synthetic table
+    :rtype : dict
+    """
+    region = Region(name="Benchmark region", boundary=REGION_BBOX)
+    query = QUERY_CLASSES[layer](name="bench_{n}_{layer}".format(
+        n=n, layer=layer), region=region)
+    query.create_where_query(relation="bench_{n}_{layer}".format(
+        n=n, layer=layer), schema=schema,
+        select_cols=['osm_id', 'name', 'amenity'])
+
+    # fetch_geoms() appends to and clip_view2poly() replaces results
+    timings = {'fetch_geoms': measure(query.fetch_geoms, source_db,
+                                      setup=query.results.clear)}
+    fetched = list(query.results)
+    timings['clip_view2poly'] = measure(
+        query.clip_view2poly,
+        setup=lambda: setattr(query, 'results', list(fetched)))
+    timings['bbox_of_view'] = measure(query.bbox_of_view, query.results)
+    if layer == 'polygon':
+        timings['area_sum'] = measure(lambda: query.area_sum)
+
+    # Identity projection instead of Basemap, only our vector handling is timed
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    timings['_collect_geoms'] = measure(query._collect_geoms, query, ax,
+                                        lambda x, y: (x, y),
+                                        el_limit=len(query.results))
+    plt.close(fig)
+
+    timings['export2shp'] = measure(
+        query.export2shp, os.path.join(tmp_dir, "{layer}_{n}.shp".format(
+            layer=layer, n=n)))
+    timings['rows'] = len(query.results)
+    return timings
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    """
+    Print runtime ratios of current vs. previous run
+    """
+    for scale, layers in current['results'].items():
+        for layer, steps in layers.items():
+            for step, values in steps.items():
+                try:
+                    before = previous['results'][scale][layer][step]['seconds']
+                except (KeyError, TypeError):
+                    continue
+                if before:
+                    print("{scale:>8} {layer:<8} {step:<15} {t:8.3f}s "
+                          "({ratio:+.0%})".format(
+                              scale=scale, layer=layer, step=step,
+                              t=values['seconds'],
+                              ratio=values['seconds'] / before - 1))
+
+
+def open_source(source_db, schema):
+    """
+    Connection to source_db, SpatiaLite connections strip schema from
+    queries (generated tables live in one file without schemas)
+    :rtype : DBBackend
+    """
+    conn = connect(source_db)
+    if isinstance(conn, SpatiaLiteOperations):
+        return SpatiaLiteOperations(conn.path, schemas=(schema,))
+    return conn
+
+
+def run(source_db, scales, schema="benchmark", keep=False):
+    """
+    Run benchmark suite
+    :rtype : dict
+    :param source_db: String containing DB access information (PostgreSQL or
+    SpatiaLite, see PostGISHelpers.connect())
+    :param scales: list of table sizes
+    :param schema: DB schema for synthetic tables
+    :param keep: Keep generated tables
+    :return: dictionary of results
+    """
+    run_results = {'timestamp': datetime.datetime.now().isoformat(),
+                   'commit': git_commit(),
+                   'results': {}}
+    # One connection for all steps, fetch timings exclude connecting
+    with open_source(source_db, schema) as conn, \
+            tempfile.TemporaryDirectory() as tmp_dir:
+        for n in scales:
+            if isinstance(conn, SpatiaLiteOperations):
+                generate_tables_spatialite(conn, n)
+            else:
+                generate_tables(conn, schema, n)
+            run_results['results'][str(n)] = {
+                layer: benchmark_layer(conn, schema, n, layer, tmp_dir)
+                for layer in LAYERS}
+            if not keep:
+                drop_tables(conn, schema, n)
+
+    return run_results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('source_db', help="'user@host:port/db' or "
+                                          "'spatialite://path'")
+    parser.add_argument('--scales', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--schema', default="benchmark")
+    parser.add_argument('--output', default="benchmark_results.json",
+                        help="JSON file runs are appended to")
+    parser.add_argument('--keep', action='store_true',
+                        help="keep generated tables")
+    args = parser.parse_args()
+
+    current = run(args.source_db, args.scales, schema=args.schema,
+                  keep=args.keep)
+
+    history = []
+    if os.path.exists(args.output):
+        with open(args.output) as f:
+            history = json.load(f)
+    if history:
+        compare(history[-1], current)
+    history.append(current)
+    with open(args.output, 'w') as f:
+        json.dump(history, f, indent=2)
+    print("Saved results to {fp}".format(fp=args.output))
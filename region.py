@@ -1,21 +1,83 @@
 # Class containing Region object for use with PostGIS helpers
 
-import fiona  # handling ESRI shape format
-from shapely.wkt import loads as loads
-from shapely.geometry import Polygon, box
+# fiona and shapely are imported on first use (see benchmark_import.py)
 import weakref
+import os
 import re
+from simple_log import SimpleLogger
+
+logger = SimpleLogger(module_name="region")
+
+
+def loads(wkt):
+    """
+    Parse WKT string to shapely geometry (shapely.wkt.loads, available for
+    wildcard imports of region/PostGISHelpers)
+    :rtype : shapely geometry
+    """
+    from shapely.wkt import loads as wkt_loads
+    return wkt_loads(wkt)
+
+
+def prep(geom):
+    """
+    Prepare shapely geometry for fast repeated predicates
+    (shapely.prepared.prep)
+    """
+    from shapely.prepared import prep as prepare
+    return prepare(geom)
+
+# Cache of loaded shapefile boundaries, key: (filepath, mtime)
+_boundary_cache = {}
+
+
+def load_boundary_file(filepath):
+    """
+    Load and union all features of an ESRI shape file (including holes and
+    multipolygons). Results are cached by file path and modification time.
+    :rtype : shapely geometry
+    :param filepath: path to ESRI shape file
+    :return: unioned boundary geometry
+    """
+    filepath = os.path.abspath(filepath)
+    key = (filepath, os.path.getmtime(filepath))
+    if key not in _boundary_cache:
+        import fiona  # handling ESRI shape format
+        from shapely.geometry import shape
+        from shapely.ops import unary_union
+
+        with fiona.open(filepath, 'r') as source:
+            geom = unary_union([shape(feature['geometry'])
+                                for feature in source
+                                if feature['geometry']])
+        # Drop entries of outdated versions of the same file
+        for cached_key in [k for k in _boundary_cache if k[0] == filepath]:
+            del _boundary_cache[cached_key]
+        _boundary_cache[key] = geom
+    return _boundary_cache[key]
+
 
 class Region:
     """
     Define region object, instances can be passed to Query() in order to set
     boundaries for queries in a PostGIS-DB
     """
-    instances = {}
+    # Instance collector, entries disappear when instances are garbage
+    # collected
+    instances = weakref.WeakValueDictionary()
 
-    def __init__(self, name=None, boundary=None):
+    def __init__(self, name=None, boundary=None, simplify_tolerance=0.001):
         self.name = name
-        self.__class__.instances[self.name] = weakref.proxy(self)
+        self.__class__.instances[self.name] = self
+        self.simplify_tolerance = simplify_tolerance
+        # Local SpatiaLite extract of the region (see materialize())
+        self.local_extract = None
+        self.extract_source = None
+        self.extract_schema = None
+        self.extract_relations = frozenset()
+        # Boundary (WKT) and SRID the extract was clipped to
+        self.extract_boundary = None
+        self.extract_SRID = None
 
         self.set_boundaries(boundary)
 
@@ -24,40 +86,323 @@ class Region:
         Set boundary bbox
         :return:
         """
+        # DB relation containing the uploaded boundary (see upload_boundary())
+        self.boundary_table = None
+        self.boundary_table_SRID = None
+        # Extracts of the former boundary don't cover the new one
+        self.local_extract = None
+
+        geom = None
         if type(boundary) == str:
-            # WKT-String formatted polygon
-            if boundary.startswith("POLYGON\(\("):
-                self.boundary_polygon = loads(boundary)
-                self.bounds = self.boundary_polygon.bounds
-                # store as wkt in order to maintain consistency
-                self.boundary_polygon = self.boundary_polygon.wkt
+            # WKT-String formatted (multi)polygon
+            if re.match(r"\s*(MULTI)?POLYGON\s*\(", boundary, re.IGNORECASE):
+                geom = loads(boundary)
             # Filepath to ESRI shape file
             elif boundary.endswith(".shp"):
-                with fiona.open(boundary, 'r') as source:
-                    # import as shapely polygon
-                    self.boundary_polygon = Polygon(
-                        next(source)['geometry']['coordinates'][0])
-                self.bounds = self.boundary_polygon.bounds
-                # store as wkt in order to maintain consistency
-                self.boundary_polygon = self.boundary_polygon.wkt
+                geom = load_boundary_file(boundary)
             # Link to database table containing boundary polygon
             # format: [schema].[table]
             elif re.match(r"[a-zA-Z0-9]*[.]*[a-zA-Z0-9]", boundary):
                 self.bounds = boundary
-                self.boundary_polygon = None
             else:
                 # print(
                 #     "Warning: Wrong or unknown input format of boundary, returning NoneValue...")
                 self.bounds = None
-                self.boundary_polygon = None
         # tuple containing bbox, format: (xmin, ymin, xmax, ymax)
         elif type(boundary) == tuple:
-            self.bounds = boundary
-            self.boundary_polygon = box(*boundary)
-            # store as wkt in order to maintain consistency
-            self.boundary_polygon = self.boundary_polygon.wkt
+            from shapely.geometry import box
+            geom = box(*boundary)
         else:
             # print(
             #     "Warning: Wrong or unknown input format of boundary, returning NoneValue...")
             self.bounds = None
+
+        self._set_boundary_geom(geom)
+
+    def _set_boundary_geom(self, geom):
+        """
+        Keep boundary as shapely geometry, prepared geometry (fast repeated
+        predicates) and simplified copy (cheap prefilters)
+        Protected method used by self.set_boundaries()
+        :param geom: shapely geometry or None
+        """
+        self.boundary_geom = geom
+        if geom is None:
             self.boundary_polygon = None
+            self.simplified_boundary = None
+            self._prepare()
+            return
+
+        self.bounds = geom.bounds
+        self.simplified_boundary = geom.simplify(self.simplify_tolerance,
+                                                 preserve_topology=True)
+        self._prepare()
+        # store as wkt in order to maintain consistency
+        self.boundary_polygon = geom.wkt
+
+    def _prepare(self):
+        """
+        Build prepared geometries of the boundary. The simplified copy
+        deviates by at most simplify_tolerance, so shrunk by the tolerance it
+        lies within the boundary (inner_boundary, accepts candidates without
+        testing the exact boundary) and grown by it covers the boundary
+        (outer_boundary, rejects candidates)
+        Protected method used by self._set_boundary_geom() and unpickling
+        """
+        if self.boundary_geom is None:
+            self.prepared_boundary = None
+            self.inner_boundary = None
+            self.outer_boundary = None
+            return
+        self.prepared_boundary = prep(self.boundary_geom)
+        self.inner_boundary = prep(
+            self.simplified_boundary.buffer(-self.simplify_tolerance))
+        self.outer_boundary = prep(
+            self.simplified_boundary.buffer(self.simplify_tolerance))
+
+    def release(self):
+        """
+        Drop boundary geometries and remove instance from Region.instances
+        """
+        self._set_boundary_geom(None)
+        self.bounds = None
+        if Region.instances.get(self.name) is self:
+            del Region.instances[self.name]
+
+    @classmethod
+    def clear_instances(cls):
+        """
+        Release all registered instances and loaded boundary files
+        """
+        for region in list(Region.instances.values()):
+            region.release()
+        Region.instances.clear()
+        _boundary_cache.clear()
+
+    def __getstate__(self):
+        # Prepared geometries can't be pickled (e.g. when passing regions to
+        # worker processes), they are rebuilt on unpickling
+        state = self.__dict__.copy()
+        for key in ('prepared_boundary', 'inner_boundary', 'outer_boundary'):
+            state[key] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._prepare()
+
+    def upload_boundary(self, conn, table, native_SRID=3857, boundary_SRID=4326,
+                        max_vertices=256, temporary=False):
+        """
+        Upload boundary (shapefile or WKT) into a DB table with spatial index.
+        The geometry is transformed once into the native SRID of the OSM data
+        and split into simple parts using ST_Subdivide, so that queries can
+        join against the index instead of transforming the boundary per row.
+        The whole boundary is kept in the same table (column whole = true).
+        Queries of this region use the table from then on, prefiltering
+        features intersecting the parts and selecting those contained in the
+        whole boundary (see PostGISHelpers.Query._region_clause()).
+        :param conn: Open instance of SQLOperations.DBOperations
+        :param table: Name of table to create ([schema].[table], temporary
+        tables can't be schema-qualified), an existing table is replaced
+        :param native_SRID: SRID of the geometry column of queried relations
+        :param boundary_SRID: SRID of the local boundary
+        :param max_vertices: Maximum number of vertices per subdivided part
+        :param temporary: Create temporary table (only visible to conn, so the
+        same connection has to be passed on to Query.fetch_geoms())
+        :return: True if successful
+        :raises ValueError: without local boundary or for schema-qualified
+        temporary tables
+        :raises RuntimeError: if a statement fails (the table is dropped)
+        """
+        if not self.boundary_polygon:
+            raise ValueError("No local boundary to upload")
+        if temporary and '.' in table:
+            raise ValueError("Temporary boundary table '{table}' can't be "
+                             "schema-qualified".format(table=table))
+
+        index_name = table.split('.')[-1] + "_geom_idx"
+        statements = [
+            "DROP TABLE IF EXISTS {table}".format(table=table),
+            "CREATE {temp}TABLE {table} (id serial PRIMARY KEY, "
+            "whole boolean NOT NULL, geom geometry(Geometry, {SRID}))".format(
+                temp="TEMPORARY " if temporary else "",
+                table=table,
+                SRID=native_SRID),
+            "INSERT INTO {table} (whole, geom) SELECT true, ST_Transform("
+            "ST_GeomFromText('{boundary}', {boundary_SRID}), {SRID})".format(
+                table=table,
+                boundary=self.boundary_polygon,
+                boundary_SRID=boundary_SRID,
+                SRID=native_SRID),
+            "INSERT INTO {table} (whole, geom) SELECT false, ST_Subdivide("
+            "geom, {max_vertices:d}) FROM {table} WHERE whole".format(
+                table=table,
+                max_vertices=max_vertices),
+            "CREATE INDEX {index} ON {table} USING gist (geom)".format(
+                index=index_name,
+                table=table),
+            "ANALYZE {table}".format(table=table)]
+
+        for statement in statements:
+            # Failed statements are rolled back by conn
+            if not conn.execute_command(statement):
+                logger.printmessage.error(
+                    "Uploading boundary to {table} failed: {statement}".format(
+                        table=table, statement=statement[:200]))
+                conn.execute_command(
+                    "DROP TABLE IF EXISTS {table}".format(table=table))
+                raise RuntimeError("Uploading boundary to {table} failed".format(
+                    table=table))
+
+        self.boundary_table = table
+        self.boundary_table_SRID = native_SRID
+        # Queries clip against the table from now on, not the extract
+        self.local_extract = None
+        return True
+
+    def materialize(self, source_db, filepath, relation_prefix,
+                    layers=('point', 'line', 'polygon'), schema="public",
+                    geom_col='way', index_cols=('osm_id',), page_size=50000,
+                    SRID=4326):
+        """
+        Pull all OSM layers of the region once into a local SpatiaLite file
+        with spatial and attribute indexes. Queries of this region fetching
+        from source_db run against the local file afterwards (see
+        PostGISHelpers.Query._connect()), as long as they clip to the same
+        boundary and SRID and don't use hstore/jsonb tag operators or select
+        whole tags columns (which are not copied). Geometries are stored in
+        EPSG:SRID, table names equal the source relations. An existing file
+        is replaced, on failure the file is deleted.
+        :param source_db: String containing DB access information
+        :param filepath: Path of SpatiaLite file to create
+        :param relation_prefix: OSM table name prefix (e.g. 'germany')
+        :param layers: Table suffixes to materialize
+        :param schema: DB schema of source relations
+        :param geom_col: Column containing geometries
+        :param index_cols: Columns to create attribute indexes on
+        :param page_size: Rows per page fetched from source
+        :param SRID: Spatial Reference ID the boundary is given in
+        :raises PostGISHelpers.PageFetchError: if a page can't be fetched
+        :raises RuntimeError: if the extract can't be written
+        """
+        from PostGISHelpers import OSMQuery, connect
+        from SQLOperations import SpatiaLiteOperations
+
+        # Do not route the queries below to an older extract
+        self.local_extract = None
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        relations = set()
+
+        try:
+            with connect(source_db) as source, \
+                    SpatiaLiteOperations(filepath, schemas=(schema,)) as local:
+
+                def execute(statement, params=()):
+                    if not local.execute_command(statement, params):
+                        raise RuntimeError(
+                            "Writing extract {path} failed: {statement}".format(
+                                path=filepath, statement=statement[:200]))
+
+                execute("CREATE TABLE materialize_meta (relation TEXT PRIMARY "
+                        "KEY, source TEXT, rows INTEGER, max_osm_id INTEGER, "
+                        "boundary TEXT, srid INTEGER, created TEXT)")
+                for layer in layers:
+                    relation = "{prefix}_{layer}".format(prefix=relation_prefix,
+                                                         layer=layer)
+                    query = OSMQuery(name="Materialize " + relation, region=self)
+                    query.create_where_query(relation=relation, schema=schema,
+                                             select_cols="*", geom_col=geom_col,
+                                             SRID=SRID)
+
+                    rows, max_osm_id, columns = 0, None, None
+                    for page in query.fetch_geoms_paged(source,
+                                                        page_size=page_size):
+                        if columns is None:
+                            columns = list(page[0]['properties'])
+                            execute("CREATE TABLE {t} ({cols})".format(
+                                t=relation,
+                                cols=', '.join('"{c}"'.format(c=c)
+                                               for c in columns)))
+                            execute("SELECT AddGeometryColumn('{t}', '{geom}', "
+                                    "{SRID}, 'GEOMETRY', 'XY')".format(
+                                        t=relation, geom=geom_col, SRID=SRID))
+                        local.cur.executemany(
+                            "INSERT INTO {t} ({cols}, {geom}) VALUES ({params}, "
+                            "GeomFromText(?, {SRID}))".format(
+                                t=relation,
+                                cols=', '.join('"{c}"'.format(c=c)
+                                               for c in columns),
+                                geom=geom_col,
+                                params=', '.join('?' * len(columns)),
+                                SRID=SRID),
+                            [[row['properties'][c] for c in columns] +
+                             [row['geom']] for row in page])
+                        local.commit()
+                        rows += len(page)
+                        # Checkpoint of last page: (max osm_id, row id)
+                        max_osm_id = query.checkpoint[0]
+
+                    if columns is None:
+                        continue
+                    execute("SELECT CreateSpatialIndex('{t}', '{geom}')".format(
+                        t=relation, geom=geom_col))
+                    for col in index_cols:
+                        execute('CREATE INDEX "{t}_{c}_idx" ON {t} ("{c}")'.format(
+                            t=relation, c=col))
+                    execute("INSERT INTO materialize_meta VALUES (?, ?, ?, ?, ?, "
+                            "?, datetime('now'))",
+                            (relation, source_db, rows, max_osm_id,
+                             self.boundary_polygon, SRID))
+                    relations.add(relation)
+        except Exception:
+            logger.printmessage.error(
+                "Materializing region {name} failed, deleting {path}".format(
+                    name=self.name, path=filepath))
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            raise
+
+        self.local_extract = filepath
+        self.extract_relations = frozenset(relations)
+        self.extract_source = source_db
+        self.extract_schema = schema
+        self.extract_boundary = self.boundary_polygon
+        self.extract_SRID = SRID
+
+    def extract_is_stale(self, geom_col='way'):
+        """
+        Compare row counts and maximum osm_id of the local extract with the
+        source DB (cheap heuristic, modified rows are not detected)
+        :rtype : bool
+        :return: True if any materialized relation differs from its source
+        """
+        from PostGISHelpers import OSMQuery
+        from SQLOperations import SpatiaLiteOperations
+
+        with SpatiaLiteOperations(self.local_extract) as local:
+            meta = local.execute_query(
+                "SELECT relation, rows, max_osm_id FROM materialize_meta")
+
+        extract, self.local_extract = self.local_extract, None
+        try:
+            with connect(self.extract_source) as source:
+                for relation, rows, max_osm_id in meta or []:
+                    query = OSMQuery(name="Staleness check", region=self)
+                    query.create_where_query(relation=relation,
+                                             schema=self.extract_schema,
+                                             select_cols=[],
+                                             geom_col=geom_col,
+                                             SRID=self.extract_SRID)
+                    current = source.execute_query(
+                        "SELECT count(*), max({r}.osm_id){from_}{where}".format(
+                            r=query._sql_relation,
+                            from_=query._sql_from,
+                            where=" WHERE " + " AND ".join(query._sql_where)
+                            if query._sql_where else ""))
+                    if not current or tuple(current[0]) != (rows, max_osm_id):
+                        return True
+            return False
+        finally:
+            self.local_extract = extract
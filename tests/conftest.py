@@ -0,0 +1,66 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# Modules of this package live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SQLOperations import SpatiaLiteOperations  # noqa: E402
+
+
+class PlainSQLiteOperations(SpatiaLiteOperations):
+    """
+    SpatiaLiteOperations on plain sqlite3 (without mod_spatialite), geometries
+    are stored as WKT and the ST_ functions used by Query SELECTs pass them
+    through unchanged
+    """
+
+    def __enter__(self):
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.create_function('ST_AsText', 1, lambda geom: geom)
+        self.connection.create_function('ST_Transform', 2,
+                                        lambda geom, SRID: geom)
+        self.cur = self.connection.cursor()
+        return self
+
+
+def create_points(path, rows, table='germany_point'):
+    """
+    Create osm2pgsql-like point table of (osm_id, name, x, y) rows and empty
+    SpatiaLite metadata (no spatial index)
+    """
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS geometry_columns (f_table_name TEXT, "
+        "f_geometry_column TEXT, srid INTEGER, spatial_index_enabled INTEGER)")
+    connection.execute(
+        "CREATE TABLE {table} (osm_id INTEGER, name TEXT, way TEXT)".format(
+            table=table))
+    connection.executemany(
+        "INSERT INTO {table} VALUES (?, ?, ?)".format(table=table),
+        [(osm_id, name, "POINT ({x} {y})".format(x=x, y=y))
+         for osm_id, name, x, y in rows])
+    connection.commit()
+    connection.close()
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """
+    Factory creating a point table in a temporary SQLite file, returns an
+    open PlainSQLiteOperations backend
+    """
+    backends = []
+
+    def factory(rows, table='germany_point'):
+        path = str(tmp_path / "osm.sqlite")
+        create_points(path, rows, table)
+        backend = PlainSQLiteOperations(path).__enter__()
+        backends.append(backend)
+        return backend
+
+    yield factory
+    for backend in backends:
+        backend.__exit__(None, None, None)
@@ -0,0 +1,36 @@
+import collections
+
+import pytest
+
+import PostGISHelpers
+from PostGISHelpers import _cache_lookup, get_backdrop, get_basemap, lsmask_grid
+
+BOUNDS = (12.99, 52.49, 13.03, 52.52)
+
+
+def test_cache_lookup_drops_least_recently_used():
+    cache = collections.OrderedDict()
+    for key in ('a', 'b', 'a', 'c'):
+        _cache_lookup(cache, key, 2, lambda: key.upper())
+    assert list(cache.items()) == [('a', 'A'), ('c', 'C')]
+
+
+def test_backdrop_dir_is_created(tmp_path, monkeypatch):
+    pytest.importorskip("mpl_toolkits.basemap")
+    monkeypatch.setattr(PostGISHelpers, 'BACKDROP_CACHE_SIZE', 1)
+    backdrop_dir = tmp_path / "backdrops" / "berlin"
+
+    image = get_backdrop(BOUNDS, 'c', str(backdrop_dir), width=200)
+    assert image.shape[1] == 200
+    assert len(list(backdrop_dir.glob("backdrop_*.png"))) == 1
+
+    get_backdrop(BOUNDS, 'c', str(backdrop_dir), width=100)
+    assert len(PostGISHelpers._backdrop_cache) == 1
+
+
+def test_lsmask_grid_resolves_map_extent():
+    pytest.importorskip("mpl_toolkits.basemap")
+    # Default grid for regions, finer grids only for small maps
+    assert lsmask_grid(get_basemap((12.0, 52.0, 14.0, 53.0), 'c')) == 5
+    # Basemaps are padded by 0.02 degrees, about 3 arc-minutes wide
+    assert lsmask_grid(get_basemap((13.0, 52.5, 13.01, 52.51), 'c')) == 2.5
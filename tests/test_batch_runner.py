@@ -0,0 +1,82 @@
+import csv
+import json
+
+import pytest
+
+from batch_runner import load_job_file, run
+from conftest import PlainSQLiteOperations, create_points
+from PostGISHelpers import loads
+from SQLOperations import BACKENDS
+
+CONFIG = {"source_db": "user@host:5432/osm",
+          "regions": {"Wustermark": {"boundary": [12.87, 52.50, 13.02, 52.58]}},
+          "jobs": [{"name": "buildings",
+                    "layer": "polygons",
+                    "regions": ["Wustermark"],
+                    "query_features": {"relation": "germany_polygon"}}]}
+
+
+def write_job_file(tmp_path, config):
+    filepath = tmp_path / "jobs.json"
+    filepath.write_text(json.dumps(config))
+    return str(filepath)
+
+
+def test_load_job_file(tmp_path):
+    assert load_job_file(write_job_file(tmp_path, CONFIG)) == CONFIG
+
+
+def test_undefined_region_is_rejected_on_load(tmp_path):
+    config = json.loads(json.dumps(CONFIG))
+    config['jobs'][0]['regions'].append("Wittenberg")
+
+    with pytest.raises(ValueError, match="'buildings'.*'Wittenberg'"):
+        load_job_file(write_job_file(tmp_path, config))
+
+
+class ClippingOperations(PlainSQLiteOperations):
+    """
+    Stand-in evaluating the region clipping functions with shapely
+    """
+
+    def __enter__(self):
+        super().__enter__()
+        self.connection.create_function('ST_GeomFromText', 2,
+                                        lambda wkt, SRID: wkt)
+        self.connection.create_function(
+            'ST_Contains', 2, lambda a, b: loads(a).contains(loads(b)))
+        return self
+
+
+def test_run_jobs(tmp_path, monkeypatch):
+    pytest.importorskip("shapely")
+    pytest.importorskip("fiona")
+    source = str(tmp_path / "osm.sqlite")
+    create_points(source, [(1, "a", 12.9, 52.55), (2, "b", 12.95, 52.52),
+                           (3, "c", 13.5, 52.55)])
+    monkeypatch.setitem(BACKENDS, 'plain', ClippingOperations)
+    output_dir = tmp_path / "Output"
+    config = {"source_db": "plain://" + source,
+              "output_dir": str(output_dir),
+              "regions": {"Wustermark": {"boundary": [12.87, 52.50,
+                                                      13.02, 52.58]},
+                          "Empty": {"boundary": [10.0, 50.0, 10.1, 50.1]}},
+              "jobs": [{"name": "points",
+                        "layer": "points",
+                        "query_features": {"relation": "germany_point",
+                                           "select_cols": ["osm_id", "name"]},
+                        "outputs": ["csv", "shp"]}]}
+
+    reports = {r['region']: r for r in run(config, workers=2, connections=1)}
+    assert [r['error'] for r in reports.values()] == [None, None]
+    assert reports["Wustermark"]['rows'] == 2
+    assert reports["Wustermark"]['files'] == [
+        str(output_dir / "points_Wustermark.csv"),
+        str(output_dir / "points_Wustermark.shp")]
+    with open(reports["Wustermark"]['files'][0]) as f:
+        assert [r['name'] for r in csv.DictReader(f)] == ["a", "b"]
+
+    # Shapefiles of empty results are not written
+    assert reports["Empty"]['rows'] == 0
+    assert reports["Empty"]['files'] == [str(output_dir / "points_Empty.csv")]
+    assert not (output_dir / "points_Empty.shp").exists()
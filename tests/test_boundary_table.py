@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip("shapely")
+
+from PostGISHelpers import OSMPolygons, Region  # noqa: E402
+
+
+class RecordingConnection:
+    def __init__(self, fail_on=None):
+        self.statements = []
+        self.fail_on = fail_on
+
+    def execute_command(self, query):
+        self.statements.append(query)
+        return not (self.fail_on and query.startswith(self.fail_on))
+
+
+@pytest.fixture
+def region():
+    region = Region(name="Uploaded", boundary=(12.87, 52.50, 13.02, 52.58))
+    yield region
+    region.release()
+
+
+def test_boundary_table_keeps_containment(region):
+    conn = RecordingConnection()
+    assert region.upload_boundary(conn, "boundary_wustermark", temporary=True)
+    assert conn.statements[1].startswith("CREATE TEMPORARY TABLE")
+    assert "ST_Subdivide(geom, 256) FROM boundary_wustermark WHERE whole" in \
+        conn.statements[3]
+
+    query = OSMPolygons(name="buildings", region=region)
+    query.create_where_query("germany_polygon", select_cols=["osm_id"])
+    prefilter, contains = query._sql_where
+    assert "NOT clip_relation.whole AND ST_Intersects(" in prefilter
+    assert contains == (
+        "ST_Contains((SELECT clip_boundary.geom FROM boundary_wustermark AS "
+        "clip_boundary WHERE clip_boundary.whole), way)")
+
+
+def test_temporary_boundary_table_without_schema(region):
+    conn = RecordingConnection()
+    with pytest.raises(ValueError, match="schema-qualified"):
+        region.upload_boundary(conn, "public.boundary", temporary=True)
+    assert conn.statements == []
+    assert region.boundary_table is None
+
+
+def test_failed_upload_raises_and_drops_table(region):
+    conn = RecordingConnection(fail_on="CREATE INDEX")
+    with pytest.raises(RuntimeError, match="public.boundary"):
+        region.upload_boundary(conn, "public.boundary")
+    assert conn.statements[-1] == "DROP TABLE IF EXISTS public.boundary"
+    assert region.boundary_table is None
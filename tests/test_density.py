@@ -0,0 +1,59 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("shapely")
+
+from PostGISHelpers import OSMPoints, Region, ResultRow  # noqa: E402
+
+
+def points_query(points):
+    query = OSMPoints(name="density")
+    query.results = [ResultRow({'osm_id': i}, "POINT ({x} {y})".format(x=x, y=y))
+                     for i, (x, y) in enumerate(points)]
+    return query
+
+
+def cell_of(density, x, y):
+    """
+    (row, col) of grid cell containing (x, y) according to stored bounds
+    """
+    xmin, ymin, xmax, ymax = density['bounds']
+    size = density['cell_size']
+    return int((ymax - y) // size), int((x - xmin) // size)
+
+
+def test_grid_bounds_match_binning():
+    # Height of 2.5 cells is rounded up to 3 rows, counted from ymin
+    query = points_query([(2.5, 0.7), (0.5, 2.2), (0.6, 2.4)])
+    grid = query.density_grid(1., bounds=(0., 0., 3., 2.5))
+
+    assert query.density['bounds'] == (0., 0., 3., 3.)
+    assert grid.shape == (3, 3)
+    assert grid[cell_of(query.density, 2.5, 0.7)] == 1
+    assert grid[cell_of(query.density, 0.5, 2.2)] == 2
+    assert grid.sum() == 3
+
+
+def test_grid_bounds_of_region():
+    region = Region(name="Density", boundary=(0., 0., 2., 1.))
+    query = points_query([(0.5, 0.5)])
+    query.region = region
+    grid = query.density_grid(1.)
+    assert grid.tolist() == [[1., 0.]]
+
+    # Boundary in a DB relation: aggregated in the DB, no local bounds
+    region.set_boundaries("deutschland.testwitte")
+    query.results = []
+    with pytest.raises(ValueError, match="pass bounds"):
+        query.density_grid(1., source_db="user@host:5432/db")
+    region.release()
+
+
+def test_render_density(tmp_path):
+    pytest.importorskip("mpl_toolkits.basemap")
+    query = points_query([(13.0, 52.5), (13.01, 52.51), (13.02, 52.505)])
+    query.density_grid(0.01, bounds=(12.99, 52.49, 13.03, 52.52))
+
+    fig = query.render_density(str(tmp_path / "density.png"), resolution='c')
+    assert (tmp_path / "density.png").exists()
+    assert len(fig.axes) == 2
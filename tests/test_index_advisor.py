@@ -0,0 +1,57 @@
+import pytest
+
+pytest.importorskip("shapely")
+
+import IndexAdvisor  # noqa: E402
+from PostGISHelpers import OSMPolygons, Region  # noqa: E402
+
+STYLE = """\
+# OsmType  Tag          DataType     Flags
+node,way   building     text         polygon
+node,way   amenity      text         polygon
+way        area         text         phstore
+"""
+
+
+def write_log(tmp_path, queries):
+    log = tmp_path / "queries.log"
+    log.write_text("".join("DEBUG {sql}\n".format(sql=q._sql_query)
+                           for q in queries))
+    style = tmp_path / "test.style"
+    style.write_text(STYLE)
+    return str(style), str(log)
+
+
+def test_clipped_queries_get_functional_index(tmp_path):
+    region = Region(name="Advisor", boundary=(13.0, 52.5, 13.1, 52.6))
+    queries = []
+    for _ in range(2):
+        query = OSMPolygons(name="buildings", region=region)
+        query.create_where_query("germany_polygon", select_cols=["osm_id"],
+                                 where_cond="building is not null")
+        queries.append(query)
+    region.release()
+
+    recommendations = IndexAdvisor.advise(*write_log(tmp_path, queries))
+    assert [r['sql'] for r in recommendations] == [
+        "CREATE INDEX germany_polygon_way_4326_building_is_not_null_idx ON "
+        "public.germany_polygon USING gist (ST_Transform(way, 4326)) "
+        "WHERE building is not null;",
+        "CREATE INDEX IF NOT EXISTS germany_polygon_way_4326_idx ON "
+        "public.germany_polygon USING gist (ST_Transform(way, 4326));\n"
+        "CLUSTER public.germany_polygon USING germany_polygon_way_4326_idx;"]
+    assert recommendations[0]['queries'] == 2
+
+
+def test_unclipped_queries_use_native_geometry(tmp_path):
+    query = OSMPolygons(name="amenities")
+    query.create_where_query("germany_polygon", select_cols=["osm_id"],
+                             where_cond="amenity = 'school'")
+
+    recommendations = IndexAdvisor.advise(*write_log(tmp_path, [query]))
+    assert [r['sql'] for r in recommendations] == [
+        "CREATE INDEX germany_polygon_amenity_school_idx ON "
+        "public.germany_polygon USING gist (way) WHERE amenity = 'school';",
+        "CREATE INDEX IF NOT EXISTS germany_polygon_way_idx ON "
+        "public.germany_polygon USING gist (way);\n"
+        "CLUSTER public.germany_polygon USING germany_polygon_way_idx;"]
@@ -0,0 +1,168 @@
+import os
+import re
+
+import pytest
+
+pytest.importorskip("shapely")
+
+import SQLOperations  # noqa: E402
+from conftest import PlainSQLiteOperations, create_points  # noqa: E402
+from PostGISHelpers import (OSMPoints, OSMQuery, PageFetchError,  # noqa: E402
+                            Region, uses_tag_operators)
+
+SOURCE = "spatialite://source.sqlite"
+BBOX = (13.0, 52.5, 13.1, 52.6)
+
+
+def materialized(region):
+    # State as left by Region.materialize()
+    region.local_extract = "extract.sqlite"
+    region.extract_source = SOURCE
+    region.extract_schema = "public"
+    region.extract_relations = frozenset(["germany_point"])
+    region.extract_boundary = region.boundary_polygon
+    region.extract_SRID = 4326
+    return region
+
+
+@pytest.fixture
+def region():
+    region = materialized(Region(name="Materialized", boundary=BBOX))
+    yield region
+    region.release()
+
+
+def connected_path(query, source_db=SOURCE):
+    return query._connect(source_db).path
+
+
+def test_materialized_relation_uses_extract(region):
+    query = OSMPoints(name="extract", region=region)
+    query.create_where_query("germany_point", select_cols=["osm_id", "name"],
+                             where_cond="name = 'a->b?'")
+    assert connected_path(query) == "extract.sqlite"
+    assert connected_path(query, None) == "extract.sqlite"
+    assert connected_path(query, "spatialite://other.sqlite") == \
+        "other.sqlite"
+
+
+def test_other_relations_use_source(region):
+    query = OSMPoints(name="source", region=region)
+    query.create_where_query("germany_roads", select_cols=["osm_id"])
+    assert connected_path(query) == "source.sqlite"
+
+
+@pytest.mark.parametrize("features", [
+    {'tag_filters': {'amenity': 'cafe'}},
+    {'tag_cols': ['cuisine']},
+    {'tag_filters': {'amenity': True}, 'tags_type': 'jsonb'}])
+def test_tag_operators_use_source(region, features):
+    query = OSMPoints(name="tags", region=region)
+    query.create_where_query("germany_point", select_cols=["osm_id"],
+                             **features)
+    assert uses_tag_operators(query._sql_query)
+    assert connected_path(query) == "source.sqlite"
+
+
+def test_custom_queries_use_source(region):
+    query = OSMQuery(name="custom", region=region)
+    query.create_where_query("germany_point", select_cols=["osm_id"])
+    query.insert_custom_query("SELECT osm_id FROM germany_point")
+    assert connected_path(query) == "source.sqlite"
+
+
+def test_other_boundaries_use_source(region):
+    query = OSMPoints(name="SRID", region=region)
+    query.create_where_query("germany_point", select_cols=["osm_id"],
+                             SRID=3857)
+    assert connected_path(query) == "source.sqlite"
+
+    # Changing the boundary invalidates the extract
+    region.set_boundaries((12.9, 52.4, 13.2, 52.7))
+    query = OSMPoints(name="larger", region=region)
+    query.create_where_query("germany_point", select_cols=["osm_id"])
+    assert region.local_extract is None
+    assert connected_path(query) == "source.sqlite"
+
+    # Boundaries in DB relations don't exist in the extract
+    materialized(region).set_boundaries("deutschland.testwitte")
+    materialized(region)
+    query = OSMPoints(name="relation", region=region)
+    query.create_where_query("germany_point", select_cols=["osm_id"])
+    assert "clip_relation" in query._sql_query
+    assert connected_path(query) == "source.sqlite"
+
+
+def test_uploaded_boundary_uses_source(region):
+    class Connection:
+        def execute_command(self, query):
+            return True
+
+    region.upload_boundary(Connection(), "boundary")
+    assert region.local_extract is None
+    query = OSMPoints(name="uploaded", region=materialized(region))
+    query.create_where_query("germany_point", select_cols=["osm_id"])
+    assert connected_path(query) == "source.sqlite"
+
+
+class ExtractOperations(PlainSQLiteOperations):
+    """
+    Stand-in for the SpatiaLite functions used by Region.materialize()
+    """
+
+    def __enter__(self):
+        super().__enter__()
+        for name, n_args in (('GeomFromText', 2), ('CreateSpatialIndex', 2),
+                             ('ST_GeomFromText', 2), ('ST_Contains', 2)):
+            self.connection.create_function(name, n_args, lambda *args: 1)
+        return self
+
+    def execute_command(self, query, params=()):
+        match = re.match(r"SELECT AddGeometryColumn\('(\w+)', '(\w+)'", query)
+        if match:
+            query = "ALTER TABLE {0} ADD COLUMN {1}".format(*match.groups())
+        return super().execute_command(query, params)
+
+
+def test_materialize_records_boundary(tmp_path, monkeypatch):
+    source = str(tmp_path / "source.sqlite")
+    create_points(source, [(i, "p", 13.05, 52.55) for i in range(5)])
+    monkeypatch.setattr(SQLOperations, 'SpatiaLiteOperations', ExtractOperations)
+    monkeypatch.setitem(SQLOperations.BACKENDS, 'plain', ExtractOperations)
+    path = str(tmp_path / "extract.sqlite")
+    region = Region(name="Materialize", boundary=BBOX)
+    region.materialize("plain://" + source, path, "germany",
+                       layers=('point',), page_size=2)
+
+    assert region.local_extract == path
+    with ExtractOperations(path) as local:
+        assert local.execute_query(
+            "SELECT relation, rows, max_osm_id, boundary, srid FROM "
+            "materialize_meta") == [("germany_point", 5, 4,
+                                     region.boundary_polygon, 4326)]
+        assert local.table_columns("germany_point") == ["osm_id", "name",
+                                                        "way"]
+    region.release()
+
+
+def test_failed_materialize_deletes_extract(sqlite_db, tmp_path, monkeypatch):
+    conn = sqlite_db([(i, "p", 13.05, 52.55) for i in range(5)])
+    conn.connection.create_function('ST_GeomFromText', 2, lambda wkt, SRID: wkt)
+    conn.connection.create_function('ST_Contains', 2, lambda a, b: 1)
+    execute_query = conn.execute_query
+    calls = []
+
+    def fail_second_page(sql):
+        calls.append(sql)
+        return None if len(calls) == 2 else execute_query(sql)
+
+    conn.execute_query = fail_second_page
+    monkeypatch.setattr(SQLOperations, 'SpatiaLiteOperations', ExtractOperations)
+    path = str(tmp_path / "extract.sqlite")
+    region = Region(name="Failing", boundary=BBOX)
+    with pytest.raises(PageFetchError):
+        region.materialize(conn, path, "germany", layers=('point',),
+                           page_size=2)
+    assert not os.path.exists(path)
+    assert region.local_extract is None
+    region.release()
@@ -0,0 +1,134 @@
+import http.server
+import json
+import threading
+import types
+import urllib.parse
+
+import pytest
+
+pytest.importorskip("shapely")
+
+import OverpassHelpers  # noqa: E402
+from OverpassHelpers import OverpassCollection, OverpassPoints  # noqa: E402
+from PostGISHelpers import Region  # noqa: E402
+
+
+def way(osm_id, coords, **tags):
+    return {'type': 'way', 'id': osm_id, 'tags': tags,
+            'geometry': [{'lon': lon, 'lat': lat} for lon, lat in coords]}
+
+
+SQUARE = [(13.01, 52.51), (13.02, 52.51), (13.02, 52.52), (13.01, 52.51)]
+ELEMENTS = [
+    {'type': 'node', 'id': 1, 'lon': 13.05, 'lat': 52.55,
+     'tags': {'name': "inside"}},
+    {'type': 'node', 'id': 2, 'lon': 13.5, 'lat': 52.55,
+     'tags': {'name': "outside"}},
+    way(3, [(13.01, 52.51), (13.03, 52.52)], highway="residential"),
+    way(4, SQUARE, building="yes", name="house"),
+    # Closed highway ways are lines
+    way(5, SQUARE, highway="pedestrian")]
+
+
+class OverpassStandIn(http.server.BaseHTTPRequestHandler):
+    queries = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.queries.append(urllib.parse.parse_qs(body.decode())['data'][0])
+        response = json.dumps({'elements': ELEMENTS}).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def endpoint():
+    OverpassStandIn.queries = []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), OverpassStandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{port}/api/interpreter".format(
+        port=server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def region():
+    region = Region(name="Overpass", boundary=(13.0, 52.5, 13.1, 52.6))
+    yield region
+    region.release()
+
+
+def test_collection_from_stand_in(endpoint, region):
+    collection = OverpassCollection(name="overpass", region=region,
+                                    endpoint=endpoint)
+    collection.create_collection_query(tags=None)
+    collection.fetch_OSM_collection()
+
+    # Region is sent as polygon filter
+    assert len(OverpassStandIn.queries) == 1
+    assert 'node(poly:"' in OverpassStandIn.queries[0]
+    assert [row['properties'] for row in collection.Points.results] == \
+        [{'osm_id': 1, 'name': "inside"}]
+    assert [row['properties']['osm_id']
+            for row in collection.Lines.results] == [3, 5]
+    assert [row['geom'] for row in collection.Polygons.results] == \
+        ["POLYGON ((13.01 52.51, 13.02 52.51, 13.02 52.52, 13.01 52.51))"]
+
+
+def test_cached_response_is_reused(endpoint, region, tmp_path):
+    cache_dir = str(tmp_path / "overpass")
+    results = []
+    for _ in range(2):
+        query = OverpassPoints(name="cached", region=region,
+                               endpoint=endpoint, cache_dir=cache_dir)
+        query.create_overpass_query(tags=['"name"'])
+        query.fetch_geoms()
+        results.append(query.results)
+
+    assert len(OverpassStandIn.queries) == 1
+    assert results[0] == results[1]
+    assert len(results[0]) == 1
+
+
+class FakeResult:
+    """
+    Minimal overpy.Result with nodes and ways (referencing node ids)
+    """
+
+    def __init__(self, nodes, ways):
+        self.nodes = [types.SimpleNamespace(id=i, lon=lon, lat=lat)
+                      for i, (lon, lat) in nodes.items()]
+        self.ways = [types.SimpleNamespace(id=i, _node_ids=node_ids)
+                     for i, node_ids in ways.items()]
+        self.relations = []
+
+    def expand(self, other):
+        self.nodes.extend(other.nodes)
+
+
+def test_missing_nodes_resolved_per_result(monkeypatch):
+    requests = []
+
+    def fetch_osm(query, api=None):
+        requests.append(query)
+        return FakeResult({3: (13.2, 52.6), 4: (13.3, 52.6)}, {})
+
+    monkeypatch.setattr(OverpassHelpers, 'fetch_osm', fetch_osm)
+    result = FakeResult({1: (13.0, 52.5), 2: (13.1, 52.5)},
+                        {10: [1, 2, 3], 11: [4, 5]})
+    assert OverpassHelpers.resolve_missing_nodes(result) == 3
+    assert requests == ["node(id:3,4,5);out skel;"]
+
+    lines = OverpassHelpers.ways2shapely(result)
+    assert lines[0].wkt == "LINESTRING (13 52.5, 13.1 52.5, 13.2 52.6)"
+    # Node 5 does not exist, one known node is no line
+    assert lines[1] is None
+    # Locations are not kept beyond the result
+    assert OverpassHelpers.ways2shapely(FakeResult({}, {10: [1, 2]})) == [None]
@@ -0,0 +1,89 @@
+import csv
+import io
+
+import pytest
+
+from PostGISHelpers import OSMPoints, PageFetchError
+
+# osm2pgsql repeats osm_ids, e.g. for parts of multipolygons; with
+# page_size=2 the duplicates of 2 and 3 straddle page boundaries
+ROWS = [(1, "a", 13.0, 52.5),
+        (2, "b", 13.1, 52.5),
+        (2, "c", 13.2, 52.5),
+        (3, "d", 13.3, 52.5),
+        (3, "e", 13.4, 52.5)]
+
+
+def points_query():
+    query = OSMPoints(name="pagination")
+    query.create_where_query("germany_point", select_cols=["osm_id", "name"])
+    return query
+
+
+def test_paged_fetch_keeps_duplicate_keys(sqlite_db):
+    conn = sqlite_db(ROWS)
+    query = points_query()
+    query.fetch_geoms(conn, page_size=2)
+
+    assert sorted(row['properties']['name'] for row in query.results) == \
+        ["a", "b", "c", "d", "e"]
+    assert query.results[0]['geom'] == "POINT (13.0 52.5)"
+    assert query.checkpoint[0] == 3
+
+
+def test_resume_from_checkpoint(sqlite_db):
+    conn = sqlite_db(ROWS)
+    query = points_query()
+    pages = query.fetch_geoms_paged(conn, page_size=2)
+    first = next(pages)
+    pages.close()
+
+    rest = [row for page in query.fetch_geoms_paged(
+        conn, page_size=2, resume_from=query.checkpoint) for row in page]
+    assert [row['properties']['name'] for row in first + rest] == \
+        ["a", "b", "c", "d", "e"]
+
+
+def test_paged_csv_writer_keeps_duplicate_keys(sqlite_db):
+    conn = sqlite_db(ROWS)
+    fp = io.StringIO()
+    count = points_query().write_results(fp, fmt='csv', source_db=conn,
+                                         batch_size=2, paged=True, geom=True)
+
+    records = list(csv.DictReader(io.StringIO(fp.getvalue())))
+    assert count == 5
+    assert [r['osm_id'] for r in records] == ["1", "2", "2", "3", "3"]
+    assert records[-1]['geom'] == "POINT (13.4 52.5)"
+
+
+def test_failed_page_raises_with_checkpoint(sqlite_db):
+    conn = sqlite_db(ROWS)
+    execute_query = conn.execute_query
+    calls = []
+
+    def fail_second_page(sql):
+        calls.append(sql)
+        return None if len(calls) == 2 else execute_query(sql)
+
+    conn.execute_query = fail_second_page
+    query = points_query()
+    with pytest.raises(PageFetchError) as error:
+        query.fetch_geoms(conn, page_size=2)
+    assert error.value.checkpoint == query.checkpoint
+    assert error.value.checkpoint[0] == 2
+
+    conn.execute_query = execute_query
+    rest = [row for page in query.fetch_geoms_paged(
+        conn, page_size=2, resume_from=error.value.checkpoint) for row in page]
+    assert [row['properties']['name'] for row in query.results + rest] == \
+        ["a", "b", "c", "d", "e"]
+
+
+def test_unique_key_pages_without_row_id(sqlite_db):
+    conn = sqlite_db([(i, name, x, y) for i, (_, name, x, y)
+                      in enumerate(ROWS)])
+    query = points_query()
+    pages = list(query.fetch_geoms_paged(conn, page_size=2, unique_key=True))
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert query.checkpoint == (4,)
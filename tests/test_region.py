@@ -0,0 +1,34 @@
+import pickle
+
+import pytest
+
+shapely = pytest.importorskip("shapely")
+
+from PostGISHelpers import OSMPoints, Region, ResultRow  # noqa: E402
+
+# Circle with a hole, simplified copy deviates noticeably at tolerance 0.05
+BOUNDARY = shapely.Point(13, 52.5).buffer(1, quad_segs=64).difference(
+    shapely.Point(13, 52.5).buffer(0.2))
+
+
+def test_clip_matches_exact_boundary():
+    region = Region(name="Clip", boundary=BOUNDARY.wkt, simplify_tolerance=0.05)
+    points = [shapely.Point(13 + dx / 50., 52.5 + dy / 50.)
+              for dx in range(-55, 56, 3) for dy in range(-55, 56, 3)]
+    query = OSMPoints(name="clip", region=region)
+    query.results = [ResultRow({'osm_id': i}, point.wkt)
+                     for i, point in enumerate(points)]
+
+    query.clip_view2poly()
+    assert [row['properties']['osm_id'] for row in query.results] == \
+        [i for i, point in enumerate(points) if BOUNDARY.contains(point)]
+    region.release()
+
+
+def test_pickled_region_is_prepared():
+    region = Region(name="Pickled", boundary=(13.0, 52.5, 13.1, 52.6))
+    copy = pickle.loads(pickle.dumps(region))
+
+    for attr in ('prepared_boundary', 'inner_boundary', 'outer_boundary'):
+        assert getattr(copy, attr).contains(shapely.Point(13.05, 52.55))
+    region.release()
@@ -0,0 +1,60 @@
+import pytest
+
+shapely = pytest.importorskip("shapely")
+pytest.importorskip("pyproj")
+
+from PostGISHelpers import OSMCollection, OSMPoints, Region, ResultRow  # noqa: E402
+from Reprojection import to_crs  # noqa: E402
+
+BBOX = (13.0, 52.5, 13.1, 52.6)
+
+
+def fetched(query):
+    query.create_where_query("germany_point", select_cols=["osm_id"])
+    query.results = [ResultRow({'osm_id': 1}, "POINT (13.05 52.55)")]
+    return query
+
+
+def test_copy_is_reprojected():
+    region = Region(name="Reprojected", boundary=BBOX)
+    query = fetched(OSMPoints(name="reprojected", region=region))
+    sql = query._sql_query
+
+    utm = to_crs(query, 25833)
+    assert utm.SRID == 25833
+    assert utm._sql_query is None and utm._sql_where is None
+    assert utm.region.boundary_geom.contains(shapely.from_wkt(
+        utm.results[0]['geom']))
+    # Tolerance of 0.001 degrees is about 100 m
+    assert 50 < utm.region.simplify_tolerance < 150
+    utm.clip_view2poly()
+    assert len(utm.results) == 1
+
+    # Original query is left untouched
+    assert query.SRID == 4326 and query._sql_query == sql
+    assert query.region is region and region.bounds == BBOX
+    assert query.results[0]['geom'] == "POINT (13.05 52.55)"
+    utm.region.release()
+    region.release()
+
+
+def test_db_relation_region_is_dropped():
+    region = Region(name="Relation", boundary="deutschland.testwitte")
+    utm = to_crs(fetched(OSMPoints(name="relation", region=region)), 25833)
+    assert utm.region is not region
+    assert utm.region.bounds is None
+    region.release()
+
+
+def test_collection_layers_share_region():
+    region = Region(name="Collection", boundary=BBOX)
+    collection = OSMCollection(name="collection", region=region, lines=False,
+                               polygons=False)
+    fetched(collection.Points)
+
+    utm = to_crs(collection, 25833)
+    assert utm.Points is not collection.Points
+    assert utm.Points.region is utm.region
+    assert utm.Points._sql_query is None
+    utm.region.release()
+    region.release()
@@ -0,0 +1,88 @@
+import collections.abc
+import copy
+import gc
+import json
+import pickle
+
+import pytest
+
+from PostGISHelpers import OSMPoints, Query, Region, ResultRow
+
+
+def test_dict_style_access():
+    row = ResultRow({'osm_id': 1, 'name': "a"}, "POINT (13 52)")
+
+    assert isinstance(row, collections.abc.Mapping)
+    assert row['geom'] == row.geom == "POINT (13 52)"
+    assert row['properties']['name'] == "a"
+    assert 'geom' in row and 'osm_id' not in row
+    assert list(row) == list(row.keys()) == ['properties', 'geom']
+    assert len(row) == 2
+    assert row.get('tags') is None
+    assert dict(row.items()) == dict(row) == \
+        {'properties': {'osm_id': 1, 'name': "a"}, 'geom': "POINT (13 52)"}
+    assert json.loads(json.dumps(dict(row))) == dict(row)
+    assert row == {'properties': {'osm_id': 1, 'name': "a"},
+                   'geom': "POINT (13 52)"}
+
+    row['geom'] = "POINT (13 53)"
+    assert row.geom == "POINT (13 53)"
+    with pytest.raises(KeyError):
+        row['tags'] = {}
+    with pytest.raises(KeyError):
+        row['tags']
+    # No per-row __dict__ and no mutating mapping methods bypassing the keys
+    assert not hasattr(row, '__dict__')
+    with pytest.raises(AttributeError):
+        row.tags = {}
+    for method in ('update', 'setdefault', 'pop', 'clear'):
+        assert not hasattr(row, method)
+
+
+def test_copy_and_pickle():
+    row = ResultRow({'osm_id': 1}, "POINT (13 52)")
+    for other in (copy.copy(row), pickle.loads(pickle.dumps(row))):
+        assert type(other) is ResultRow
+        assert other == row
+
+
+def test_release_frees_results():
+    query = OSMPoints(name="released")
+    query.results = [ResultRow({'osm_id': 1}, "POINT (13 52)")]
+    query.checkpoint = (1, 0)
+    query.density = {}
+    assert Query.instances["released"] is query
+
+    query.release()
+    assert query.results == [] and query.checkpoint is None
+    assert not hasattr(query, 'density')
+    assert "released" not in Query.instances
+    # Released queries can be reused
+    query.create_where_query("germany_point", select_cols=["osm_id"])
+
+
+def test_clear_instances():
+    pytest.importorskip("shapely")
+    region = Region(name="cleared", boundary=(13.0, 52.5, 13.1, 52.6))
+    queries = [OSMPoints(name="cleared {i}".format(i=i), region=region)
+               for i in range(3)]
+    for query in queries:
+        query.results = [ResultRow({'osm_id': 1}, "POINT (13 52)")]
+
+    Query.clear_instances()
+    Region.clear_instances()
+    assert len(Query.instances) == 0 and len(Region.instances) == 0
+    assert all(query.results == [] for query in queries)
+    assert region.boundary_geom is None and region.prepared_boundary is None
+
+
+def test_registry_drops_collected_instances():
+    pytest.importorskip("shapely")
+    region = Region(name="collected", boundary=(13.0, 52.5, 13.1, 52.6))
+    OSMPoints(name="collected", region=region)
+    gc.collect()
+    assert "collected" not in Query.instances
+    # Queries don't keep their regions registered either
+    del region
+    gc.collect()
+    assert "collected" not in Region.instances
@@ -0,0 +1,68 @@
+import http.server
+import threading
+import urllib.error
+import urllib.parse
+
+import pytest
+
+from WebOSMHelpers import ReverseGeocoder
+
+RESPONSE = ("<reversegeocode><addressparts><city>{lat}</city>"
+            "</addressparts></reversegeocode>")
+
+
+class NominatimStandIn(http.server.BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections alive
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_GET(self):
+        params = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        lat = params['lat'][0]
+        self.requests.append((lat, self.client_address))
+        if lat.startswith('-'):
+            self.send_error(503)
+            return
+        body = RESPONSE.format(lat=lat).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def endpoint():
+    NominatimStandIn.requests = []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                             NominatimStandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{port}/reverse".format(port=server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+def test_connections_reused_across_batches(endpoint):
+    with ReverseGeocoder(endpoint, max_workers=1, rate=None) as geocoder:
+        first = geocoder.reverse_batch([(52.1, 13.0), (52.2, 13.0)])
+        second = geocoder.reverse_batch([(52.3, 13.0), (52.1, 13.0)])
+
+    assert [r['city'] for r in first + second] == \
+        ["52.1000", "52.2000", "52.3000", "52.1000"]
+    # Cached key is not requested again, all requests share one connection
+    assert len(NominatimStandIn.requests) == 3
+    assert len({client for _, client in NominatimStandIn.requests}) == 1
+
+
+def test_failed_requests_raise_and_are_not_cached(endpoint):
+    with ReverseGeocoder(endpoint, max_workers=1, rate=None) as geocoder:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            geocoder.reverse(-52.1, 13.0)
+        assert error.value.code == 503
+        assert not geocoder.cache
+
+        # Connection stays usable after an error response
+        assert geocoder.reverse(52.1, 13.0) == {'city': "52.1000"}
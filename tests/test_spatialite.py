@@ -0,0 +1,99 @@
+import sqlite3
+
+import pytest
+
+from PostGISHelpers import OSMPoints, Region
+from SQLOperations import SpatiaLiteOperations
+
+ROWS = [(i, "name {i}".format(i=i), 13.0 + i / 100., 52.5) for i in range(5)]
+BBOX = (12.99, 52.49, 13.03, 52.51)
+
+
+def spatialite_available():
+    try:
+        connection = sqlite3.connect(":memory:")
+        connection.enable_load_extension(True)
+        connection.load_extension('mod_spatialite')
+        return True
+    except (AttributeError, sqlite3.Error):
+        return False
+
+
+def test_translate_strips_schema():
+    backend = SpatiaLiteOperations("unused.sqlite", schemas=('osm', 'public'))
+    assert backend.translate(
+        "SELECT osm.germany_point.osm_id FROM osm.germany_point") == \
+        "SELECT germany_point.osm_id FROM germany_point"
+
+
+def test_translate_adds_spatial_index_lookup(sqlite_db):
+    pytest.importorskip("shapely")
+    conn = sqlite_db(ROWS)
+    region = Region(name="SpatiaLite", boundary=BBOX)
+    query = OSMPoints(name="translate", region=region)
+    query.create_where_query("germany_point", select_cols=["osm_id"])
+
+    # Without spatial index the query is only stripped of its schema
+    assert conn.translate(query._sql_query) == \
+        query._sql_query.replace("public.", "")
+
+    conn.execute_command("INSERT INTO geometry_columns VALUES (?, ?, ?, ?)",
+                         ("germany_point", "way", 3857, 1))
+    conn._geometry_columns = {}
+    sql = conn.translate(query._sql_query)
+    assert "public." not in sql
+    assert ("ST_Transform(way,4326)) AND germany_point.ROWID IN (SELECT ROWID "
+            "FROM SpatialIndex WHERE f_table_name = 'germany_point' AND "
+            "f_geometry_column = 'way' AND search_frame = ST_Transform("
+            "ST_GeomFromText('{wkt}', 4326), 3857))").format(
+                wkt=region.boundary_polygon) in sql
+    region.release()
+
+
+def test_iter_query_batches(sqlite_db):
+    conn = sqlite_db(ROWS)
+    batches = list(conn.iter_query(
+        "SELECT osm_id, name FROM public.germany_point ORDER BY osm_id", 2))
+
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert conn.columns == ['osm_id', 'name']
+    assert [row[0] for batch in batches for row in batch] == list(range(5))
+
+
+def test_stream_geoms_batches(sqlite_db):
+    conn = sqlite_db(ROWS)
+    query = OSMPoints(name="stream")
+    query.create_where_query("germany_point", select_cols=["osm_id", "name"])
+    batches = list(query.stream_geoms(conn, batch_size=2))
+
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert batches[-1][0]['properties'] == {'osm_id': 4, 'name': "name 4"}
+    assert batches[-1][0]['geom'] == "POINT (13.04 52.5)"
+    assert query.results == []
+
+
+@pytest.mark.skipif(not spatialite_available(),
+                    reason="mod_spatialite not available")
+def test_spatialite_file(tmp_path):
+    pytest.importorskip("shapely")
+    with SpatiaLiteOperations(str(tmp_path / "osm.sqlite")) as conn:
+        conn.execute_command("CREATE TABLE germany_point (osm_id INTEGER)")
+        conn.execute_command("SELECT AddGeometryColumn('germany_point', "
+                             "'way', 3857, 'POINT', 'XY')")
+        for osm_id, _, x, y in ROWS:
+            conn.execute_command(
+                "INSERT INTO germany_point VALUES (?, ST_Transform("
+                "MakePoint(?, ?, 4326), 3857))", (osm_id, x, y))
+        conn.execute_command("SELECT CreateSpatialIndex('germany_point', "
+                             "'way')")
+
+        region = Region(name="SpatiaLite file", boundary=BBOX)
+        query = OSMPoints(name="spatialite", region=region)
+        query.create_where_query("germany_point", select_cols=["osm_id"])
+        assert "SpatialIndex" in conn.translate(query._sql_query)
+        batches = list(query.stream_geoms(conn, batch_size=2))
+        region.release()
+
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert sorted(row['properties']['osm_id'] for batch in batches
+                  for row in batch) == [0, 1, 2]
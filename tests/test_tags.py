@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from PostGISHelpers import OSMPoints, uses_tag_operators
+
+FILTERS = {'amenity': ["school", "kindergarten"], 'building': True,
+           'disused': False, 'levels': 3}
+
+
+def tags_query(tags_type):
+    query = OSMPoints(name="tags")
+    query.create_where_query("germany_point", select_cols=["osm_id"],
+                             tag_filters=FILTERS, tag_cols=["name", "addr:city"],
+                             tags_type=tags_type)
+    return query
+
+
+def test_hstore_conditions():
+    query = tags_query('hstore')
+    assert query._sql_where == [
+        "(tags @> hstore(ARRAY['amenity'], ARRAY['school']) OR "
+        "tags @> hstore(ARRAY['amenity'], ARRAY['kindergarten']))",
+        "NOT tags ? 'disused'",
+        "tags ? 'building'",
+        "tags @> hstore(ARRAY['levels'], ARRAY['3'])"]
+    assert query._sql_select == (
+        "SELECT osm_id, tags -> 'name' AS \"name\", tags -> 'addr:city' AS "
+        "\"addr:city\", ST_AsText(ST_Transform(way,4326))")
+    assert query.select_cols == ["osm_id", "name", "addr:city"]
+    assert uses_tag_operators(query._sql_query)
+
+
+def test_jsonb_conditions_compare_strings():
+    query = tags_query('jsonb')
+    assert query._sql_where[0] == (
+        "(tags @> '{\"amenity\": \"school\"}'::jsonb OR "
+        "tags @> '{\"amenity\": \"kindergarten\"}'::jsonb)")
+    # osm2pgsql stores all tag values as JSON strings
+    contains = query._sql_where[-1]
+    assert contains.endswith("::jsonb")
+    assert json.loads(contains.split("'")[1]) == {'levels': "3"}
+    assert "tags ->> 'addr:city' AS \"addr:city\"" in query._sql_select
+
+
+@pytest.mark.parametrize('tags_type', ['hstore', 'jsonb'])
+def test_values_are_quoted(tags_type):
+    query = OSMPoints(name="quoted")
+    query.create_where_query("germany_point", select_cols=["osm_id"],
+                             tag_filters={'name': "Rock'n'Roll"},
+                             tags_type=tags_type)
+    assert "Rock''n''Roll" in query._sql_where[0]
+    # Operators within literals are no tag operators
+    assert not uses_tag_operators("SELECT 'a -> b ?' FROM t")
+
+
+def test_star_excludes_geometry_and_tags(sqlite_db):
+    conn = sqlite_db([(1, "a", 13.0, 52.5)])
+    conn.execute_command("ALTER TABLE germany_point ADD COLUMN tags TEXT")
+    query = OSMPoints(name="star")
+    query.create_where_query("germany_point")
+    assert "public.germany_point.*" in query._sql_select
+
+    query.fetch_geoms(conn)
+    assert query._sql_select == (
+        'SELECT public.germany_point."osm_id", public.germany_point."name", '
+        'ST_AsText(ST_Transform(way,4326))')
+    assert query.select_cols == ["osm_id", "name"]
+    assert query.results[0]['properties'] == {'osm_id': 1, 'name': "a"}
+    assert query.results[0]['geom'] == "POINT (13.0 52.5)"
@@ -0,0 +1,65 @@
+import os
+import pytest
+
+shapely = pytest.importorskip('shapely')
+fiona = pytest.importorskip('fiona')
+pytest.importorskip('mpl_toolkits.basemap')
+
+from PostGISHelpers import OSMPolygons, ResultRow
+
+BOWTIE = "POLYGON((13 52.5, 13.01 52.51, 13.01 52.5, 13 52.51, 13 52.5))"
+# Ring running out to a spike, make_valid() returns polygon plus line
+SPIKE = ("POLYGON((13.02 52.5, 13.03 52.5, 13.03 52.51, 13.02 52.51, "
+         "13.02 52.505, 13.0 52.505, 13.02 52.505, 13.02 52.5))")
+
+
+@pytest.fixture
+def invalid_polygons():
+    query = OSMPolygons(name="invalid polygons")
+    query.results = [ResultRow({'osm_id': 1}, BOWTIE),
+                     ResultRow({'osm_id': 2}, SPIKE)]
+    return query
+
+
+def test_export_and_render_repaired_polygons(invalid_polygons, tmp_path):
+    results = list(invalid_polygons.results)
+    shp = str(tmp_path / "invalid.shp")
+    invalid_polygons.export2shp(shp)
+
+    # Export repairs copies only
+    assert invalid_polygons.results == results
+    with fiona.open(shp) as source:
+        records = list(source)
+    assert [r['properties']['osm_id'] for r in records] == [1, 2]
+    assert {r['geometry']['type'] for r in records} <= {'Polygon',
+                                                        'MultiPolygon'}
+
+    png = str(tmp_path / "invalid.png")
+    invalid_polygons.render(png, resolution='c')
+    assert os.path.getsize(png) > 0
+
+
+def test_validate_geoms_keeps_polygonal_parts(invalid_polygons, tmp_path):
+    report = invalid_polygons.validate_geoms()
+
+    assert report == {'Self-intersection': 1, 'Ring Self-intersection': 1}
+    assert invalid_polygons.quarantine == []
+    for row in invalid_polygons.results:
+        geom = shapely.from_wkt(row['geom'])
+        assert geom.is_valid
+        assert geom.geom_type in ('Polygon', 'MultiPolygon')
+    # Multi-part results are plotted part by part
+    invalid_polygons.render(str(tmp_path / "repaired.png"), resolution='c')
+
+
+def test_quarantine_rows_without_usable_parts():
+    query = OSMPolygons(name="collapsed polygon")
+    query.results = [ResultRow({'osm_id': 1},
+                               "POLYGON((0 0, 1 1, 0 0, 0 0))")]
+    report = query.validate_geoms()
+
+    # Counted once, by the original error
+    assert sum(report.values()) == 1
+
+    assert query.results == []
+    assert [row['properties']['osm_id'] for row in query.quarantine] == [1]
@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("shapely")
+
+from PostGISHelpers import OSMPoints  # noqa: E402
+from VectorTiles import VectorTileSource  # noqa: E402
+
+
+def test_layer_sql_selects_tag_projections():
+    query = OSMPoints(name="cafes")
+    query.create_where_query("germany_point", select_cols=["osm_id", "name"],
+                             tag_filters={'amenity': 'cafe'},
+                             tag_cols=['cuisine'])
+    sql = VectorTileSource(query)._layer_sql("cafes", query, 12, 2200, 1343)
+
+    assert "SELECT osm_id, name, tags -> 'cuisine' AS \"cuisine\", " \
+           "ST_AsMVTGeom(" in sql
+    assert "tags @> hstore(" in sql
+
+
+def test_layer_sql_of_whole_rows_and_custom_queries():
+    query = OSMPoints(name="points")
+    query.create_where_query("germany_point")
+    source = VectorTileSource(query)
+    assert "SELECT ST_AsMVTGeom(" in source._layer_sql("points", query, 0, 0, 0)
+
+    query.insert_custom_query("SELECT osm_id, way FROM germany_point")
+    sql = source._layer_sql("points", query, 0, 0, 0)
+    assert " WHERE way && ST_Transform(ST_Expand(" in sql